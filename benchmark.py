@@ -0,0 +1,313 @@
+"""Нагрузочный стенд бота без сети.
+
+Основной диалог из main.py получает синтетические обновления, а ответы
+Bot API подменяет локальная заглушка. Перед замером база заполняется
+случайными пользователями и записями. Для каждого сценария выводятся
+p50/p99 задержки обработки обновления и число обновлений в секунду.
+
+Сценарий webhook прогоняет add_group через локальный WebhookServer
+синтетическими POST-запросами, как их присылает Telegram.
+
+Использование:
+    python benchmark.py --users 200 --entries 300 --concurrency 50
+    python benchmark.py --scenarios webhook
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import datetime as dt
+from types import SimpleNamespace
+
+# Стенд работает со своей базой и логом, рабочие файлы бота не затрагиваются
+BENCH_DIR = tempfile.mkdtemp(prefix="bot-bench-")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("BOT_DB_PATH", os.path.join(BENCH_DIR, "bench.db"))
+os.environ.setdefault("BOT_LOG_PATH", os.path.join(BENCH_DIR, "bench.log"))
+os.environ.setdefault("METRICS_PORT", "0")
+
+import asyncio
+import httpx
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+import main
+import handlers
+from config import DEFAULT_TIMEZONE, REMINDER_TIME, UPDATE_CONCURRENCY
+from update_processor import UserLaneUpdateProcessor
+from webhook import WebhookServer
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+SHOWER_WORKS = ["Угловая распашка", "Прямая распашка", "Шторка на ванную", "Фикс в душ", "Трапеция"]
+MIRROR_WORKS = ["Обычное с подсветкой", "Большое с подсветкой", "Навес"]
+SERVICES = ["1 полочка", "2 полочки", "Гидрофобное"]
+STREETS = ["Ленина", "Мира", "Гагарина", "Садовая", "Лесная", "Советская"]
+
+# Сценарии: последовательность сообщений пользователя (после /start)
+SCENARIOS = {
+    "add_group": [
+        "Душевые", "Угловая распашка", "1 полочка", "ул. Ленина, 1", "Пропустить",
+        "Добавить еще работу", "Зеркала", "Навес", "2", "Завершить",
+    ],
+    "report": ["Выгрузить отчет", "Текущий год", "Выгрузить отчет", "Текущий год"],
+    "stats": ["Статистика"],
+    "view_entries": ["Просмотреть работы", "Старее ➡️", "Старее ➡️", "Назад"],
+}
+
+class FakeBotAPI(BaseRequest):
+    """Заглушка Bot API: отвечает успешно на все методы, не выходя в сеть.
+    latency - искусственная задержка ответа, сек."""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self.message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method.startswith("send"):
+            self.message_id += 1
+            chat_id = int(params.get("chat_id", 0))
+            result = {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+            if api_method == "sendDocument":
+                result["document"] = {
+                    "file_id": f"bench-file-{self.message_id}",
+                    "file_unique_id": f"bench-{self.message_id}",
+                }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+def generate_data(database, users: int, entries: int, seed: int = 1) -> list:
+    """Заполнение базы: users пользователей по entries записей за последний год.
+    Все дни недели рабочие, записей за сегодня нет - все попадают в рассылку напоминаний"""
+    rng = random.Random(seed)
+    today = dt.date.today()
+    user_ids = [1000 + i for i in range(users)]
+    for user_id in user_ids:
+        database.subscribe_reminders(str(user_id), user_id)
+        database.save_settings(str(user_id), {"reminders": True, "work_days": list(range(7)), "vacation_mode": False})
+        for _ in range(entries):
+            day = today - dt.timedelta(days=rng.randint(1, 365))
+            works = [f"{rng.choice(SHOWER_WORKS)}, {rng.choice(SERVICES)}"]
+            if rng.random() < 0.5:
+                works.append(f"Зеркало {rng.choice(MIRROR_WORKS)} (x{rng.randint(1, 4)})")
+            database.add_entry(str(user_id), {
+                "date": day.strftime("%d.%m.%Y"),
+                "works": works,
+                "address": f"ул. {rng.choice(STREETS)}, {rng.randint(1, 120)}",
+                "comment": "" if rng.random() < 0.7 else "Синтетическая запись",
+            })
+    return user_ids
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self.update_id = 0
+
+    def payload(self, user_id: int, text: str) -> dict:
+        """Обновление в том виде, в каком его присылает Telegram"""
+        self.update_id += 1
+        data = {
+            "update_id": self.update_id,
+            "message": {
+                "message_id": self.update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "text": text,
+            },
+        }
+        if text.startswith("/"):
+            data["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return data
+
+    def message(self, user_id: int, text: str) -> Update:
+        return Update.de_json(self.payload(user_id, text), self.bot)
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+async def run_scenario(application, factory, name: str, user_ids: list, concurrency: int) -> dict:
+    """Прогон сценария для всех пользователей, не больше concurrency одновременно"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def user_flow(user_id):
+        async with semaphore:
+            for text in ["/start"] + SCENARIOS[name]:
+                update = factory.message(user_id, text)
+                start = time.perf_counter()
+                # Через тот же процессор обновлений, что и в боевом запуске
+                await application.update_processor.process_update(update, application.process_update(update))
+                latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_flow(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    return {
+        "updates": len(latencies),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "updates_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+async def run_reminder_burst(application, api: FakeBotAPI) -> dict:
+    """Рассылка напоминаний в 14:00 по всем подписанным пользователям"""
+    before = api.calls.get("sendMessage", 0)
+    context = SimpleNamespace(
+        bot=application.bot,
+        job=SimpleNamespace(data=(DEFAULT_TIMEZONE, REMINDER_TIME.strftime("%H:%M")))
+    )
+    started = time.perf_counter()
+    await handlers.dispatch_reminders(context)
+    elapsed = time.perf_counter() - started
+    sent = api.calls.get("sendMessage", 0) - before
+    # Задержки отдельных сообщений здесь не измеряются: важны длительность и темп рассылки
+    return {
+        "updates": sent,
+        "p50_ms": None,
+        "p99_ms": None,
+        "total_sec": elapsed,
+        "updates_per_sec": sent / elapsed if elapsed else 0.0,
+    }
+
+async def run_webhook_load(application, factory, user_ids: list, concurrency: int) -> dict:
+    """Сценарий add_group через локальный webhook-сервер: синтетические POST-запросы
+    с секретным токеном. Задержка - время подтверждения запроса, темп - до полной
+    обработки всех обновлений"""
+    secret = "benchmark-secret"
+    settings = {"url": "", "listen": "127.0.0.1", "port": 0, "path": "/telegram",
+                "secret": secret, "workers": 2}
+    server = WebhookServer(application, settings)
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/telegram"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret, "Content-Type": "application/json"}
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    await application.start()
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def user_flow(user_id):
+            async with semaphore:
+                for text in ["/start"] + SCENARIOS["add_group"]:
+                    body = json.dumps(factory.payload(user_id, text)).encode()
+                    start = time.perf_counter()
+                    response = await client.post(url, content=body, headers=headers)
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user_flow(user_id) for user_id in user_ids))
+        await server.queue.join()
+        while application.update_queue.qsize() or application.update_processor.current_concurrent_updates:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+    await server.stop()
+    await application.stop()
+    return {
+        "updates": len(latencies),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "updates_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+def format_row(name: str, result: dict) -> str:
+    def ms(value):
+        return f"{value:>9.2f}" if value is not None else f"{'-':>9}"
+    return (f"{name:<14} {result['updates']:>7} {ms(result['p50_ms'])} {ms(result['p99_ms'])} "
+            f"{result['updates_per_sec']:>9.1f}")
+
+async def run(args) -> dict:
+    print(f"Генерация данных: {args.users} пользователей x {args.entries} записей ({handlers.db.sync.db_name})")
+    started = time.perf_counter()
+    user_ids = generate_data(handlers.db.sync, args.users, args.entries, args.seed)
+    print(f"Данные готовы за {time.perf_counter() - started:.1f} с")
+
+    if args.db_workers:
+        handlers.db.enable_executor(args.db_workers)
+
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    application = Application.builder() \
+        .token(os.environ["TELEGRAM_BOT_TOKEN"]) \
+        .request(api) \
+        .get_updates_request(FakeBotAPI()) \
+        .updater(None) \
+        .job_queue(None) \
+        .concurrent_updates(UserLaneUpdateProcessor(args.update_concurrency)) \
+        .build()
+    main.register_handlers(application, persistent=False)
+
+    results = {}
+    async with application:
+        factory = UpdateFactory(application.bot)
+        for name in args.scenarios:
+            if name == "reminders":
+                results[name] = await run_reminder_burst(application, api)
+            elif name == "webhook":
+                results[name] = await run_webhook_load(application, factory, user_ids, args.concurrency)
+            else:
+                results[name] = await run_scenario(application, factory, name, user_ids, args.concurrency)
+            print(format_row(name, results[name]))
+    handlers.db.shutdown()
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд бота учета работ")
+    parser.add_argument("--users", type=int, default=100, help="число синтетических пользователей")
+    parser.add_argument("--entries", type=int, default=200, help="записей на пользователя")
+    parser.add_argument("--concurrency", type=int, default=20, help="одновременно активных пользователей")
+    parser.add_argument("--update-concurrency", type=int, default=UPDATE_CONCURRENCY,
+                        help="обновлений в обработке одновременно")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--db-workers", type=int, default=2, help="потоков для запросов к БД (0 - в цикле событий)")
+    parser.add_argument("--seed", type=int, default=1)
+    # Напоминания идут первыми: после add_group у всех есть записи за сегодня
+    parser.add_argument("--scenarios", nargs="+", default=["reminders"] + list(SCENARIOS),
+                        choices=list(SCENARIOS) + ["reminders", "webhook"])
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--keep", action="store_true", help="не удалять базу и лог стенда")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"{'сценарий':<14} {'обновл.':>7} {'p50, мс':>9} {'p99, мс':>9} {'в сек.':>9}")
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.keep:
+        print(f"Файлы стенда: {BENCH_DIR}")
+    else:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
@@ -26,6 +26,7 @@ else:
     ADMIN_ID = None
 
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+DEFAULT_TIMEZONE = MOSCOW_TZ.zone
 
 MONTHS_GENITIVE = {
     1: "января", 2: "февраля", 3: "марта", 4: "апреля",
@@ -53,6 +54,9 @@ class States(IntEnum):
     SETTING_WORK_DAYS = 13
     CONFIRM_DELETE_LAST = 14
     CONFIRM_DELETE_ENTRY = 15
+    SELECTING_REPORT_PERIOD = 16
+    REPORT_CUSTOM_PERIOD = 17
+    SETTING_REMINDER_TIME = 18
 
 DEFAULT_SETTINGS = {
     "reminders": True,
@@ -62,11 +66,61 @@ DEFAULT_SETTINGS = {
 
 REMINDER_TIME = time(14, 0)
 
+# Просмотр записей: записей на странице и предельная длина сообщения Telegram
+ENTRIES_PAGE_SIZE = int(os.getenv("ENTRIES_PAGE_SIZE", "5"))
+MESSAGE_MAX_LENGTH = 4096
+
+# Интерфейс на inline-кнопках: настройки, выбор числа, страницы записей и подтверждения
+# меняются правкой одного сообщения вместо отправки новых
+INLINE_UI = os.getenv("INLINE_UI", "0").lower() in ("1", "true", "yes")
+
+# Интервал сохранения данных диалогов в БД, сек. (столько теряется при сбое)
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "10"))
+
+# Локальный эндпоинт метрик в формате Prometheus (порт 0 - отключен)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Сколько обновлений обрабатывается одновременно (обновления одного пользователя - всегда по порядку)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))
+
+# Режим webhook: включается заданием публичного WEBHOOK_URL, иначе - long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))  # задач разбора входящих обновлений
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Несколько процессов-обработчиков: обновления распределяются по хэшу user_id (1 - один процесс)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+LEADER_LOCK_TTL = int(os.getenv("LEADER_LOCK_TTL", "60"))  # сек., срок блокировки лидера без продления
+INVALIDATION_POLL_INTERVAL = float(os.getenv("INVALIDATION_POLL_INTERVAL", "2"))  # сек.
+
+# Число потоков для запросов к БД (0 - выполнять запросы прямо в цикле событий)
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "2"))
+
 # Абсолютные пути к файлам
-LOG_FILE_PATH = os.path.join(BASE_DIR, "bot.log")
+LOG_FILE_PATH = os.getenv("BOT_LOG_PATH", os.path.join(BASE_DIR, "bot.log"))
 DB_FILE_PATH = os.path.join(BASE_DIR, "bot_data.db")
+# База, с которой работает бот (относительный путь - от рабочего каталога, как раньше)
+DB_NAME = os.getenv("BOT_DB_PATH", "bot_data.db")
 PID_FILE_PATH = os.path.join(BASE_DIR, "bot.pid")
 
+# Ротация логов: раз в сутки и дополнительно по размеру файла (0 - только по дням)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+# Очередь записей для потока логирования; при переполнении INFO/DEBUG отбрасываются
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_JSON = os.getenv("LOG_JSON", "0").lower() in ("1", "true", "yes")
+
+# Снимки всей базы (онлайн-бэкап SQLite в сжатые файлы с ротацией)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(BASE_DIR, "snapshots"))
+SNAPSHOT_INTERVAL_HOURS = float(os.getenv("SNAPSHOT_INTERVAL_HOURS", "24"))  # 0 - отключено
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "7"))
+SNAPSHOT_PAGES_PER_STEP = 1024
+
 # Конфигурация логгера
 LOG_CONFIG = {
     "version": 1,
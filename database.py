@@ -1,26 +1,161 @@
 import sqlite3
 import json
+import asyncio
+import functools
 import threading
+import queue
 import logging
 import time
+import zlib
 import re
 import calendar
-from contextlib import closing
-from functools import lru_cache
-from config import DEFAULT_SETTINGS, MOSCOW_TZ, States
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import instrument_methods
+from config import DEFAULT_SETTINGS, DEFAULT_TIMEZONE, MOSCOW_TZ, REMINDER_TIME, States
 
 logger = logging.getLogger(__name__)
 
+def to_iso_date(date_str: str) -> str:
+    """Преобразование даты ДД.ММ.ГГГГ в сортируемый формат ГГГГ-ММ-ДД"""
+    date_str = date_str.strip()
+    # Быстрый путь для канонического формата без вызова strptime
+    day, month, year = date_str[:2], date_str[3:5], date_str[6:]
+    digits = day + month + year
+    if len(date_str) == 10 and date_str[2] == "." and date_str[5] == "." \
+            and digits.isascii() and digits.isdigit():
+        # Несуществующая дата (31.02) - ValueError, как и у strptime
+        dt.date(int(year), int(month), int(day))
+        return f"{year}-{month}-{day}"
+    return dt.datetime.strptime(date_str, "%d.%m.%Y").strftime("%Y-%m-%d")
+
+WORK_QUANTITY_RE = re.compile(r"^(.*) \(x(\d+)\)$")
+
+def parse_work(work: str) -> tuple:
+    """Разбор строки работы на вид работы и количество: 'Зеркало Навес (x2)' -> ('Зеркало Навес', 2)"""
+    match = WORK_QUANTITY_RE.match(work)
+    if match:
+        return match.group(1), int(match.group(2))
+    return work, None
+
+def format_work(name: str, quantity: int = None) -> str:
+    """Обратное преобразование к строке работы"""
+    return name if quantity is None else f"{name} (x{quantity})"
+
+# Строка работы для статистики, собранная из entry_works так же, как format_work
+WORK_LABEL_SQL = "CASE WHEN ew.quantity IS NULL THEN wt.name ELSE wt.name || ' (x' || ew.quantity || ')' END"
+
+def work_category(name: str) -> str:
+    """Категория вида работы для статистики"""
+    lowered = name.lower()
+    if any(keyword in lowered for keyword in ["душ", "распашка", "фикс"]):
+        return "Душевые"
+    if "зеркал" in lowered:
+        return "Зеркала"
+    return "Другие работы"
+
+def _date_range_filter(user_id: str, date_range: tuple = None, alias: str = "") -> tuple:
+    """Условие WHERE по пользователю и периоду (даты ДД.ММ.ГГГГ) с параметрами"""
+    prefix = f"{alias}." if alias else ""
+    condition = f"{prefix}user_id = ?"
+    params = [user_id]
+    if date_range:
+        condition += f" AND {prefix}date_iso BETWEEN ? AND ?"
+        params.extend(to_iso_date(d) for d in date_range)
+    return condition, params
+
+def _copy_settings(settings: dict) -> dict:
+    return {**settings, "work_days": list(settings["work_days"])}
+
+class SettingsCache:
+    """LRU-кэш настроек пользователей.
+
+    Значения копируются при записи и при чтении, поэтому изменение полученного
+    словаря не затрагивает кэш. Инвалидация выполняется по пользователю.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str):
+        with self.lock:
+            settings = self.cache.get(user_id)
+            if settings is None:
+                self.misses += 1
+                return None
+            self.cache.move_to_end(user_id)
+            self.hits += 1
+            return _copy_settings(settings)
+
+    def put(self, user_id: str, settings: dict, only_if_absent: bool = False):
+        with self.lock:
+            # Прочитанное до сохранения значение не должно затереть более новое
+            if only_if_absent and user_id in self.cache:
+                return
+            self.cache[user_id] = _copy_settings(settings)
+            self.cache.move_to_end(user_id)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+    def invalidate(self, user_id: str = None):
+        with self.lock:
+            if user_id is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(user_id, None)
+
 class SQLiteDatabase:
     """Класс для работы с базой данных SQLite с поддержкой многопоточности"""
-    def __init__(self, db_name="bot_data.db"):
+    # Миграции схемы: позиция в кортеже + 1 = номер версии (PRAGMA user_version)
+    MIGRATIONS = (
+        "_migrate_date_iso",
+        "_migrate_incremental_backups",
+        "_migrate_data_versions",
+        "_migrate_entry_works",
+        "_migrate_monthly_stats",
+        "_migrate_reminder_subscriptions",
+        "_migrate_reminder_schedule",
+        "_migrate_persistence",
+        "_migrate_coordination",
+        "_migrate_monthly_stats_semantics",
+    )
+    MIGRATION_BATCH_SIZE = 500
+    # Политика бэкапов: полный снимок после стольких дельт, число хранимых цепочек
+    BACKUP_FULL_EVERY = 30
+    BACKUP_KEEP_FULL = 2
+    # Настройки соединений: WAL позволяет читать параллельно с записью
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -8000",
+        "PRAGMA mmap_size = 67108864",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA busy_timeout = 5000",
+    )
+    STATEMENT_CACHE_SIZE = 256
+
+    def __init__(self, db_name="bot_data.db", max_readers: int = 4, settings_cache_size: int = 1024):
         self.db_name = db_name
+        self.settings_cache = SettingsCache(max_size=settings_cache_size)
+        # Имя процесса для журнала сброса кэшей; None - процесс единственный, журнал не ведется
+        self.invalidation_origin = None
+        # Блокировка единственного пишущего соединения
         self.lock = threading.Lock()
+        self.max_readers = max_readers
+        self._writer_conn = None
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
         self._init_db()
 
     def _init_db(self):
         try:
-            with self.lock, closing(self._get_connection()) as conn:
+            with self._writer() as conn:
                 cursor = conn.cursor()
                 # Таблица записей
                 cursor.execute("""
@@ -56,42 +191,425 @@ class SQLiteDatabase:
                 """)
 
                 # Оптимизированные индексы
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_user_date ON entries(user_id, date)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_entries_user_id ON entries(user_id)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_backups_user_id ON backups(user_id)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_backups_timestamp ON backups(timestamp)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_settings_user_id ON settings(user_id)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_settings_reminders ON settings(reminders)")
-
-                conn.commit()
+            self._apply_migrations()
         except sqlite3.Error as e:
             logger.error(f"Ошибка инициализации БД: {e}")
 
+    def _apply_migrations(self):
+        """Последовательное применение миграций схемы.
+
+        Миграция записывает свой номер в последней транзакции (_set_schema_version),
+        поэтому сбой не оставляет примененную миграцию со старым номером версии.
+        Пакетные переносы данных до этой транзакции при повторе продолжаются
+        без дублей.
+        """
+        with self._reader() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+        for number, name in enumerate(self.MIGRATIONS, 1):
+            if number <= version:
+                continue
+            logger.info(f"Применение миграции БД {number}: {name}")
+            getattr(self, name)(number)
+
+    @staticmethod
+    def _set_schema_version(conn, version: int):
+        # user_version хранится в заголовке файла БД и откатывается вместе с транзакцией
+        conn.execute(f"PRAGMA user_version = {version}")
+
+    def _migrate_date_iso(self, version: int):
+        """Миграция 1: сортируемая ISO-дата для диапазонных запросов"""
+        with self._writer() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            if "date_iso" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN date_iso TEXT")
+            # rowid входит в индекс неявно, поэтому он покрывает и (user_id, date_iso, id)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_user_date_iso ON entries(user_id, date_iso)")
+            conn.execute("DROP INDEX IF EXISTS idx_entries_user_date")
+
+        # Заполняем пачками, чтобы транзакции оставались короткими; запуск бота ждет
+        # окончания переноса, т.к. запросы по датам опираются на date_iso
+        while True:
+            with self._writer() as conn:
+                rows = conn.execute(
+                    "SELECT id, date FROM entries WHERE date_iso IS NULL LIMIT ?",
+                    (self.MIGRATION_BATCH_SIZE,)
+                ).fetchall()
+                if not rows:
+                    self._set_schema_version(conn, version)
+                    break
+
+                updates = []
+                for entry_id, date in rows:
+                    try:
+                        updates.append((to_iso_date(date), entry_id))
+                    except ValueError:
+                        logger.warning(f"Некорректная дата '{date}' в записи {entry_id}")
+                        updates.append(("", entry_id))
+
+                conn.executemany("UPDATE entries SET date_iso = ? WHERE id = ?", updates)
+
+    def _migrate_incremental_backups(self, version: int):
+        """Миграция 2: журнал изменений записей для инкрементальных бэкапов"""
+        with self._writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entry_changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    entry_id INTEGER NOT NULL,
+                    op TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entry_changes_user ON entry_changes(user_id, id)")
+
+            # Изменения фиксируются триггерами, поэтому их не пропустит ни один путь записи
+            for op, event, row in (("I", "INSERT", "NEW"), ("U", "UPDATE", "NEW"), ("D", "DELETE", "OLD")):
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_entries_{event.lower()}
+                    AFTER {event} ON entries
+                    BEGIN
+                        INSERT INTO entry_changes (user_id, entry_id, op)
+                        VALUES ({row}.user_id, {row}.id, '{op}');
+                    END
+                """)
+
+            # Метка последнего сохраненного изменения для каждого пользователя
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS backup_state (
+                    user_id TEXT PRIMARY KEY,
+                    last_change_id INTEGER NOT NULL,
+                    deltas_since_full INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(backups)")}
+            if "backup_type" not in columns:
+                conn.execute("ALTER TABLE backups ADD COLUMN backup_type TEXT NOT NULL DEFAULT 'full'")
+            if "payload" not in columns:
+                conn.execute("ALTER TABLE backups ADD COLUMN payload BLOB")
+            if "last_change_id" not in columns:
+                conn.execute("ALTER TABLE backups ADD COLUMN last_change_id INTEGER")
+
+            # Существующие записи попадут в первый полный бэкап нового формата
+            conn.execute("""
+                INSERT INTO entry_changes (user_id, entry_id, op)
+                SELECT user_id, id, 'I' FROM entries ORDER BY id
+            """)
+            self._set_schema_version(conn, version)
+
+    def _migrate_data_versions(self, version: int):
+        """Миграция 3: версия данных пользователя для кэширования производных артефактов"""
+        with self._writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_data_versions (
+                    user_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+            # Версия увеличивается в той же транзакции, что и любое изменение записей
+            for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_entries_version_{event.lower()}
+                    AFTER {event} ON entries
+                    BEGIN
+                        INSERT INTO user_data_versions (user_id, version)
+                        VALUES ({row}.user_id, 1)
+                        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+                    END
+                """)
+            self._set_schema_version(conn, version)
+
+    def _migrate_entry_works(self, version: int):
+        """Миграция 4: нормализованные работы записей вместо JSON в entries.works.
+
+        После нее источник истины - entry_works: все чтения (записи, отчеты,
+        статистика) идут через нее. entries.works по-прежнему заполняется при
+        вставке только для совместимости: колонка NOT NULL, а версии бота до
+        этой миграции читают работы из нее (откат на старую версию не теряет данных).
+        """
+        with self._writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS work_types (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    category TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entry_works (
+                    entry_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    work_type_id INTEGER NOT NULL,
+                    quantity INTEGER,
+                    PRIMARY KEY (entry_id, position)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entry_works_type ON entry_works(work_type_id)")
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_entries_delete_works
+                AFTER DELETE ON entries
+                BEGIN
+                    DELETE FROM entry_works WHERE entry_id = OLD.id;
+                END
+            """)
+
+        # Переносим существующие записи пачками
+        last_id = 0
+        while True:
+            with self._writer() as conn:
+                rows = conn.execute(
+                    "SELECT id, works FROM entries WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.MIGRATION_BATCH_SIZE)
+                ).fetchall()
+                if not rows:
+                    self._set_schema_version(conn, version)
+                    break
+                for entry_id, works in rows:
+                    try:
+                        self._insert_works(conn, entry_id, json.loads(works))
+                    except (ValueError, TypeError):
+                        logger.warning(f"Некорректный список работ в записи {entry_id}")
+                last_id = rows[-1][0]
+
+    def _migrate_monthly_stats(self, version: int):
+        """Миграция 5: материализованная помесячная статистика пользователей"""
+        with self._writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS monthly_stats (
+                    user_id TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    work TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, month, category, work)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS monthly_totals (
+                    user_id TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    groups INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, month)
+                ) WITHOUT ROWID
+            """)
+            self._rebuild_monthly_stats(conn)
+            self._set_schema_version(conn, version)
+
+    @staticmethod
+    def _rebuild_monthly_stats(conn):
+        """Пересчет помесячной статистики по всем записям.
+
+        Как и до материализации: каждая строка работы считается один раз и
+        группируется целиком, вместе с количеством ('Зеркало Навес (x2)')
+        """
+        conn.execute("DELETE FROM monthly_stats")
+        conn.execute("DELETE FROM monthly_totals")
+        conn.execute(f"""
+            INSERT INTO monthly_stats (user_id, month, category, work, count)
+            SELECT e.user_id, substr(e.date_iso, 1, 7), wt.category, {WORK_LABEL_SQL}, COUNT(*)
+            FROM entries e
+            JOIN entry_works ew ON ew.entry_id = e.id
+            JOIN work_types wt ON wt.id = ew.work_type_id
+            GROUP BY 1, 2, 3, 4
+        """)
+        conn.execute("""
+            INSERT INTO monthly_totals (user_id, month, groups)
+            SELECT user_id, substr(date_iso, 1, 7), COUNT(*)
+            FROM entries
+            GROUP BY 1, 2
+        """)
+
+    def _migrate_reminder_subscriptions(self, version: int):
+        """Миграция 6: подписки на напоминания для пакетной рассылки"""
+        with self._writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reminder_subscriptions (
+                    user_id TEXT PRIMARY KEY,
+                    chat_id INTEGER NOT NULL,
+                    active BOOLEAN NOT NULL DEFAULT 1,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Раньше напоминания заводились по /start; в личных чатах chat_id совпадает с user_id
+            conn.execute("""
+                INSERT OR IGNORE INTO reminder_subscriptions (user_id, chat_id)
+                SELECT user_id, CAST(user_id AS INTEGER) FROM entries
+                UNION
+                SELECT user_id, CAST(user_id AS INTEGER) FROM settings
+            """)
+            self._set_schema_version(conn, version)
+
+    def _migrate_reminder_schedule(self, version: int):
+        """Миграция 7: время и часовой пояс напоминаний для каждого пользователя"""
+        with self._writer() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(reminder_subscriptions)")}
+            if "reminder_time" not in columns:
+                conn.execute(
+                    "ALTER TABLE reminder_subscriptions ADD COLUMN reminder_time TEXT NOT NULL "
+                    f"DEFAULT '{REMINDER_TIME.strftime('%H:%M')}'"
+                )
+            if "timezone" not in columns:
+                conn.execute(
+                    "ALTER TABLE reminder_subscriptions ADD COLUMN timezone TEXT NOT NULL "
+                    f"DEFAULT '{DEFAULT_TIMEZONE}'"
+                )
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_reminder_subscriptions_bucket
+                ON reminder_subscriptions(timezone, reminder_time, active)
+            """)
+            self._set_schema_version(conn, version)
+
+    def _migrate_persistence(self, version: int):
+        """Миграция 8: данные диалогов (user_data, chat_data, состояния) построчно вместо pickle-файла"""
+        with self._writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS persistence (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (kind, key)
+                ) WITHOUT ROWID
+            """)
+            self._set_schema_version(conn, version)
+
+    def _migrate_coordination(self, version: int):
+        """Миграция 9: координация нескольких процессов бота - блокировки лидера и журнал сброса кэшей"""
+        with self._writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leader_locks (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_invalidations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cache TEXT NOT NULL,
+                    key TEXT,
+                    origin TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._set_schema_version(conn, version)
+
+    def _migrate_monthly_stats_semantics(self, version: int):
+        """Миграция 10: пересчет статистики, накопленной миграцией 5 по количествам
+        и по видам работ без '(xN)'"""
+        with self._writer() as conn:
+            self._rebuild_monthly_stats(conn)
+            self._set_schema_version(conn, version)
+
     def _get_connection(self):
-        return sqlite3.connect(self.db_name, isolation_level=None, check_same_thread=False)
+        conn = sqlite3.connect(
+            self.db_name,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.STATEMENT_CACHE_SIZE
+        )
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def _writer(self):
+        """Пишущее соединение: одна транзакция под блокировкой self.lock"""
+        with self.lock:
+            if self._writer_conn is None:
+                self._writer_conn = self._get_connection()
+            conn = self._writer_conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                self._abort_writer(conn)
+                raise
+
+    def _abort_writer(self, conn):
+        """Откат транзакции пишущего соединения (вызывается под self.lock).
+        Соединение, которое не удалось откатить, закрывается: следующая
+        транзакция откроет новое, а не продолжит чужую"""
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка отката транзакции, соединение пересоздается: {e}")
+            conn.close()
+            self._writer_conn = None
+
+    @contextmanager
+    def _reader(self):
+        """Читающее соединение из пула (создается по требованию, не более max_readers)"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_create = self._reader_count < self.max_readers
+                if can_create:
+                    self._reader_count += 1
+            if not can_create:
+                conn = self._readers.get()
+            else:
+                try:
+                    conn = self._get_connection()
+                except BaseException:
+                    with self._pool_lock:
+                        self._reader_count -= 1
+                    raise
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self):
+        """Закрытие всех соединений пула"""
+        with self.lock:
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._pool_lock:
+            self._reader_count = 0
 
-    @lru_cache(maxsize=128)
     def get_settings(self, user_id: str) -> dict:
+        """Настройки пользователя (возвращается копия, ее можно изменять)"""
+        settings = self.settings_cache.get(user_id)
+        if settings is not None:
+            return settings
+
         try:
-            with closing(self._get_connection()) as conn:
+            with self._reader() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT reminders, work_days, vacation_mode FROM settings WHERE user_id = ?",
                     (user_id,)
                 )
                 row = cursor.fetchone()
-                return {
+                settings = {
                     "reminders": bool(row[0]),
                     "work_days": json.loads(row[1]),
                     "vacation_mode": bool(row[2])
-                } if row else DEFAULT_SETTINGS.copy()
+                } if row else _copy_settings(DEFAULT_SETTINGS)
         except Exception as e:
             logger.error(f"Ошибка получения настроек: {e}")
-            return DEFAULT_SETTINGS.copy()
+            return _copy_settings(DEFAULT_SETTINGS)
+
+        self.settings_cache.put(user_id, settings, only_if_absent=True)
+        return settings
 
     def save_settings(self, user_id: str, settings: dict):
         try:
-            with self.lock, closing(self._get_connection()) as conn:
+            with self._writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
@@ -106,48 +624,117 @@ class SQLiteDatabase:
                         int(settings["vacation_mode"])
                     )
                 )
-                conn.commit()
-                self.get_settings.cache_clear()
+                if self.invalidation_origin:
+                    self._publish_invalidation(conn, "settings", user_id)
+            self.settings_cache.put(user_id, settings)
         except sqlite3.Error as e:
             logger.error(f"Ошибка сохранения настроек: {e}")
 
+    def _insert_entry(self, conn, user_id: str, entry: dict) -> int:
+        """Вставка записи в рамках открытой транзакции (id и timestamp сохраняются, если заданы).
+        Работы пишутся в entry_works (источник истины) и копией в entries.works, см. миграцию 4"""
+        cursor = conn.execute(
+            """
+            INSERT INTO entries
+            (id, user_id, date, date_iso, works, address, comment, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """,
+            (
+                entry.get("id"),
+                user_id,
+                entry["date"],
+                to_iso_date(entry["date"]),
+                json.dumps(entry["works"]),
+                entry.get("address", ""),
+                entry.get("comment", ""),
+                entry.get("timestamp")
+            )
+        )
+        works = self._insert_works(conn, cursor.lastrowid, entry["works"])
+        self._update_monthly_stats(conn, user_id, to_iso_date(entry["date"])[:7], works, 1)
+        return cursor.lastrowid
+
+    def _update_monthly_stats(self, conn, user_id: str, month: str, works: list, sign: int):
+        """Изменение помесячной статистики на одну группу работ (sign: 1 - добавление, -1 - удаление).
+        works - [(категория, строка работы, число вхождений)]"""
+        conn.execute(
+            """
+            INSERT INTO monthly_totals (user_id, month, groups) VALUES (?, ?, ?)
+            ON CONFLICT(user_id, month) DO UPDATE SET groups = groups + excluded.groups
+            """,
+            (user_id, month, sign)
+        )
+        conn.executemany(
+            """
+            INSERT INTO monthly_stats (user_id, month, category, work, count) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, month, category, work) DO UPDATE SET count = count + excluded.count
+            """,
+            [(user_id, month, category, work, sign * count) for category, work, count in works]
+        )
+        if sign < 0:
+            conn.execute("DELETE FROM monthly_totals WHERE user_id = ? AND month = ? AND groups <= 0", (user_id, month))
+            conn.execute("DELETE FROM monthly_stats WHERE user_id = ? AND month = ? AND count <= 0", (user_id, month))
+
+    def _work_type_id(self, conn, name: str) -> int:
+        conn.execute(
+            "INSERT OR IGNORE INTO work_types (name, category) VALUES (?, ?)",
+            (name, work_category(name))
+        )
+        return conn.execute("SELECT id FROM work_types WHERE name = ?", (name,)).fetchone()[0]
+
+    def _insert_works(self, conn, entry_id: int, works: list) -> list:
+        """Сохранение работ записи. Возвращает строки для статистики: [(категория, строка работы, 1)]"""
+        rows = []
+        parsed = []
+        for position, work in enumerate(works):
+            name, quantity = parse_work(work)
+            rows.append((entry_id, position, self._work_type_id(conn, name), quantity))
+            parsed.append((work_category(name), format_work(name, quantity), 1))
+        conn.executemany(
+            "INSERT OR REPLACE INTO entry_works (entry_id, position, work_type_id, quantity) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        return parsed
+
+    def _attach_works(self, conn, entries: list) -> list:
+        """Заполнение списков работ для записей одним запросом на порцию id"""
+        by_id = {}
+        for entry in entries:
+            entry["works"] = []
+            by_id[entry["id"]] = entry
+
+        ids = list(by_id)
+        # Ограничение SQLite на число параметров запроса
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(f"""
+                SELECT ew.entry_id, wt.name, ew.quantity
+                FROM entry_works ew
+                JOIN work_types wt ON wt.id = ew.work_type_id
+                WHERE ew.entry_id IN ({placeholders})
+                ORDER BY ew.entry_id, ew.position
+            """, chunk).fetchall()
+            for entry_id, name, quantity in rows:
+                by_id[entry_id]["works"].append(format_work(name, quantity))
+        return entries
+
     def add_entry(self, user_id: str, entry: dict) -> int:
         try:
-            with self.lock, closing(self._get_connection()) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO entries
-                    (user_id, date, works, address, comment)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        user_id,
-                        entry["date"],
-                        json.dumps(entry["works"]),
-                        entry.get("address", ""),
-                        entry.get("comment", "")
-                    )
-                )
-                conn.commit()
-                return cursor.lastrowid
-        except sqlite3.Error as e:
+            with self._writer() as conn:
+                return self._insert_entry(conn, user_id, {**entry, "id": None, "timestamp": None})
+        except (sqlite3.Error, ValueError) as e:
             logger.error(f"Ошибка добавления записи: {e}")
             return None
 
     def get_entries(self, user_id: str, date_range: tuple = None) -> list:
-        """Получение записей пользователя за период"""
+        """Получение записей пользователя за период (даты в формате ДД.ММ.ГГГГ)"""
         try:
-            with closing(self._get_connection()) as conn:
+            with self._reader() as conn:
                 cursor = conn.cursor()
-                query = "SELECT id, date, works, address, comment FROM entries WHERE user_id = ?"
-                params = [user_id]
-
-                if date_range:
-                    query += " AND date BETWEEN ? AND ?"
-                    params.extend(date_range)
-
-                query += " ORDER BY date DESC"
+                condition, params = _date_range_filter(user_id, date_range)
+                query = f"SELECT id, date, address, comment FROM entries WHERE {condition}"
+                query += " ORDER BY date_iso DESC, id DESC"
                 cursor.execute(query, tuple(params))
                 rows = cursor.fetchall()
 
@@ -156,24 +743,148 @@ class SQLiteDatabase:
                     entry = {
                         "id": row[0],
                         "date": row[1],
-                        "works": json.loads(row[2]),
-                        "address": row[3],
-                        "comment": row[4]
+                        "address": row[2],
+                        "comment": row[3]
                     }
                     entries.append(entry)
-                return entries
-        except sqlite3.Error as e:
+                return self._attach_works(conn, entries)
+        except (sqlite3.Error, ValueError) as e:
             logger.error(f"Ошибка получения записей: {e}")
             return []
 
+    def iter_entries(self, user_id: str, date_range: tuple = None, batch_size: int = 500):
+        """Потоковый обход записей по возрастанию даты (порциями, без загрузки всей истории)"""
+        condition, params = _date_range_filter(user_id, date_range)
+        query = f"SELECT id, date, address, comment FROM entries WHERE {condition}"
+        query += " ORDER BY date_iso, id"
+        with self._reader() as conn:
+            cursor = conn.execute(query, tuple(params))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                entries = [
+                    {"id": row[0], "date": row[1], "address": row[2], "comment": row[3]}
+                    for row in rows
+                ]
+                yield from self._attach_works(conn, entries)
+
+    def get_entries_page(self, user_id: str, limit: int, cursor: tuple = None, backward: bool = False) -> tuple:
+        """Страница записей от новых к старым с навигацией по ключу (date_iso, id).
+
+        cursor - ключ последней записи текущей страницы для перехода к более старым
+        записям или, при backward=True, первой записи для перехода к более новым.
+        Запрос идет по индексу (user_id, date_iso) и читает не больше limit + 1 строк
+        независимо от длины истории. Возвращает (записи, есть ли записи дальше в
+        направлении перехода).
+        """
+        try:
+            with self._reader() as conn:
+                query = "SELECT id, date, address, comment, date_iso FROM entries WHERE user_id = ?"
+                params = [user_id]
+                if cursor:
+                    query += " AND (date_iso, id) > (?, ?)" if backward else " AND (date_iso, id) < (?, ?)"
+                    params.extend(cursor)
+                query += " ORDER BY date_iso, id" if backward else " ORDER BY date_iso DESC, id DESC"
+                query += " LIMIT ?"
+                params.append(limit + 1)
+                rows = conn.execute(query, params).fetchall()
+
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+                if backward:
+                    rows.reverse()
+                entries = [
+                    {"id": row[0], "date": row[1], "address": row[2], "comment": row[3], "date_iso": row[4]}
+                    for row in rows
+                ]
+                return self._attach_works(conn, entries), has_more
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения страницы записей: {e}")
+            return [], False
+
+    def get_entry(self, entry_id: int, user_id: str) -> dict:
+        """Запись пользователя по ID или None"""
+        try:
+            with self._reader() as conn:
+                row = conn.execute(
+                    "SELECT id, date, address, comment FROM entries WHERE id = ? AND user_id = ?",
+                    (entry_id, user_id)
+                ).fetchone()
+                if not row:
+                    return None
+                entry = {"id": row[0], "date": row[1], "address": row[2], "comment": row[3]}
+                return self._attach_works(conn, [entry])[0]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения записи: {e}")
+            return None
+
+    def get_report_summary(self, user_id: str, date_range: tuple = None) -> dict:
+        """Сводка для отчета, посчитанная в SQL: по дням, по видам работ и по адресам.
+        Работы считаются как в статистике (_rebuild_monthly_stats): каждая строка
+        работы один раз, вместе с количеством ('Зеркало Навес (x2)')"""
+        condition, params = _date_range_filter(user_id, date_range, alias="e")
+        with self._reader() as conn:
+            works_count = "(SELECT COUNT(*) FROM entry_works ew WHERE ew.entry_id = e.id)"
+            by_day = conn.execute(f"""
+                SELECT MIN(e.date), COUNT(*), SUM({works_count})
+                FROM entries e
+                WHERE {condition}
+                GROUP BY e.date_iso
+                ORDER BY e.date_iso
+            """, params).fetchall()
+
+            by_work = conn.execute(f"""
+                SELECT {WORK_LABEL_SQL}, COUNT(*)
+                FROM entries e
+                JOIN entry_works ew ON ew.entry_id = e.id
+                JOIN work_types wt ON wt.id = ew.work_type_id
+                WHERE {condition}
+                GROUP BY 1
+                ORDER BY 2 DESC, 1
+            """, params).fetchall()
+
+            by_address = conn.execute(f"""
+                SELECT COALESCE(NULLIF(e.address, ''), 'не указан'), COUNT(*), SUM({works_count})
+                FROM entries e
+                WHERE {condition}
+                GROUP BY 1
+                ORDER BY COUNT(*) DESC, 1
+            """, params).fetchall()
+
+        return {"by_day": by_day, "by_work": by_work, "by_address": by_address}
+
+    def get_monthly_stats(self, user_id: str, month: str) -> dict:
+        """Статистика за месяц (ГГГГ-ММ) из материализованной таблицы monthly_stats"""
+        try:
+            with self._reader() as conn:
+                row = conn.execute(
+                    "SELECT groups FROM monthly_totals WHERE user_id = ? AND month = ?",
+                    (user_id, month)
+                ).fetchone()
+                rows = conn.execute(
+                    "SELECT category, work, count FROM monthly_stats WHERE user_id = ? AND month = ?",
+                    (user_id, month)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения статистики: {e}")
+            return {}
+
+        stats = {"total_groups": row[0] if row else 0, "total_works": 0, "categories": {}, "works": {}}
+        for category, work, count in rows:
+            stats["total_works"] += count
+            stats["categories"][category] = stats["categories"].get(category, 0) + count
+            stats["works"][work] = stats["works"].get(work, 0) + count
+        return stats
+
     def get_last_entry(self, user_id: str) -> dict:
         """Получение последней записи пользователя"""
         try:
-            with closing(self._get_connection()) as conn:
+            with self._reader() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
-                    SELECT id, date, works, address, comment
+                    SELECT id, date, address, comment
                     FROM entries
                     WHERE user_id = ?
                     ORDER BY timestamp DESC
@@ -183,13 +894,13 @@ class SQLiteDatabase:
                 )
                 row = cursor.fetchone()
                 if row:
-                    return {
+                    entry = {
                         "id": row[0],
                         "date": row[1],
-                        "works": json.loads(row[2]),
-                        "address": row[3],
-                        "comment": row[4]
+                        "address": row[2],
+                        "comment": row[3]
                     }
+                    return self._attach_works(conn, [entry])[0]
                 return None
         except sqlite3.Error as e:
             logger.error(f"Ошибка получения последней записи: {e}")
@@ -198,22 +909,289 @@ class SQLiteDatabase:
     def delete_entry(self, entry_id: int, user_id: str) -> bool:
         """Удаление записи по ID и user_id (для безопасности)"""
         try:
-            with self.lock, closing(self._get_connection()) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "DELETE FROM entries WHERE id = ? AND user_id = ?",
+            with self._writer() as conn:
+                row = conn.execute(
+                    "SELECT date_iso FROM entries WHERE id = ? AND user_id = ?",
                     (entry_id, user_id)
-                )
-                conn.commit()
-                return cursor.rowcount > 0
+                ).fetchone()
+                if not row:
+                    return False
+
+                works = conn.execute(
+                    f"""
+                    SELECT wt.category, {WORK_LABEL_SQL}, 1
+                    FROM entry_works ew
+                    JOIN work_types wt ON wt.id = ew.work_type_id
+                    WHERE ew.entry_id = ?
+                    """,
+                    (entry_id,)
+                ).fetchall()
+                conn.execute("DELETE FROM entries WHERE id = ? AND user_id = ?", (entry_id, user_id))
+                self._update_monthly_stats(conn, user_id, row[0][:7], works, -1)
+                return True
         except sqlite3.Error as e:
             logger.error(f"Ошибка удаления записи: {e}")
             return False
 
+    def get_data_version(self, user_id: str) -> int:
+        """Версия данных пользователя: меняется при каждом добавлении или удалении записи"""
+        try:
+            with self._reader() as conn:
+                row = conn.execute(
+                    "SELECT version FROM user_data_versions WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                return row[0] if row else 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения версии данных: {e}")
+            return None
+
+    def subscribe_reminders(self, user_id: str, chat_id: int) -> tuple:
+        """Подписка чата на ежедневные напоминания (повторный вызов не создает дублей).
+        Возвращает (часовой пояс, время напоминания)"""
+        try:
+            with self._writer() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO reminder_subscriptions (user_id, chat_id) VALUES (?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET chat_id = excluded.chat_id, active = 1
+                    """,
+                    (user_id, chat_id)
+                )
+                schedule = conn.execute(
+                    "SELECT timezone, reminder_time FROM reminder_subscriptions WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
+                self._publish_reminder_bucket(conn, user_id, *schedule)
+                return schedule
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка подписки на напоминания: {e}")
+            return None
+
+    def get_reminder_schedule(self, user_id: str) -> tuple:
+        """(часовой пояс, время напоминания) пользователя или None"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(
+                    "SELECT timezone, reminder_time FROM reminder_subscriptions WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения расписания напоминаний: {e}")
+            return None
+
+    def set_reminder_schedule(self, user_id: str, chat_id: int, timezone: str, reminder_time: str) -> bool:
+        """Изменение времени (ЧЧ:ММ) и часового пояса напоминаний пользователя"""
+        try:
+            with self._writer() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO reminder_subscriptions (user_id, chat_id, timezone, reminder_time)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        chat_id = excluded.chat_id,
+                        timezone = excluded.timezone,
+                        reminder_time = excluded.reminder_time
+                    """,
+                    (user_id, chat_id, timezone, reminder_time)
+                )
+                self._publish_reminder_bucket(conn, user_id, timezone, reminder_time)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сохранения расписания напоминаний: {e}")
+            return False
+
+    def _publish_reminder_bucket(self, conn, user_id: str, timezone: str, reminder_time: str):
+        """Сообщение остальным процессам о новой группе напоминаний (других активных
+        подписчиков с тем же временем нет): задание рассылки нужно создать сразу"""
+        if not self.invalidation_origin:
+            return
+        other = conn.execute(
+            """
+            SELECT 1 FROM reminder_subscriptions
+            WHERE timezone = ? AND reminder_time = ? AND active = 1 AND user_id != ?
+            LIMIT 1
+            """,
+            (timezone, reminder_time, user_id)
+        ).fetchone()
+        if other is None:
+            self._publish_invalidation(conn, "reminders", f"{timezone} {reminder_time}")
+
+    def get_reminder_buckets(self) -> list:
+        """Все различные пары (часовой пояс, время) активных подписок"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(
+                    "SELECT DISTINCT timezone, reminder_time FROM reminder_subscriptions WHERE active = 1"
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка загрузки расписания напоминаний: {e}")
+            return []
+
+    def has_reminder_subscribers(self, timezone: str, reminder_time: str) -> bool:
+        """Есть ли в группе (часовой пояс, время) активные подписки.
+        При ошибке - True: задание рассылки лучше оставить, чем потерять"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(
+                    """
+                    SELECT 1 FROM reminder_subscriptions
+                    WHERE timezone = ? AND reminder_time = ? AND active = 1
+                    LIMIT 1
+                    """,
+                    (timezone, reminder_time)
+                ).fetchone() is not None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка проверки группы напоминаний: {e}")
+            return True
+
+    def deactivate_reminders(self, chat_id: int):
+        """Отключение рассылки в чат (например, бот заблокирован пользователем)"""
+        try:
+            with self._writer() as conn:
+                conn.execute("UPDATE reminder_subscriptions SET active = 0 WHERE chat_id = ?", (chat_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка отключения напоминаний: {e}")
+
+    def get_reminder_recipients(self, date: str, weekday: int, timezone: str, reminder_time: str) -> list:
+        """Чаты группы (часовой пояс, время) для напоминания одним запросом: напоминания
+        включены, не отпуск, рабочий день и нет записей за дату (ДД.ММ.ГГГГ)"""
+        try:
+            with self._reader() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT r.chat_id
+                    FROM reminder_subscriptions r
+                    LEFT JOIN settings s ON s.user_id = r.user_id
+                    WHERE r.timezone = ? AND r.reminder_time = ? AND r.active = 1
+                      AND COALESCE(s.reminders, 1) = 1
+                      AND COALESCE(s.vacation_mode, 0) = 0
+                      AND EXISTS (
+                          SELECT 1 FROM json_each(COALESCE(s.work_days, ?)) WHERE value = ?
+                      )
+                      AND NOT EXISTS (
+                          SELECT 1 FROM entries e WHERE e.user_id = r.user_id AND e.date_iso = ?
+                      )
+                    """,
+                    (
+                        timezone,
+                        reminder_time,
+                        json.dumps(DEFAULT_SETTINGS["work_days"]),
+                        weekday,
+                        to_iso_date(date)
+                    )
+                ).fetchall()
+                return [row[0] for row in rows]
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Ошибка выборки получателей напоминаний: {e}")
+            return []
+
+    def load_persisted(self, kind: str) -> list:
+        """Все сохраненные строки данных диалогов одного вида: [(ключ, данные)]"""
+        try:
+            with self._reader() as conn:
+                return conn.execute("SELECT key, data FROM persistence WHERE kind = ?", (kind,)).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка загрузки данных диалогов: {e}")
+            return []
+
+    def save_persisted(self, upserts: list, deletes: list) -> bool:
+        """Запись измененных данных диалогов одной транзакцией.
+        upserts - [(вид, ключ, данные)], deletes - [(вид, ключ)]"""
+        try:
+            with self._writer() as conn:
+                conn.executemany(
+                    """
+                    INSERT INTO persistence (kind, key, data) VALUES (?, ?, ?)
+                    ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data
+                    """,
+                    upserts
+                )
+                conn.executemany("DELETE FROM persistence WHERE kind = ? AND key = ?", deletes)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сохранения данных диалогов: {e}")
+            return False
+
+    def acquire_leadership(self, name: str, owner: str, ttl: float) -> bool:
+        """Захват или продление блокировки лидера на ttl секунд.
+        Чужая блокировка перехватывается только после истечения срока"""
+        now = time.time()
+        try:
+            with self._writer() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO leader_locks (name, owner, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE leader_locks.owner = excluded.owner OR leader_locks.expires_at < ?
+                    """,
+                    (name, owner, now + ttl, now)
+                )
+                row = conn.execute("SELECT owner FROM leader_locks WHERE name = ?", (name,)).fetchone()
+                return row is not None and row[0] == owner
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка захвата блокировки лидера {name}: {e}")
+            return False
+
+    def release_leadership(self, name: str, owner: str):
+        try:
+            with self._writer() as conn:
+                conn.execute("DELETE FROM leader_locks WHERE name = ? AND owner = ?", (name, owner))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка освобождения блокировки лидера {name}: {e}")
+
+    def _publish_invalidation(self, conn, cache: str, key: str = None):
+        conn.execute(
+            "INSERT INTO cache_invalidations (cache, key, origin, created_at) VALUES (?, ?, ?, ?)",
+            (cache, key, self.invalidation_origin, time.time())
+        )
+
+    def publish_invalidation(self, cache: str, key: str = None) -> bool:
+        """Сообщение остальным процессам о сбросе кэша (key=None - весь кэш)"""
+        if not self.invalidation_origin:
+            return False
+        try:
+            with self._writer() as conn:
+                self._publish_invalidation(conn, cache, key)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи сброса кэша: {e}")
+            return False
+
+    def get_invalidations(self, after_id: int) -> list:
+        """Сбросы кэшей после after_id: [(id, кэш, ключ, процесс)]"""
+        try:
+            with self._reader() as conn:
+                return conn.execute(
+                    "SELECT id, cache, key, origin FROM cache_invalidations WHERE id > ? ORDER BY id",
+                    (after_id,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения сбросов кэша: {e}")
+            return []
+
+    def get_last_invalidation_id(self) -> int:
+        try:
+            with self._reader() as conn:
+                return conn.execute("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения сбросов кэша: {e}")
+            return 0
+
+    def prune_invalidations(self, max_age: float) -> int:
+        """Удаление сбросов кэша старше max_age секунд"""
+        try:
+            with self._writer() as conn:
+                return conn.execute(
+                    "DELETE FROM cache_invalidations WHERE created_at < ?", (time.time() - max_age,)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка очистки журнала сбросов кэша: {e}")
+            return 0
+
     def get_all_users(self) -> list:
         """Получение списка всех пользователей, у которых есть записи"""
         try:
-            with closing(self._get_connection()) as conn:
+            with self._reader() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT DISTINCT user_id FROM entries")
                 rows = cursor.fetchall()
@@ -222,60 +1200,240 @@ class SQLiteDatabase:
             logger.error(f"Ошибка получения списка пользователей: {e}")
             return []
 
-    def create_backup(self, user_id: str):
-        """Создание бэкапа данных пользователя"""
+    def get_users_with_changes(self) -> list:
+        """Пользователи, у которых есть изменения после последнего бэкапа"""
         try:
-            entries = self.get_entries(user_id)
-            if not entries:
-                logger.info(f"Нет записей для пользователя {user_id} при создании бэкапа")
-                return
+            with self._reader() as conn:
+                rows = conn.execute("""
+                    SELECT DISTINCT c.user_id
+                    FROM entry_changes c
+                    LEFT JOIN backup_state s ON s.user_id = c.user_id
+                    WHERE c.id > COALESCE(s.last_change_id, 0)
+                """).fetchall()
+                return [row[0] for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения пользователей с изменениями: {e}")
+            return []
 
-            backup_data = json.dumps(entries)
-            with self.lock, closing(self._get_connection()) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO backups (user_id, backup_data) VALUES (?, ?)",
-                    (user_id, backup_data)
+    def _fetch_backup_entries(self, conn, user_id: str, entry_ids=None) -> list:
+        """Записи пользователя в формате бэкапа (все или только указанные id)"""
+        query = "SELECT id, date, address, comment, timestamp FROM entries WHERE user_id = ?"
+        if entry_ids is None:
+            rows = conn.execute(query + " ORDER BY id", (user_id,)).fetchall()
+        else:
+            entry_ids = list(entry_ids)
+            rows = []
+            # Ограничение SQLite на число параметров запроса
+            for i in range(0, len(entry_ids), 500):
+                chunk = entry_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(conn.execute(
+                    f"{query} AND id IN ({placeholders})", (user_id, *chunk)
+                ).fetchall())
+
+        return self._attach_works(conn, [
+            {
+                "id": row[0],
+                "date": row[1],
+                "address": row[2],
+                "comment": row[3],
+                "timestamp": row[4]
+            }
+            for row in rows
+        ])
+
+    def create_backup(self, user_id: str) -> bool:
+        """Инкрементальный бэкап: сохраняются только изменения после прошлого бэкапа"""
+        try:
+            with self._reader() as conn:
+                state = conn.execute(
+                    "SELECT last_change_id, deltas_since_full FROM backup_state WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
+                last_change_id = state[0] if state else 0
+                changes = conn.execute(
+                    "SELECT id, entry_id FROM entry_changes WHERE user_id = ? AND id > ? ORDER BY id",
+                    (user_id, last_change_id)
+                ).fetchall()
+                if not changes:
+                    logger.info(f"Нет изменений для пользователя {user_id} при создании бэкапа")
+                    return False
+
+                high_water = changes[-1][0]
+                is_full = state is None or state[1] >= self.BACKUP_FULL_EVERY
+                if is_full:
+                    payload = {"entries": self._fetch_backup_entries(conn, user_id)}
+                else:
+                    changed_ids = {row[1] for row in changes}
+                    upserts = self._fetch_backup_entries(conn, user_id, changed_ids)
+                    alive = {entry["id"] for entry in upserts}
+                    payload = {"upserts": upserts, "deletes": sorted(changed_ids - alive)}
+
+            data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            backup_type = "full" if is_full else "delta"
+
+            with self._writer() as conn:
+                cursor = conn.execute(
+                    """
+                    INSERT INTO backups (user_id, backup_data, backup_type, payload, last_change_id)
+                    VALUES (?, '', ?, ?, ?)
+                    """,
+                    (user_id, backup_type, data, high_water)
                 )
-                conn.commit()
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO backup_state (user_id, last_change_id, deltas_since_full)
+                    VALUES (?, ?, ?)
+                    """,
+                    (user_id, high_water, 0 if is_full else state[1] + 1)
+                )
+                # Учтенные изменения больше не нужны
+                conn.execute(
+                    "DELETE FROM entry_changes WHERE user_id = ? AND id <= ?",
+                    (user_id, high_water)
+                )
+                if is_full:
+                    self._compact_backups(conn, user_id)
+
+            logger.info(f"Бэкап ({backup_type}) для {user_id}: {len(changes)} изменений, {len(data)} байт")
+            return True
         except sqlite3.Error as e:
             logger.error(f"Ошибка создания бэкапа для {user_id}: {e}")
+            return False
 
-class StatsCache:
-    """Кэш статистики с TTL и автоматической очисткой"""
-    def __init__(self, ttl=3600):
-        self.cache = {}
-        self.ttl = ttl  # 1 час
-        self.last_clean = time.time()
+    def _compact_backups(self, conn, user_id: str):
+        """Удаление цепочек бэкапов старше BACKUP_KEEP_FULL последних полных снимков"""
+        row = conn.execute(
+            """
+            SELECT id FROM backups
+            WHERE user_id = ? AND backup_type = 'full'
+            ORDER BY id DESC
+            LIMIT 1 OFFSET ?
+            """,
+            (user_id, self.BACKUP_KEEP_FULL - 1)
+        ).fetchone()
+        if row:
+            conn.execute("DELETE FROM backups WHERE user_id = ? AND id < ?", (user_id, row[0]))
 
-    def get(self, user_id: str, calculate_func):
-        now = time.time()
-        # Автоочистка каждые 10 минут
-        if now - self.last_clean > 600:
-            self.clean_cache()
-            self.last_clean = now
-
-        if user_id in self.cache:
-            cached = self.cache[user_id]
-            if now - cached["timestamp"] < self.ttl:
-                return cached["data"]
-
-        stats = calculate_func(user_id)
-        self.cache[user_id] = {"data": stats, "timestamp": now}
-        return stats
+    def _replay_backups(self, user_id: str) -> list:
+        """Сборка состояния записей: последний полный снимок + последующие дельты"""
+        with self._reader() as conn:
+            full = conn.execute(
+                """
+                SELECT id FROM backups
+                WHERE user_id = ? AND backup_type = 'full'
+                ORDER BY id DESC LIMIT 1
+                """,
+                (user_id,)
+            ).fetchone()
+            if not full:
+                return None
+            rows = conn.execute(
+                """
+                SELECT backup_type, backup_data, payload FROM backups
+                WHERE user_id = ? AND id >= ?
+                ORDER BY id
+                """,
+                (user_id, full[0])
+            ).fetchall()
 
-    def clean_cache(self):
-        now = time.time()
-        expired_users = [
-            user_id for user_id, data in self.cache.items()
-            if now - data["timestamp"] > self.ttl
-        ]
-        for user_id in expired_users:
-            del self.cache[user_id]
+        entries = {}
+        for backup_type, backup_data, payload in rows:
+            if payload is None:
+                # Бэкап старого формата: несжатый JSON-список всех записей
+                data = {"entries": json.loads(backup_data)}
+            else:
+                data = json.loads(zlib.decompress(payload).decode("utf-8"))
 
-    def invalidate(self, user_id: str = None):
-        if user_id:
-            if user_id in self.cache:
-                del self.cache[user_id]
-        else:
-            self.cache.clear()
+            if backup_type == "full":
+                entries = {entry["id"]: entry for entry in data["entries"]}
+            else:
+                for entry_id in data["deletes"]:
+                    entries.pop(entry_id, None)
+                for entry in data["upserts"]:
+                    entries[entry["id"]] = entry
+
+        return [entries[entry_id] for entry_id in sorted(entries)]
+
+    def restore_backup(self, user_id: str) -> int:
+        """Восстановление записей пользователя из цепочки бэкапов. Возвращает число записей"""
+        try:
+            entries = self._replay_backups(user_id)
+            if entries is None:
+                logger.warning(f"Нет бэкапов для восстановления пользователя {user_id}")
+                return None
+
+            with self._writer() as conn:
+                conn.execute("DELETE FROM entries WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM monthly_stats WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM monthly_totals WHERE user_id = ?", (user_id,))
+                for entry in entries:
+                    self._insert_entry(conn, user_id, entry)
+                # Данные совпадают с последним бэкапом: изменения восстановления не сохраняем
+                row = conn.execute(
+                    "SELECT MAX(id) FROM entry_changes WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                if row[0] is not None:
+                    # Без состояния (бэкап старого формата) следующий бэкап будет полным
+                    conn.execute(
+                        """
+                        INSERT INTO backup_state (user_id, last_change_id, deltas_since_full)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET last_change_id = excluded.last_change_id
+                        """,
+                        (user_id, row[0], self.BACKUP_FULL_EVERY)
+                    )
+                    conn.execute("DELETE FROM entry_changes WHERE user_id = ?", (user_id,))
+
+            logger.info(f"Восстановлено {len(entries)} записей пользователя {user_id}")
+            return len(entries)
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            logger.error(f"Ошибка восстановления бэкапа для {user_id}: {e}")
+            return None
+
+# Время каждого публичного метода попадает в гистограмму bot_db_seconds
+instrument_methods(SQLiteDatabase, "bot_db_seconds")
+
+class AsyncSQLiteDatabase:
+    """Асинхронный фасад над SQLiteDatabase с тем же набором методов.
+
+    Пока пул потоков не включен через enable_executor, методы выполняются
+    прямо в цикле событий (как раньше). После включения каждый вызов уходит
+    в выделенный пул потоков и не блокирует обработку обновлений.
+    """
+    def __init__(self, database: SQLiteDatabase, max_workers: int = 0):
+        self.sync = database
+        self.executor = None
+        if max_workers:
+            self.enable_executor(max_workers)
+
+    def enable_executor(self, max_workers: int = 2):
+        """Включение выполнения запросов в отдельных потоках"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+            logger.info(f"Асинхронный доступ к БД: {max_workers} поток(ов)")
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнение блокирующей функции в пуле потоков БД"""
+        if self.executor is None:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        # Кэшируем обертку, чтобы не создавать ее на каждый вызов
+        setattr(self, name, method)
+        return method
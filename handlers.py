@@ -1,22 +1,35 @@
+import asyncio
 import logging
 import os
-import openpyxl
 import re
 import calendar
 import datetime as dt 
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
-from collections import defaultdict
-from io import BytesIO
-from telegram import Update
+import functools
+import warnings
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from telegram import InputFile, Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, CallbackContext
+from telegram.warnings import PTBUserWarning
 from config import *
-from database import SQLiteDatabase, StatsCache
+from database import SQLiteDatabase, AsyncSQLiteDatabase
 from keyboards import *
+from metrics import metrics
+from notifications import RateLimitedSender
+from routing import RoutingTable, normalize, substring_matcher
+from sharding import is_leader
+from reports import build_excel_report, resolve_report_period, parse_custom_period, REPORT_PERIODS, ReportCache
 
 logger = logging.getLogger(__name__)
-db = SQLiteDatabase()
-stats_cache = StatsCache(ttl=1800)  # 30 минут TTL
+db = AsyncSQLiteDatabase(SQLiteDatabase(DB_NAME))
+report_cache = ReportCache(max_entries=512)
+
+metrics.register_callback("bot_cache_hits", lambda: db.sync.settings_cache.hits, cache="settings")
+metrics.register_callback("bot_cache_misses", lambda: db.sync.settings_cache.misses, cache="settings")
+metrics.register_callback("bot_cache_hits", lambda: report_cache.hits, cache="reports")
+metrics.register_callback("bot_cache_misses", lambda: report_cache.misses, cache="reports")
+metrics.register_callback("bot_cache_hits", lambda: keyboard_cache_stats()[0], cache="keyboards")
+metrics.register_callback("bot_cache_misses", lambda: keyboard_cache_stats()[1], cache="keyboards")
 
 # Компактное логирование действий пользователя
 def log_action(user_id: str, action: str, data: dict = None, level: str = "INFO"):
@@ -49,25 +62,6 @@ def get_days_in_month(month, year):
     """Возвращает количество дней в указанном месяце с учетом високосных годов"""
     return calendar.monthrange(year, month)[1]
 
-def generate_day_keyboard(month, year):
-    """Генерирует клавиатуру с числами месяца"""
-    days_count = get_days_in_month(month, year)
-    buttons = [str(i) for i in range(1, days_count + 1)]
-
-    # Разбиваем на ряды по 7 кнопок
-    keyboard = []
-    row = []
-    for day in buttons:
-        row.append(day)
-        if len(row) == 7:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-
-    keyboard.append(["Назад"])
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
 def validate_date(date_str):
     """Проверка корректности формата даты"""
     try:
@@ -89,34 +83,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         # Очищаем временные данные
         context.user_data.clear()
 
-        # Удаляем существующие задания для этого чата (только если job_queue доступен)
+        # Подписка на ежедневные напоминания (рассылка выполняется одним заданием)
         chat_id = update.effective_chat.id
-
-        if context.job_queue:
-            current_jobs = context.job_queue.get_jobs_by_name(str(chat_id))
-
-            # Защита от флуда заданиями
-            if len(current_jobs) > 10:
-                logger.warning(f"Too many jobs for chat {chat_id}, removing oldest")
-                for job in current_jobs[10:]:
-                    job.schedule_removal()
-
-            # Установка напоминаний
-            try:
-                context.job_queue.run_daily(
-                    daily_reminder,
-                    time=REMINDER_TIME,
-                    days=tuple(range(7)),
-                    chat_id=chat_id,
-                    data=user_id,
-                    name=str(chat_id)
-                )
-                context.chat_data['job'] = True
-                logger.info(f"Напоминание установлено для {user_id}")
-            except Exception as e:
-                logger.error(f"Ошибка установки напоминания: {e}")
-        else:
-            logger.warning("Job queue not available during /start command")
+        schedule = await db.subscribe_reminders(user_id, chat_id)
+        job_queue = get_job_queue(context.application)
+        if schedule and job_queue:
+            schedule_reminder_bucket(job_queue, *schedule)
 
         await update.message.reply_text("Привет! Я твой ассистент по учету работ. Выбери категорию:",
                                       reply_markup=main_keyboard())
@@ -126,44 +98,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text("Произошла ошибка при запуске, попробуйте позже")
         return States.SELECTING_WORK
 
+def _category_action(category: str, state: States):
+    """Действие кнопки категории: переход к выбору вида работы"""
+    async def action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        context.user_data["category"] = category
+        group_started = "current_works" in context.user_data
+        await update.message.reply_text(
+            f"Выбери вид работы ({normalize(update.message.text)}):",
+            reply_markup=work_keyboard(category, group_started)
+        )
+        return state
+    return action
+
 async def handle_work_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора категории работы"""
     try:
-        text = update.message.text.strip().lower()
-        user_data = context.user_data
-
-        handlers = {
-            "душевые": ("shower", States.SHOWER_WORK),
-            "зеркала": ("mirror", States.MIRROR_WORK),
-            "другая работа": ("other", States.OTHER_WORK),
-            "выгрузить отчет": generate_excel,
-            "удалить последнюю": delete_last,
-            "просмотреть работы": view_entries,
-            "статистика": show_stats,
-            "⚙️ настройки": settings_menu,
-            "добавить за прошлую дату": handle_past_date
-        }
-
-        # Обработка новой кнопки в категориях
-        if text == "добавить за прошлую дату":
-            category = user_data.get("category")
-            if category:
-                user_data["date_selection_source"] = category
-                await update.message.reply_text("Выбери дату:", reply_markup=date_selection_keyboard())
-                return States.SELECTING_DATE
-
-        matched_handler = next((v for k, v in handlers.items() if k in text), None)
-        if matched_handler:
-            if isinstance(matched_handler, tuple):
-                user_data["category"] = matched_handler[0]
-                group_started = "current_works" in user_data
-                await update.message.reply_text(
-                    f"Выбери вид работы ({text}):",
-                    reply_markup=work_keyboard(matched_handler[0], group_started)
-                )
-                return matched_handler[1]
-            else:
-                return await matched_handler(update, context)
+        action = ROUTES[States.SELECTING_WORK].resolve(update.message.text)
+        if action:
+            return await action(update, context)
 
         await update.message.reply_text("Пожалуйста, выбери вариант из меню", reply_markup=main_keyboard())
         return States.SELECTING_WORK
@@ -186,7 +138,7 @@ async def handle_past_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             return States.SELECTING_WORK
 
         user_data["date_selection_source"] = category
-        await update.message.reply_text("Выбети дату:", reply_markup=date_selection_keyboard())
+        await update.message.reply_text("Выбери дату:", reply_markup=date_selection_keyboard())
         return States.SELECTING_DATE
     except Exception as e:
         logger.error(f"Ошибка при обработке добавления за прошлую дату: {e}", exc_info=True)
@@ -208,12 +160,12 @@ async def handle_work(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         # Основная логика обработки
         user_data = context.user_data
 
-        if text == "Назад":
+        if text == BTN_BACK:
             logger.info(f"USER {user_id}: Выбрана кнопка 'Назад'. Возврат к выбору категории")
             await update.message.reply_text("Выбери категорию:", reply_markup=main_keyboard())
             return States.SELECTING_WORK
 
-        if text == "Добавить за прошлую дату":
+        if text == BTN_PAST_DATE:
             logger.info(f"USER {user_id}: Запрошено добавление работы за прошлую дату")
             user_data["date_selection_source"] = user_data.get("category", "other")
             await update.message.reply_text("Выбери дату:", reply_markup=date_selection_keyboard())
@@ -248,17 +200,17 @@ async def handle_work(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             return States.MIRROR_QUANTITY
 
         else:  # Другие работы
-            if text == "Ввести работу вручную":
+            if text == BTN_MANUAL_WORK:
                 logger.info(f"USER {user_id}: Запрошен ручной ввод работы")
                 user_data["manual_input"] = True
                 await update.message.reply_text(
                     "Введи название работы:",
-                    reply_markup=create_keyboard(["Отмена"], add_back=False)
+                    reply_markup=cancel_keyboard()
                 )
                 return States.OTHER_WORK
 
             # Обработка отмены при ручном вводе
-            if text == "Отмена" and "manual_input" in user_data:
+            if text == BTN_CANCEL and "manual_input" in user_data:
                 logger.info(f"USER {user_id}: Отмена ручного ввода")
                 del user_data["manual_input"]
                 group_started = "current_works" in user_data
@@ -312,7 +264,7 @@ async def handle_additional(update: Update, context: ContextTypes.DEFAULT_TYPE)
         text = update.message.text.strip()
         user_data = context.user_data
 
-        if text == "Назад":
+        if text == BTN_BACK:
             group_started = "current_works" in user_data
             await update.message.reply_text(
                 "Выбери вид работы:", reply_markup=work_keyboard(user_data["category"], group_started)
@@ -320,7 +272,7 @@ async def handle_additional(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return States.SHOWER_WORK if user_data["category"] == "shower" else States.MIRROR_WORK
 
         full_work = user_data["shower_work"]
-        if text != "Пропустить":
+        if text != BTN_SKIP:
             full_work += f", {text}"
 
         if "current_works" not in user_data:
@@ -348,7 +300,7 @@ async def handle_mirror_quantity(update: Update, context: ContextTypes.DEFAULT_T
         text = update.message.text.strip()
         user_data = context.user_data
 
-        if text == "Назад":
+        if text == BTN_BACK:
             group_started = "current_works" in user_data
             await update.message.reply_text(
                 "Выбери вид работы с зеркалом:", reply_markup=work_keyboard("mirror", group_started)
@@ -356,7 +308,7 @@ async def handle_mirror_quantity(update: Update, context: ContextTypes.DEFAULT_T
             return States.MIRROR_WORK
 
         work_name = user_data["mirror_work_base"]
-        if text != "Пропустить":
+        if text != BTN_SKIP:
             try:
                 quantity = int(text)
                 work_name = f"{work_name} (x{quantity})"
@@ -387,7 +339,7 @@ async def request_address(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Запрос адреса"""
     try:
         await update.message.reply_text(
-            "📬 Введи адрес (или 'Пропустить'):", reply_markup=create_keyboard(["Пропустить"], add_back=False)
+            "📬 Введи адрес (или 'Пропустить'):", reply_markup=skip_keyboard()
         )
         return States.ADD_ADDRESS
     except Exception as e:
@@ -399,10 +351,10 @@ async def handle_address(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Обработка адреса"""
     try:
         user_data = context.user_data
-        user_data["address"] = "" if update.message.text.strip().lower() == "пропустить" else update.message.text.strip()
+        user_data["address"] = "" if normalize(update.message.text) == normalize(BTN_SKIP) else update.message.text.strip()
 
         await update.message.reply_text(
-            "💬 Введи комментарий (или 'Пропустить'):", reply_markup=create_keyboard(["Пропустить"], add_back=False)
+            "💬 Введи комментарий (или 'Пропустить'):", reply_markup=skip_keyboard()
         )
         return States.ADD_COMMENT
     except Exception as e:
@@ -414,7 +366,7 @@ async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Обработка комментария"""
     try:
         user_data = context.user_data
-        user_data["comment"] = "" if update.message.text.strip().lower() == "пропустить" else update.message.text.strip()
+        user_data["comment"] = "" if normalize(update.message.text) == normalize(BTN_SKIP) else update.message.text.strip()
 
         selected_date = user_data.get("selected_date", dt.datetime.now(MOSCOW_TZ).strftime("%d.%m.%Y"))
         address = user_data.get("address", "")
@@ -434,288 +386,340 @@ async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("Произошла ошибка, попробуйте снова", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
+async def _save_work_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Кнопка «Завершить»: сохранение группы работ"""
+    user_data = context.user_data
+    user_id = str(update.message.from_user.id)
+    new_entry = {
+        "date": user_data.get("selected_date", dt.datetime.now(MOSCOW_TZ).strftime("%d.%m.%Y")),
+        "works": user_data["current_works"].copy(),
+        "comment": user_data.get("comment", ""),
+        "address": user_data.get("address", "")
+    }
+
+    # Сохраняем в базе данных
+    entry_id = await db.add_entry(user_id, new_entry)
+    if not entry_id:
+        await update.message.reply_text("❌ Ошибка при сохранении группы работ", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
+
+    # Формируем ответ с перечислением всех работ
+    works_list = "\n".join([f"- {work}" for work in user_data["current_works"]])
+    await update.message.reply_text(
+        f"✅ Группа работ сохранена!\nДата: {new_entry['date']}\n"
+        f"Адрес: {new_entry['address'] or 'не указан'}\n"
+        f"Комментарий: {new_entry['comment'] or 'нет'}\n"
+        f"Работы:\n{works_list}",
+        reply_markup=main_keyboard()
+    )
+
+    # Полная очистка временных данных
+    keys_to_remove = [
+        "selected_date", "current_works", "address", "comment",
+        "category", "shower_work", "mirror_work_base", "manual_input",
+        "date_month_year"
+    ]
+    for key in keys_to_remove:
+        if key in user_data:
+            del user_data[key]
+    return States.SELECTING_WORK
+
+async def _add_more_work(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Кнопка «Добавить еще работу»"""
+    # Очищаем только данные конкретной работы
+    for key in ["shower_work", "additional_service", "mirror_work_base", "manual_input"]:
+        if key in context.user_data:
+            del context.user_data[key]
+
+    await update.message.reply_text("Выбери категорию для следующей работы:", reply_markup=main_keyboard())
+    return States.SELECTING_WORK
+
 async def handle_add_more(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка добавления дополнительных работ"""
     try:
-        text = update.message.text.strip()
-        user_data = context.user_data
-        user_id = str(update.message.from_user.id)
+        action = ROUTES[States.ADD_MORE_WORK].resolve(update.message.text)
+        if action:
+            return await action(update, context)
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении дополнительных работ: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка, попробуйте снова", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
 
-        if text == "Завершить":
-            new_entry = {
-                "date": user_data.get("selected_date", dt.datetime.now(MOSCOW_TZ).strftime("%d.%m.%Y")),
-                "works": user_data["current_works"].copy(),
-                "comment": user_data.get("comment", ""),
-                "address": user_data.get("address", "")
-            }
+async def _send_day_picker(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, month: int, year: int):
+    """Клавиатура с числами месяца (inline-сетка в режиме INLINE_UI)"""
+    if INLINE_UI:
+        await _send_inline(update.message, context, text, day_inline_keyboard(month, year))
+    else:
+        await update.message.reply_text(text, reply_markup=generate_day_keyboard(month, year))
+    context.user_data["date_month_year"] = (month, year)
+
+async def _continue_with_date(message, user_data: dict, selected_date: str) -> int:
+    """Переход к выбору работы после выбора даты"""
+    user_data["selected_date"] = selected_date
+    source = user_data.get("date_selection_source", "other")
+    group_started = "current_works" in user_data
+
+    if source == "shower":
+        await message.reply_text(
+            f"📅 Выбрана дата: {selected_date}. Теперь выбери вид душевой:",
+            reply_markup=work_keyboard("shower", group_started)
+        )
+        return States.SHOWER_WORK
 
-            # Сохраняем в базе данных
-            entry_id = db.add_entry(user_id, new_entry)
-            if entry_id:
-                # Формируем ответ с перечислением всех работ
-                works_list = "\n".join([f"- {work}" for work in user_data["current_works"]])
-                await update.message.reply_text(
-                    f"✅ Группа работ сохранена!\nДата: {new_entry['date']}\n"
-                    f"Адрес: {new_entry['address'] or 'не указан'}\n"
-                    f"Комментарий: {new_entry['comment'] or 'нет'}\n"
-                    f"Работы:\n{works_list}",
-                    reply_markup=main_keyboard()
-                )
+    if source == "mirror":
+        await message.reply_text(
+            f"📅 Выбрана дата: {selected_date}. Теперь выбери вид работы с зеркалом:",
+            reply_markup=work_keyboard("mirror", group_started)
+        )
+        return States.MIRROR_WORK
 
-                # Полная очистка временных данных
-                keys_to_remove = [
-                    "selected_date", "current_works", "address", "comment",
-                    "category", "shower_work", "mirror_work_base", "manual_input",
-                    "date_month_year"
-                ]
-                for key in keys_to_remove:
-                    if key in user_data:
-                        del user_data[key]
-
-                # Инвалидация кэша статистики
-                stats_cache.invalidate(user_id)
-                return States.SELECTING_WORK
-            else:
-                await update.message.reply_text("❌ Ошибка при сохранении группы работ", reply_markup=main_keyboard())
-                return States.SELECTING_WORK
+    await message.reply_text(
+        f"📅 Выбрана дата: {selected_date}. Теперь выбери вид работы:",
+        reply_markup=main_keyboard()
+    )
+    return States.SELECTING_WORK
+
+def _relative_date_action(days_ago: int):
+    """Действие кнопок «Сегодня»/«Вчера»/«Позавчера»"""
+    async def action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        selected_date = (dt.datetime.now(MOSCOW_TZ) - dt.timedelta(days=days_ago)).strftime("%d.%m.%Y")
+        return await _continue_with_date(update.message, context.user_data, selected_date)
+    return action
+
+async def _pick_current_month(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    now = dt.datetime.now(MOSCOW_TZ)
+    await _send_day_picker(update, context, "Выбери число текущего месяца:", now.month, now.year)
+    return States.SELECTING_DATE
+
+async def _pick_previous_month(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    now = dt.datetime.now(MOSCOW_TZ)
+    # Вычисляем предыдущий месяц
+    if now.month == 1:
+        prev_month = 12
+        prev_year = now.year - 1
+    else:
+        prev_month = now.month - 1
+        prev_year = now.year
 
-        elif text == "Добавить еще работу":
-            # Очищаем только данные конкретной работы
-            for key in ["shower_work", "additional_service", "mirror_work_base", "manual_input"]:
-                if key in user_data:
-                    del user_data[key]
+    await _send_day_picker(update, context, "Выбери число предыдущего месяца:", prev_month, prev_year)
+    return States.SELECTING_DATE
 
-            await update.message.reply_text("Выбери категорию для следующей работы:", reply_markup=main_keyboard())
-            return States.SELECTING_WORK
+async def _back_to_date_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    # Возвращаемся к выбору даты
+    await update.message.reply_text("Выбери дату:", reply_markup=date_selection_keyboard())
+    return States.SELECTING_DATE
 
-    except Exception as e:
-        logger.error(f"Ошибка при добавлении дополнительных работ: {e}", exc_info=True)
-        await update.message.reply_text("Произошла ошибка, попробуйте снова", reply_markup=main_keyboard())
-        return States.SELECTING_WORK
+async def _cancel_date_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text("Действие отменено", reply_markup=main_keyboard())
+    return States.SELECTING_WORK
 
 async def handle_date_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Обработка выбора даты"""
+    """Обработка выбора даты: кнопки меню или число месяца/дата, введенные вручную"""
     try:
+        action = ROUTES[States.SELECTING_DATE].resolve(update.message.text)
+        if action:
+            return await action(update, context)
+
         text = update.message.text.strip()
         user_data = context.user_data
         now = dt.datetime.now(MOSCOW_TZ)
 
-        if text == "Отмена":
-            await update.message.reply_text("Действие отменено", reply_markup=main_keyboard())
-            return States.SELECTING_WORK
-
-        selected_date = None
-        if text == "Сегодня":
-            selected_date = now.strftime("%d.%m.%Y")
-        elif text == "Вчера":
-            selected_date = (now - dt.timedelta(days=1)).strftime("%d.%m.%Y")
-        elif text == "Позавчера":
-            selected_date = (now - dt.timedelta(days=2)).strftime("%d.%m.%Y")
-        elif text == "Текущий месяц":
-            # Определяем текущий месяц и год
-            current_month = now.month
-            current_year = now.year
-            # Генерируем клавиатуру с числами месяца
-            keyboard = generate_day_keyboard(current_month, current_year)
-            await update.message.reply_text(
-                "Выбери число текущего месяца:",
-                reply_markup=keyboard
-            )
-            user_data["date_month_year"] = (current_month, current_year)
-            return States.SELECTING_DATE
-        elif text == "Предыдущий месяц":
-            # Вычисляем предыдущий месяц
-            if now.month == 1:
-                prev_month = 12
-                prev_year = now.year - 1
-            else:
-                prev_month = now.month - 1
-                prev_year = now.year
+        # Обработка ввода числа (дня месяца)
+        if text.isdigit() and "date_month_year" in user_data:
+            day = int(text)
+            month, year = user_data["date_month_year"]
 
-            # Генерируем клавиатуру с числами месяца
-            keyboard = generate_day_keyboard(prev_month, prev_year)
-            await update.message.reply_text(
-                "Выбери число предыдущего месяца:",
-                reply_markup=keyboard
-            )
-            user_data["date_month_year"] = (prev_month, prev_year)
-            return States.SELECTING_DATE
-        elif text == "Назад":
-            # Возвращаемся к выбору даты
-            await update.message.reply_text("Выбери дату:", reply_markup=date_selection_keyboard())
-            return States.SELECTING_DATE
-        else:
-            # Обработка ввода числа (дня месяца)
-            if text.isdigit() and "date_month_year" in user_data:
-                day = int(text)
-                month, year = user_data["date_month_year"]
-
-                # Проверяем корректность дня
-                days_in_month = get_days_in_month(month, year)
-                if day < 1 or day > days_in_month:
-                    await update.message.reply_text(
-                        f"❌ В этом месяце должно быть число от 1 до {days_in_month}",
-                        reply_markup=generate_day_keyboard(month, year)
-                    )
-                    return States.SELECTING_DATE
+            # Проверяем корректность дня
+            days_in_month = get_days_in_month(month, year)
+            if day < 1 or day > days_in_month:
+                await update.message.reply_text(
+                    f"❌ В этом месяце должно быть число от 1 до {days_in_month}",
+                    reply_markup=generate_day_keyboard(month, year)
+                )
+                return States.SELECTING_DATE
 
-                # Формируем дату
-                selected_date = f"{day:02d}.{month:02d}.{year}"
-                user_data["selected_date"] = selected_date
+            # Формируем дату
+            selected_date = f"{day:02d}.{month:02d}.{year}"
 
-                # Удаляем временные данные месяца
-                del user_data["date_month_year"]
-            else:
-                # Валидация введенной даты
-                if not validate_date(text):
-                    await update.message.reply_text(
-                        "❌ Неверный формат даты. Используй ДД.ММ.ГГГГ (например, 15.06.2025)",
-                        reply_markup=date_selection_keyboard()
-                    )
-                    return States.SELECTING_DATE
+            # Удаляем временные данные месяца
+            del user_data["date_month_year"]
+        else:
+            # Валидация введенной даты
+            if not validate_date(text):
+                await update.message.reply_text(
+                    "❌ Неверный формат даты. Используй ДД.ММ.ГГГГ (например, 15.06.2025)",
+                    reply_markup=date_selection_keyboard()
+                )
+                return States.SELECTING_DATE
 
-                try:
-                    # Парсим с учетом временной зоны
-                    date_obj = dt.datetime.strptime(text, "%d.%m.%Y").replace(tzinfo=MOSCOW_TZ)
-                    if date_obj.date() > now.date():
-                        await update.message.reply_text(
-                            "❌ Нельзя выбрать будущую дату!",
-                            reply_markup=date_selection_keyboard()
-                        )
-                        return States.SELECTING_DATE
-                    selected_date = text
-                except Exception as e:
+            try:
+                # Парсим с учетом временной зоны
+                date_obj = dt.datetime.strptime(text, "%d.%m.%Y").replace(tzinfo=MOSCOW_TZ)
+                if date_obj.date() > now.date():
                     await update.message.reply_text(
-                        f"❌ Ошибка: {str(e)}",
+                        "❌ Нельзя выбрать будущую дату!",
                         reply_markup=date_selection_keyboard()
                     )
                     return States.SELECTING_DATE
-
-        # Если дата была выбрана из готовых вариантов
-        if selected_date:
-            user_data["selected_date"] = selected_date
-            source = user_data.get("date_selection_source", "other")
-
-            if source == "shower":
-                group_started = "current_works" in user_data
-                await update.message.reply_text(
-                    f"📅 Выбрана дата: {selected_date}. Теперь выбери вид душевой:",
-                    reply_markup=work_keyboard("shower", group_started)
-                )
-                return States.SHOWER_WORK
-
-            if source == "mirror":
-                group_started = "current_works" in user_data
+                selected_date = text
+            except Exception as e:
                 await update.message.reply_text(
-                    f"📅 Выбрана дата: {selected_date}. Теперь выбери вид работы с зеркалом:",
-                    reply_markup=work_keyboard("mirror", group_started)
+                    f"❌ Ошибка: {str(e)}",
+                    reply_markup=date_selection_keyboard()
                 )
-                return States.MIRROR_WORK
-
-            group_started = "current_works" in user_data
-            await update.message.reply_text(
-                f"📅 Выбрана дата: {selected_date}. Теперь выбери вид работы:",
-                reply_markup=main_keyboard()
-            )
-            return States.SELECTING_WORK
+                return States.SELECTING_DATE
 
-        # Если не удалось определить дату
-        await update.message.reply_text("Пожалуйста, выбери вариант из меню", reply_markup=date_selection_keyboard())
-        return States.SELECTING_DATE
+        return await _continue_with_date(update.message, user_data, selected_date)
     except Exception as e:
         logger.error(f"Ошибка при выборе даты: {e}", exc_info=True)
         await update.message.reply_text("Произошла ошибка, попробуйте снова", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
 async def generate_excel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Генерация Excel-отчета в памяти"""
+    """Выбор периода Excel-отчета"""
     try:
-        import time as time_lib
-        user_id = str(update.message.from_user.id)
-        entries = db.get_entries(user_id)
+        await update.message.reply_text("Выбери период отчета:", reply_markup=report_period_keyboard())
+        return States.SELECTING_REPORT_PERIOD
+    except Exception as e:
+        logger.error(f"Ошибка в функции генерации Excel: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка при создании отчета", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
 
-        if not entries:
-            await update.message.reply_text("📭 Нет данных для отчета", reply_markup=main_keyboard())
-            return States.SELECTING_WORK
+async def _back_to_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text("Главное меню", reply_markup=main_keyboard())
+    return States.SELECTING_WORK
+
+async def _ask_custom_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "Введи период в формате ДД.ММ.ГГГГ - ДД.ММ.ГГГГ:",
+        reply_markup=cancel_keyboard()
+    )
+    return States.REPORT_CUSTOM_PERIOD
+
+def _report_period_action(choice: str):
+    """Действие кнопки готового периода отчета"""
+    async def action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        period = resolve_report_period(choice, dt.datetime.now(MOSCOW_TZ))
+        return await send_report(update, context, *period)
+    return action
+
+async def handle_report_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Обработка выбора периода отчета"""
+    try:
+        action = ROUTES[States.SELECTING_REPORT_PERIOD].resolve(update.message.text)
+        if action:
+            return await action(update, context)
+
+        await update.message.reply_text("Пожалуйста, выбери период из меню", reply_markup=report_period_keyboard())
+        return States.SELECTING_REPORT_PERIOD
+    except Exception as e:
+        logger.error(f"Ошибка при выборе периода отчета: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка при создании отчета", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
+
+async def handle_report_custom_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Обработка ввода произвольного периода отчета"""
+    try:
+        text = update.message.text.strip()
+
+        if text == BTN_CANCEL:
+            await update.message.reply_text("Выбери период отчета:", reply_markup=report_period_keyboard())
+            return States.SELECTING_REPORT_PERIOD
 
         try:
-            # Создаем новую книгу Excel
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Отчет о работах"
-
-            # Заголовки столбцов
-            headers = ["Дата", "Адрес", "Вид работы", "Комментарий"]
-            for col_num, header in enumerate(headers, 1):
-                col_letter = get_column_letter(col_num)
-                cell = ws[f"{col_letter}1"]
-                cell.value = header
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-
-            # Сортируем записи по дате
-            sorted_entries = sorted(
-                entries,
-                key=lambda x: dt.datetime.strptime(x['date'], "%d.%m.%Y")
+            period = parse_custom_period(text)
+        except ValueError:
+            await update.message.reply_text(
+                "❌ Неверный формат. Используй ДД.ММ.ГГГГ - ДД.ММ.ГГГГ (например, 01.06.2025 - 15.06.2025)",
+                reply_markup=cancel_keyboard()
             )
+            return States.REPORT_CUSTOM_PERIOD
 
-            # Заполняем данные
-            row_num = 2
-            for entry in sorted_entries:
-                works_str = ", ".join(entry["works"])
-                ws[f"A{row_num}"] = entry["date"]
-                ws[f"B{row_num}"] = entry.get("address", "")
-                ws[f"C{row_num}"] = works_str
-                ws[f"D{row_num}"] = entry.get("comment", "")
-                row_num += 1
-
-            # Настраиваем ширину столбцов
-            ws.column_dimensions['A'].width = 12
-            ws.column_dimensions['B'].width = 30
-            ws.column_dimensions['C'].width = 50
-            ws.column_dimensions['D'].width = 30
-
-            # Генерируем безопасное имя файла
-            now = dt.datetime.now()
-            month_name = MONTHS_GENITIVE.get(now.month, now.strftime("%B"))
-
-            # Получаем имя пользователя
-            user_name = update.message.from_user.first_name or update.message.from_user.username or f"user_{update.message.from_user.id}"
-            safe_user_name = sanitize_filename(user_name)[:20]  # Ограничиваем длину
-
-            filename = f"отчёт_{month_name}_{now.year}_{safe_user_name}.xlsx"
-            safe_filename = sanitize_filename(filename)
-
-            # Сохраняем в буфер памяти
-            buffer = BytesIO()
-            wb.save(buffer)
-            buffer.seek(0)
-
-            # Отправляем файл из памяти
-            await update.message.reply_document(
-                document=buffer,
-                filename=safe_filename,
-                caption="📊 Отчет о работах",
-                reply_markup=main_keyboard()
-            )
+        return await send_report(update, context, *period)
+    except Exception as e:
+        logger.error(f"Ошибка при вводе периода отчета: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка при создании отчета", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
 
-            return States.SELECTING_WORK
+async def send_report(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                      date_range: tuple, file_label: str, caption: str) -> int:
+    """Генерация и отправка Excel-отчета за период"""
+    try:
+        user_id = str(update.message.from_user.id)
+        caption = f"📊 Отчет о работах за {caption}"
 
+        # Данные не менялись - повторно отправляем уже загруженный файл
+        version = await db.get_data_version(user_id)
+        file_id = report_cache.get(user_id, file_label, version) if version is not None else None
+        if file_id:
+            try:
+                await update.message.reply_document(document=file_id, caption=caption, reply_markup=main_keyboard())
+                return States.SELECTING_WORK
+            except BadRequest as e:
+                logger.warning(f"Не удалось отправить отчет из кэша: {e}")
+                report_cache.invalidate(user_id, file_label)
+
+        try:
+            # Отчет строится потоково и вне цикла событий
+            with metrics.timer("bot_report_build_seconds"):
+                report = await asyncio.to_thread(build_excel_report, db.sync, user_id, date_range)
         except Exception as e:
             logger.error(f"Ошибка генерации Excel: {e}", exc_info=True)
             await update.message.reply_text("⚠️ Ошибка при создании отчета", reply_markup=main_keyboard())
             return States.SELECTING_WORK
+
+        if report is None:
+            await update.message.reply_text("📭 Нет данных для отчета за этот период", reply_markup=main_keyboard())
+            return States.SELECTING_WORK
+
+        # Получаем имя пользователя
+        user_name = update.message.from_user.first_name or update.message.from_user.username or f"user_{update.message.from_user.id}"
+        safe_user_name = sanitize_filename(user_name)[:20]  # Ограничиваем длину
+
+        filename = f"отчёт_{file_label}_{safe_user_name}.xlsx"
+        safe_filename = sanitize_filename(filename)
+
+        # Файл передается как есть: httpx отправляет его частями, без чтения в память целиком.
+        # Имя указывается явно - у SpooledTemporaryFile его нет
+        with report:
+            report.seek(0)
+            message = await update.message.reply_document(
+                document=InputFile(report, filename=safe_filename, read_file_handle=False),
+                caption=caption,
+                reply_markup=main_keyboard()
+            )
+
+        if version is not None and message.document:
+            report_cache.put(user_id, file_label, version, message.document.file_id)
+
+        return States.SELECTING_WORK
     except Exception as e:
-        logger.error(f"Ошибка в функции генерации Excel: {e}", exc_info=True)
+        logger.error(f"Ошибка при отправке отчета: {e}", exc_info=True)
         await update.message.reply_text("Произошла ошибка при создании отчета", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
+def _delete_confirmation_text(entry: dict, subject: str) -> str:
+    works_list = "\n".join([f"- {work}" for work in entry["works"]])
+    return (
+        f"🗑️ Вы уверены, что хотите удалить {subject}?\n\n"
+        f"Дата: {entry['date']}\n"
+        f"Адрес: {entry.get('address', '')}\n"
+        f"Комментарий: {entry.get('comment', '')}\n"
+        f"Работы:\n{works_list}"
+    )
+
+async def _send_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    if INLINE_UI:
+        await _send_inline(update.message, context, text, confirm_inline_keyboard())
+    else:
+        await update.message.reply_text(text, reply_markup=confirm_keyboard())
+
 async def delete_last(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Удаление последней записи"""
     try:
         user_data = context.user_data
         user_id = str(update.message.from_user.id)
-        last_entry = db.get_last_entry(user_id)
+        last_entry = await db.get_last_entry(user_id)
 
         if not last_entry:
             await update.message.reply_text("❌ Нет записей для удаления", reply_markup=main_keyboard())
@@ -724,17 +728,7 @@ async def delete_last(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         # Сохраняем ID для последующего удаления
         user_data["pending_delete_id"] = last_entry["id"]
 
-        # Формируем сообщение с деталями записи
-        works_list = "\n".join([f"- {work}" for work in last_entry["works"]])
-        message = (
-            f"🗑️ Вы уверены, что хотите удалить последнюю запись?\n\n"
-            f"Дата: {last_entry['date']}\n"
-            f"Адрес: {last_entry.get('address', '')}\n"
-            f"Комментарий: {last_entry.get('comment', '')}\n"
-            f"Работы:\n{works_list}"
-        )
-
-        await update.message.reply_text(message, reply_markup=confirm_keyboard())
+        await _send_confirmation(update, context, _delete_confirmation_text(last_entry, "последнюю запись"))
         return States.CONFIRM_DELETE_LAST
     except Exception as e:
         logger.error(f"Ошибка при удалении последней записи: {e}", exc_info=True)
@@ -748,14 +742,12 @@ async def handle_confirm_delete_last(update: Update, context: ContextTypes.DEFAU
         user_data = context.user_data
         user_id = str(update.message.from_user.id)
 
-        if "✅ Да, удалить" in text:
+        if BTN_CONFIRM_DELETE in text:
             entry_id = user_data.get("pending_delete_id")
             if entry_id:
-                success = db.delete_entry(entry_id, user_id)
+                success = await db.delete_entry(entry_id, user_id)
                 if success:
                     await update.message.reply_text("✅ Последняя запись успешно удалена!", reply_markup=main_keyboard())
-                    # Инвалидация кэша статистики
-                    stats_cache.invalidate(user_id)
                 else:
                     await update.message.reply_text("❌ Ошибка при удалении записи", reply_markup=main_keyboard())
             else:
@@ -774,52 +766,101 @@ async def handle_confirm_delete_last(update: Update, context: ContextTypes.DEFAU
         await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
-async def view_entries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Просмотр всех записей"""
-    try:
-        user_data = context.user_data
-        user_id = str(update.message.from_user.id)
-        entries = db.get_entries(user_id)
+def _shorten(text: str, limit: int = 200) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def _viewing_keyboard(user_data: dict):
+    page = user_data.get("viewing_page") or {}
+    return view_entries_keyboard(page.get("has_newer", False), page.get("has_older", False))
+
+async def show_entries_page(update: Update, context: ContextTypes.DEFAULT_TYPE, direction: str = None) -> int:
+    """Показ страницы записей: direction None - самые новые, "older"/"newer" - соседние страницы.
+
+    В user_data хранятся только id записей страницы и ключи ее границ, поэтому
+    объем состояния и чтение из БД не зависят от длины истории.
+    """
+    user_data = context.user_data
+    user_id = str(update.effective_user.id)
+    page = user_data.get("viewing_page")
+
+    if direction == "older" and page and page["has_older"]:
+        entries, has_more = await db.get_entries_page(user_id, ENTRIES_PAGE_SIZE, tuple(page["last"]))
+        offset, has_newer, has_older = page["offset"] + len(page["ids"]), True, has_more
+    elif direction == "newer" and page and page["has_newer"]:
+        entries, has_more = await db.get_entries_page(user_id, ENTRIES_PAGE_SIZE, tuple(page["first"]), backward=True)
+        offset, has_newer, has_older = max(page["offset"] - len(entries), 0), has_more, True
+    else:
+        entries = []
 
-        if not entries:
-            await update.message.reply_text("📭 Нет сохраненных записей", reply_markup=main_keyboard())
-            return States.SELECTING_WORK
+    if not entries:
+        # Первая страница или соседняя опустела (записи удалены) - начинаем с самых новых
+        entries, has_more = await db.get_entries_page(user_id, ENTRIES_PAGE_SIZE)
+        offset, has_newer, has_older = 0, False, has_more
 
-        response = "📋 Список всех работ:\n\n"
-        for i, entry in enumerate(entries, 1):
-            response += f"{i}. 📅 {entry['date']}\n"
-            response += f"   📍 Адрес: {entry.get('address', 'не указан')}\n"
-            response += f"   💬 Комментарий: {entry.get('comment', 'нет')}\n"
-            response += "   🔧 Работы:\n"
+    if not entries:
+        user_data.pop("viewing_page", None)
+        if update.callback_query:
+            await _edit_inline(update.callback_query, "📭 Нет сохраненных записей")
+        else:
+            await update.message.reply_text("📭 Нет сохраненных записей", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
 
-            for j, work in enumerate(entry["works"], 1):
-                response += f"      {j}. {work}\n"
-            response += "\n"
+    lines = [f"📋 Записи {offset + 1}–{offset + len(entries)}:\n"]
+    for i, entry in enumerate(entries, offset + 1):
+        lines.append(f"{i}. 📅 {entry['date']}")
+        lines.append(f"   📍 Адрес: {_shorten(entry.get('address') or 'не указан')}")
+        lines.append(f"   💬 Комментарий: {_shorten(entry.get('comment') or 'нет')}")
+        lines.append("   🔧 Работы:")
+        for j, work in enumerate(entry["works"], 1):
+            lines.append(f"      {j}. {work}")
+        lines.append("")
+    response = _shorten("\n".join(lines), MESSAGE_MAX_LENGTH)
+
+    user_data["viewing_page"] = {
+        "ids": [entry["id"] for entry in entries],
+        "offset": offset,
+        "first": (entries[0]["date_iso"], entries[0]["id"]),
+        "last": (entries[-1]["date_iso"], entries[-1]["id"]),
+        "has_newer": has_newer,
+        "has_older": has_older
+    }
+    if INLINE_UI:
+        markup = entries_inline_keyboard(offset, len(entries), has_newer, has_older)
+        if update.callback_query:
+            await _edit_inline(update.callback_query, response, markup)
+        else:
+            await _send_inline(update.message, context, response, markup)
+    else:
+        await update.message.reply_text(response, reply_markup=_viewing_keyboard(user_data))
+    return States.VIEWING_ENTRIES
 
-        user_data["viewing_entries"] = entries
-        await update.message.reply_text(response, reply_markup=view_entries_keyboard())
-        return States.VIEWING_ENTRIES
+async def view_entries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Просмотр записей постранично, начиная с самых новых"""
+    try:
+        context.user_data.pop("viewing_page", None)
+        return await show_entries_page(update, context)
     except Exception as e:
         logger.error(f"Ошибка при просмотре записей: {e}", exc_info=True)
         await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
+async def _leave_entries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data.pop("viewing_page", None)
+    return await _back_to_main_menu(update, context)
+
+async def _ask_entry_number(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text("Введи номер записи для удаления (или 'Отмена'):",
+                                   reply_markup=create_keyboard([BTN_CANCEL]))
+    return States.DELETING_ENTRY
+
 async def handle_view_entries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка действий при просмотре записей"""
     try:
-        text = update.message.text.strip()
-        user_data = context.user_data
-
-        if text == "Назад":
-            await update.message.reply_text("Главное меню", reply_markup=main_keyboard())
-            return States.SELECTING_WORK
+        action = ROUTES[States.VIEWING_ENTRIES].resolve(update.message.text)
+        if action:
+            return await action(update, context)
 
-        if text == "Удалить запись":
-            await update.message.reply_text("Введи номер записи для удаления (или 'Отмена'):",
-                                           reply_markup=create_keyboard(["Отмена"]))
-            return States.DELETING_ENTRY
-
-        await update.message.reply_text("Используй кнопки меню", reply_markup=view_entries_keyboard())
+        await update.message.reply_text("Используй кнопки меню", reply_markup=_viewing_keyboard(context.user_data))
         return States.VIEWING_ENTRIES
     except Exception as e:
         logger.error(f"Ошибка при обработке просмотра записей: {e}", exc_info=True)
@@ -833,36 +874,30 @@ async def handle_delete_entry(update: Update, context: ContextTypes.DEFAULT_TYPE
         user_data = context.user_data
         user_id = str(update.message.from_user.id)
 
-        if text == "отмена":
-            await update.message.reply_text("Отмена удаления", reply_markup=view_entries_keyboard())
+        if text == normalize(BTN_CANCEL):
+            await update.message.reply_text("Отмена удаления", reply_markup=_viewing_keyboard(user_data))
             return States.VIEWING_ENTRIES
 
         try:
-            index = int(text) - 1
-            entries = user_data.get("viewing_entries", [])
-            if index < 0 or index >= len(entries):
+            page = user_data.get("viewing_page") or {"ids": [], "offset": 0}
+            index = int(text) - 1 - page["offset"]
+            if index < 0 or index >= len(page["ids"]):
                 raise ValueError("Неверный индекс")
 
+            entry = await db.get_entry(page["ids"][index], user_id)
+            if not entry:
+                await update.message.reply_text("❌ Запись не найдена", reply_markup=_viewing_keyboard(user_data))
+                return States.VIEWING_ENTRIES
+
             # Сохраняем ID записи для подтверждения
-            entry = entries[index]
             user_data["pending_delete_id"] = entry["id"]
 
-            # Формируем сообщение с деталями записи
-            works_list = "\n".join([f"- {work}" for work in entry["works"]])
-            message = (
-                f"🗑️ Вы уверены, что хотите удалить эту запись?\n\n"
-                f"Дата: {entry['date']}\n"
-                f"Адрес: {entry.get('address', '')}\n"
-                f"Комментарий: {entry.get('comment', '')}\n"
-                f"Работы:\n{works_list}"
-            )
-
-            await update.message.reply_text(message, reply_markup=confirm_keyboard())
+            await _send_confirmation(update, context, _delete_confirmation_text(entry, "эту запись"))
             return States.CONFIRM_DELETE_ENTRY
 
         except ValueError:
-            await update.message.reply_text("❌ Неверный номер записи (введи число)",
-                                           reply_markup=create_keyboard(["Отмена"]))
+            await update.message.reply_text("❌ Неверный номер записи (введи номер с текущей страницы)",
+                                           reply_markup=create_keyboard([BTN_CANCEL]))
             return States.DELETING_ENTRY
     except Exception as e:
         logger.error(f"Ошибка при удалении записи: {e}", exc_info=True)
@@ -876,21 +911,19 @@ async def handle_confirm_delete_entry(update: Update, context: ContextTypes.DEFA
         user_data = context.user_data
         user_id = str(update.message.from_user.id)
 
-        if "✅ Да, удалить" in text:
+        if BTN_CONFIRM_DELETE in text:
             entry_id = user_data.get("pending_delete_id")
             if entry_id:
-                success = db.delete_entry(entry_id, user_id)
+                success = await db.delete_entry(entry_id, user_id)
                 if success:
                     await update.message.reply_text("✅ Запись успешно удалена!", reply_markup=main_keyboard())
-                    # Инвалидация кэша статистики
-                    stats_cache.invalidate(user_id)
                 else:
                     await update.message.reply_text("❌ Ошибка при удалении записи", reply_markup=main_keyboard())
             else:
                 await update.message.reply_text("❌ Не найдена запись для удаления", reply_markup=main_keyboard())
 
             # Очищаем временные данные
-            keys = ["pending_delete_id", "viewing_entries"]
+            keys = ["pending_delete_id", "viewing_page"]
             for key in keys:
                 if key in user_data:
                     del user_data[key]
@@ -904,32 +937,11 @@ async def handle_confirm_delete_entry(update: Update, context: ContextTypes.DEFA
         await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
-def calculate_stats(user_id: str) -> dict:
-    """Расчет статистики для пользователя"""
+async def calculate_stats(user_id: str) -> dict:
+    """Статистика пользователя за текущий месяц (поддерживается в БД при каждой записи)"""
     try:
-        now = dt.datetime.now(MOSCOW_TZ)
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        start_date = month_start.strftime("%d.%m.%Y")
-        end_date = now.strftime("%d.%m.%Y")
-
-        entries = db.get_entries(user_id, (start_date, end_date))
-
-        stats = {"total_groups": 0, "total_works": 0, "categories": defaultdict(int), "works": defaultdict(int)}
-
-        for entry in entries:
-            stats["total_groups"] += 1
-            stats["total_works"] += len(entry['works'])
-
-            for work in entry['works']:
-                stats["works"][work] += 1
-                if any(keyword in work.lower() for keyword in ["душ", "распашка", "фикс"]):
-                    stats["categories"]["Душевые"] += 1
-                elif "зеркал" in work.lower():
-                    stats["categories"]["Зеркала"] += 1
-                else:
-                    stats["categories"]["Другие работы"] += 1
-
-        return stats
+        month = dt.datetime.now(MOSCOW_TZ).strftime("%Y-%m")
+        return await db.get_monthly_stats(user_id, month)
     except Exception as e:
         logger.error(f"Ошибка при расчете статистики: {e}", exc_info=True)
         return {}
@@ -938,13 +950,13 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отображение статистики"""
     try:
         user_id = str(update.message.from_user.id)
-        stats = stats_cache.get(user_id, calculate_stats)
+        stats = await calculate_stats(user_id)
 
         if not stats or not stats.get("total_groups", 0):
             await update.message.reply_text("📭 Нет данных для статистики", reply_markup=main_keyboard())
             return States.SELECTING_WORK
 
-        month_name = MONTHS_GENITIVE.get(dt.datetime.now().month, "")
+        month_name = MONTHS_GENITIVE.get(dt.datetime.now(MOSCOW_TZ).month, "")
         response = (
             f"📊 Статистика за {month_name}:\n"
             f"• Групп работ: {stats['total_groups']}\n"
@@ -967,166 +979,506 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
-async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Меню настроек"""
+async def _settings_text(user_id: str) -> str:
+    settings = await db.get_settings(user_id)
+    status = "✅ Включены" if settings["reminders"] else "❌ Выключены"
+    vacation = "✅ Активен" if settings["vacation_mode"] else "❌ Не активен"
+    work_days = ", ".join([DAYS_NAMES[i] for i in settings["work_days"]])
+    schedule = await db.get_reminder_schedule(user_id)
+    timezone, reminder_time = schedule or (DEFAULT_TIMEZONE, REMINDER_TIME.strftime("%H:%M"))
+
+    return (
+        "⚙️ Настройки:\n\n"
+        f"{status} - Напоминания\n"
+        f"🕑 Время напоминаний: {reminder_time} ({timezone})\n"
+        f"📅 Рабочие дни: {work_days}\n"
+        f"{vacation} - Режим отпуска\n\n"
+        "Выбери опцию для изменения:"
+    )
+
+async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, notice: str = None) -> int:
+    """Меню настроек; notice - результат изменения, выводится в том же сообщении"""
     try:
-        user_id = str(update.message.from_user.id)
-        settings = db.get_settings(user_id)
+        response = await _settings_text(str(update.message.from_user.id))
+        if notice:
+            response = f"{notice}\n\n{response}"
+        if INLINE_UI:
+            await _send_inline(update.message, context, response, settings_inline_keyboard())
+        else:
+            await update.message.reply_text(response, reply_markup=settings_keyboard())
+        return States.SETTINGS
+    except Exception as e:
+        logger.error(f"Ошибка при открытии настроек: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
 
-        status = "✅ Включены" if settings["reminders"] else "❌ Выключены"
-        vacation = "✅ Активен" if settings["vacation_mode"] else "❌ Не активен"
-        work_days = ", ".join([DAYS_NAMES[i] for i in settings["work_days"]])
+REMINDER_TIME_PROMPT = "Введи время в формате ЧЧ:ММ. Можно указать и часовой пояс, например: 09:30 Europe/Samara"
+
+async def _toggle_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = str(update.message.from_user.id)
+    settings = await db.get_settings(user_id)
+    settings["reminders"] = not settings["reminders"]
+    status = "включены" if settings["reminders"] else "выключены"
+    await db.save_settings(user_id, settings)
+    return await settings_menu(update, context, f"Напоминания теперь {status}!")
+
+async def _toggle_vacation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = str(update.message.from_user.id)
+    settings = await db.get_settings(user_id)
+    settings["vacation_mode"] = not settings["vacation_mode"]
+    status = "активен" if settings["vacation_mode"] else "не активен"
+    await db.save_settings(user_id, settings)
+    return await settings_menu(update, context, f"Режим отпуска теперь {status}!")
+
+async def _ask_reminder_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(REMINDER_TIME_PROMPT, reply_markup=cancel_keyboard())
+    return States.SETTING_REMINDER_TIME
+
+async def _edit_work_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    settings = await db.get_settings(str(update.message.from_user.id))
+    # Изменения копятся в черновике и сохраняются по кнопке "Готово"
+    work_days = context.user_data["work_days_draft"] = list(settings["work_days"])
+    await update.message.reply_text(
+        "Выбери рабочие дни (отмеченные дни будут активны):",
+        reply_markup=work_days_keyboard(work_days)
+    )
+    return States.SETTING_WORK_DAYS
 
-        response = (
-            "⚙️ Настройки:\n\n"
-            f"{status} - Напоминания\n"
-            f"📅 Рабочие дни: {work_days}\n"
-            f"{vacation} - Режим отпуска\n\n"
-            "Выбери опцию для изменения:"
+async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Обработка настроек; текст не с кнопки показывает меню заново"""
+    try:
+        action = ROUTES[States.SETTINGS].resolve(update.message.text)
+        if action:
+            return await action(update, context)
+        return await settings_menu(update, context)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке настроек: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
+
+async def _work_days_draft(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Черновик рабочих дней и настройки пользователя"""
+    settings = await db.get_settings(str(update.message.from_user.id))
+    return context.user_data.setdefault("work_days_draft", list(settings["work_days"])), settings
+
+async def _save_work_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    work_days, settings = await _work_days_draft(update, context)
+    settings["work_days"] = sorted(work_days)
+    del context.user_data["work_days_draft"]
+    work_days_str = ", ".join([DAYS_NAMES[i] for i in settings["work_days"]])
+    await db.save_settings(str(update.message.from_user.id), settings)
+    return await settings_menu(update, context, f"Рабочие дни обновлены: {work_days_str}")
+
+async def _toggle_work_day(day_index: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    work_days, _ = await _work_days_draft(update, context)
+    if day_index in work_days:
+        work_days.remove(day_index)
+    else:
+        work_days.append(day_index)
+    work_days.sort()
+
+async def handle_work_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Настройка рабочих дней: кнопка дня (✅/❌) переключает его, «Готово» сохраняет"""
+    try:
+        action = ROUTES[States.SETTING_WORK_DAYS].resolve(update.message.text)
+        if action:
+            state = await action(update, context)
+            if state is not None:
+                return state
+
+        work_days, _ = await _work_days_draft(update, context)
+        await update.message.reply_text(
+            "Текущий выбор рабочих дней:",
+            reply_markup=work_days_keyboard(work_days)
         )
 
-        await update.message.reply_text(response, reply_markup=settings_keyboard())
-        return States.SETTINGS
+        return States.SETTING_WORK_DAYS
     except Exception as e:
-        logger.error(f"Ошибка при открытии настроек: {e}", exc_info=True)
+        logger.error(f"Ошибка при настройке рабочих дней: {e}", exc_info=True)
         await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
         return States.SELECTING_WORK
 
-async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Обработка настроек"""
+# Режим INLINE_UI: экран - одно сообщение с inline-кнопками, нажатия правят его на месте.
+# id этого сообщения хранится в user_data, нажатия на кнопки старых сообщений не обрабатываются.
+
+async def _send_inline(message, context: ContextTypes.DEFAULT_TYPE, text: str, reply_markup):
+    sent = await message.reply_text(text, reply_markup=reply_markup)
+    context.user_data["inline_message_id"] = sent.message_id
+
+async def _edit_inline(query, text: str, reply_markup=None):
+    """Правка сообщения экрана; если текст и кнопки не меняются, запрос не отправляется"""
+    # У недоступного (старше 48 ч) сообщения нет ни текста, ни кнопок
+    message = query.message
+    if getattr(message, "text", None) == text and getattr(message, "reply_markup", None) == reply_markup:
+        return
     try:
-        text = update.message.text.strip()
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+
+async def _current_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Нажатие на кнопку текущего экрана; для устаревших сообщений - None"""
+    query = update.callback_query
+    if query.message is None or query.message.message_id != context.user_data.get("inline_message_id"):
+        await query.answer("Кнопка устарела, открой меню заново")
+        return None
+    return query
+
+async def _callback_failed(update: Update) -> int:
+    try:
+        await update.effective_message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
+    except Exception as e:
+        logger.error(f"Не удалось сообщить об ошибке: {e}")
+    return States.SELECTING_WORK
+
+async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Inline-настройки: переключатели меняют то же сообщение"""
+    try:
+        query = await _current_query(update, context)
+        if query is None:
+            return None
+        action = query.data.split(":", 1)[1]
         user_data = context.user_data
-        user_id = str(update.message.from_user.id)
-        settings = db.get_settings(user_id)
+        user_id = str(update.effective_user.id)
+        settings = await db.get_settings(user_id)
 
-        if text == "Назад":
-            await update.message.reply_text("Главное меню", reply_markup=main_keyboard())
+        if action == "back":
+            await query.answer()
+            user_data.pop("inline_message_id", None)
+            await query.message.reply_text("Главное меню", reply_markup=main_keyboard())
             return States.SELECTING_WORK
 
-        if text == "⏰ Напоминания Вкл/Выкл":
-            settings["reminders"] = not settings["reminders"]
-            status = "включены" if settings["reminders"] else "выключены"
-            db.save_settings(user_id, settings)
-            await update.message.reply_text(f"Напоминания теперь {status}!")
-            return await settings_menu(update, context)
+        if action == "time":
+            await query.answer()
+            await query.message.reply_text(REMINDER_TIME_PROMPT, reply_markup=cancel_keyboard())
+            return States.SETTING_REMINDER_TIME
 
-        if text == "🏖 Режим отпуска":
+        if action == "days":
+            await query.answer()
+            work_days = user_data["work_days_draft"] = list(settings["work_days"])
+            await _edit_inline(query, "Выбери рабочие дни (отмеченные дни будут активны):",
+                               work_days_inline_keyboard(work_days))
+            return States.SETTING_WORK_DAYS
+
+        if action == "reminders":
+            settings["reminders"] = not settings["reminders"]
+            notice = f"Напоминания теперь {'включены' if settings['reminders'] else 'выключены'}!"
+        elif action == "vacation":
             settings["vacation_mode"] = not settings["vacation_mode"]
-            status = "активен" if settings["vacation_mode"] else "не активен"
-            db.save_settings(user_id, settings)
-            await update.message.reply_text(f"Режим отпуска теперь {status}!")
-            return await settings_menu(update, context)
+            notice = f"Режим отпуска теперь {'активен' if settings['vacation_mode'] else 'не активен'}!"
+        else:
+            await query.answer()
+            return States.SETTINGS
 
-        if text == "📅 Рабочие дни":
-            work_days = settings["work_days"]
-            keyboard = []
-            row = []
-            for day_name in DAYS_NAMES:
-                prefix = "✅ " if DAYS_MAP[day_name] in work_days else "❌ "
-                row.append(f"{prefix}{day_name}")
-                if len(row) == 3:
-                    keyboard.append(row)
-                    row = []
-            if row:
-                keyboard.append(row)
-            keyboard.append(["Готово"])
+        await db.save_settings(user_id, settings)
+        # Статус - всплывающим уведомлением в ответе на нажатие, без отдельного сообщения
+        await query.answer(notice)
+        await _edit_inline(query, await _settings_text(user_id), settings_inline_keyboard())
+        return States.SETTINGS
+    except Exception as e:
+        logger.error(f"Ошибка при обработке inline-настроек: {e}", exc_info=True)
+        return await _callback_failed(update)
 
-            await update.message.reply_text(
-                "Выбери рабочие дни (отмеченные дни будут активны):",
-                reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-            )
-            return States.SETTING_WORK_DAYS
+async def handle_work_days_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Inline-переключение рабочих дней; сохранение по кнопке «Готово»"""
+    try:
+        query = await _current_query(update, context)
+        if query is None:
+            return None
+        action = query.data.split(":", 1)[1]
+        user_data = context.user_data
+        user_id = str(update.effective_user.id)
+        settings = await db.get_settings(user_id)
+        work_days = user_data.setdefault("work_days_draft", list(settings["work_days"]))
+
+        if action == "done":
+            settings["work_days"] = sorted(work_days)
+            del user_data["work_days_draft"]
+            await db.save_settings(user_id, settings)
+            await query.answer(f"Рабочие дни обновлены: {', '.join(DAYS_NAMES[i] for i in settings['work_days'])}")
+            await _edit_inline(query, await _settings_text(user_id), settings_inline_keyboard())
+            return States.SETTINGS
+
+        await query.answer()
+        day_index = int(action)
+        if day_index in DAYS_MAP.values():
+            if day_index in work_days:
+                work_days.remove(day_index)
+            else:
+                work_days.append(day_index)
+            work_days.sort()
+            # Меняются только кнопки: текст экрана не отправляется заново
+            await query.edit_message_reply_markup(work_days_inline_keyboard(work_days))
+        return States.SETTING_WORK_DAYS
+    except Exception as e:
+        logger.error(f"Ошибка при inline-настройке рабочих дней: {e}", exc_info=True)
+        return await _callback_failed(update)
 
-        return await settings_menu(update, context)
+async def handle_day_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Выбор числа месяца в inline-сетке"""
+    try:
+        query = await _current_query(update, context)
+        if query is None:
+            return None
+        action = query.data.split(":", 1)[1]
+        user_data = context.user_data
+
+        if action == "back":
+            # Клавиатура выбора даты под сеткой не менялась: сетка просто становится подсказкой
+            await query.answer()
+            user_data.pop("date_month_year", None)
+            user_data.pop("inline_message_id", None)
+            await _edit_inline(query, "Выбери дату:")
+            return States.SELECTING_DATE
+
+        if "date_month_year" not in user_data:
+            await query.answer("Кнопка устарела, открой меню заново")
+            return States.SELECTING_DATE
+
+        month, year = user_data.pop("date_month_year")
+        user_data.pop("inline_message_id", None)
+        selected_date = f"{int(action):02d}.{month:02d}.{year}"
+        await query.answer()
+        # Сетка заменяется выбранной датой, чтобы в чате не оставалось нерабочих кнопок.
+        # Следующему шагу нужна обычная клавиатура, ее правкой не поставить - она уходит новым сообщением
+        await _edit_inline(query, f"📅 {selected_date}")
+        return await _continue_with_date(query.message, user_data, selected_date)
     except Exception as e:
-        logger.error(f"Ошибка при обработке настроек: {e}", exc_info=True)
-        await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
+        logger.error(f"Ошибка при выборе числа: {e}", exc_info=True)
+        return await _callback_failed(update)
+
+async def handle_entries_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Inline-навигация по страницам записей и выбор записи для удаления"""
+    try:
+        query = await _current_query(update, context)
+        if query is None:
+            return None
+        action = query.data.split(":")
+        user_data = context.user_data
+
+        if action[1] in ("older", "newer"):
+            await query.answer()
+            return await show_entries_page(update, context, action[1])
+
+        if action[1] == "del" and len(action) == 3:
+            page = user_data.get("viewing_page") or {"ids": []}
+            index = int(action[2])
+            entry = None
+            if index < len(page["ids"]):
+                entry = await db.get_entry(page["ids"][index], str(update.effective_user.id))
+            if not entry:
+                await query.answer("❌ Запись не найдена")
+                return States.VIEWING_ENTRIES
+
+            user_data["pending_delete_id"] = entry["id"]
+            await query.answer()
+            await _edit_inline(query, _delete_confirmation_text(entry, "эту запись"), confirm_inline_keyboard())
+            return States.CONFIRM_DELETE_ENTRY
+
+        await query.answer()
+        user_data.pop("viewing_page", None)
+        user_data.pop("inline_message_id", None)
+        await query.message.reply_text("Главное меню", reply_markup=main_keyboard())
         return States.SELECTING_WORK
+    except Exception as e:
+        logger.error(f"Ошибка при inline-просмотре записей: {e}", exc_info=True)
+        return await _callback_failed(update)
 
-async def handle_work_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Настройка рабочих дней"""
+async def _confirm_delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, done_text: str) -> int:
     try:
-        text = update.message.text.strip()
+        query = await _current_query(update, context)
+        if query is None:
+            return None
         user_data = context.user_data
+        entry_id = user_data.pop("pending_delete_id", None)
+
+        if query.data != "cf:yes":
+            text = "❌ Удаление отменено"
+        elif not entry_id:
+            text = "❌ Не найдена запись для удаления"
+        elif await db.delete_entry(entry_id, str(update.effective_user.id)):
+            text = done_text
+        else:
+            text = "❌ Ошибка при удалении записи"
+
+        user_data.pop("viewing_page", None)
+        user_data.pop("inline_message_id", None)
+        await query.answer()
+        await _edit_inline(query, text)
+        return States.SELECTING_WORK
+    except Exception as e:
+        logger.error(f"Ошибка при inline-подтверждении удаления: {e}", exc_info=True)
+        return await _callback_failed(update)
+
+async def handle_confirm_delete_last_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Inline-подтверждение удаления последней записи"""
+    return await _confirm_delete_callback(update, context, "✅ Последняя запись успешно удалена!")
+
+async def handle_confirm_delete_entry_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Inline-подтверждение удаления записи со страницы"""
+    return await _confirm_delete_callback(update, context, "✅ Запись успешно удалена!")
+
+async def handle_stale_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Нажатие inline-кнопки, которая не относится к текущему шагу диалога"""
+    await update.callback_query.answer("Кнопка устарела, открой меню заново")
+
+def get_job_queue(application):
+    """JobQueue приложения или None. Без JobQueue (PTB без extra job-queue, бенчмарк)
+    напоминания просто отключены, поэтому предупреждение PTB при обращении не нужно"""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*JobQueue.*", category=PTBUserWarning)
+        return application.job_queue
+
+def reminder_job_name(timezone: str, reminder_time: str) -> str:
+    return f"reminders:{timezone}:{reminder_time}"
+
+def schedule_reminder_bucket(job_queue, timezone: str, reminder_time: str) -> bool:
+    """Задание рассылки для группы (часовой пояс, время); повторный вызов не создает дублей"""
+    name = reminder_job_name(timezone, reminder_time)
+    if job_queue.get_jobs_by_name(name):
+        return False
+
+    hour, minute = map(int, reminder_time.split(":"))
+    job_queue.run_daily(
+        dispatch_reminders,
+        time=dt.time(hour, minute, tzinfo=ZoneInfo(timezone)),
+        days=tuple(range(7)),
+        data=(timezone, reminder_time),
+        name=name
+    )
+    return True
+
+def unschedule_reminder_bucket(job_queue, timezone: str, reminder_time: str) -> bool:
+    """Удаление задания рассылки группы, в которой не осталось подписчиков"""
+    jobs = job_queue.get_jobs_by_name(reminder_job_name(timezone, reminder_time))
+    for job in jobs:
+        job.schedule_removal()
+    return bool(jobs)
+
+async def schedule_all_reminders(job_queue) -> int:
+    """Восстановление заданий рассылки из БД при запуске: одно задание на группу"""
+    buckets = await db.get_reminder_buckets()
+    scheduled = 0
+    for timezone, reminder_time in buckets:
+        try:
+            scheduled += schedule_reminder_bucket(job_queue, timezone, reminder_time)
+        except (ValueError, ZoneInfoNotFoundError) as e:
+            logger.error(f"Некорректное расписание напоминаний {timezone} {reminder_time}: {e}")
+    return scheduled
+
+async def handle_reminder_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Настройка времени и часового пояса напоминаний"""
+    try:
+        text = update.message.text.strip()
         user_id = str(update.message.from_user.id)
-        settings = db.get_settings(user_id)
 
-        if text == "Готово":
-            work_days_str = ", ".join([DAYS_NAMES[i] for i in settings["work_days"]])
-            db.save_settings(user_id, settings)
-            await update.message.reply_text(f"Рабочие дни обновлены: {work_days_str}")
+        if text == BTN_CANCEL:
             return await settings_menu(update, context)
 
-        if text.startswith("✅") or text.startswith("❌"):
-            day_name = text[2:]  # Удаляем префикс (✅/❌)
-            if day_name in DAYS_MAP:
-                day_index = DAYS_MAP[day_name]
-                if day_index in settings["work_days"]:
-                    settings["work_days"].remove(day_index)
-                else:
-                    settings["work_days"].append(day_index)
-                settings["work_days"].sort()
-
-        work_days = settings["work_days"]
-        keyboard = []
-        row = []
-        for day_name in DAYS_NAMES:
-            prefix = "✅ " if DAYS_MAP[day_name] in work_days else "❌ "
-            row.append(f"{prefix}{day_name}")
-            if len(row) == 3:
-                keyboard.append(row)
-                row = []
-        if row:
-            keyboard.append(row)
-        keyboard.append(["Готово"])
+        parts = text.split()
+        try:
+            if not 1 <= len(parts) <= 2:
+                raise ValueError("Ожидается время и, возможно, часовой пояс")
+            reminder_time = dt.datetime.strptime(parts[0], "%H:%M").strftime("%H:%M")
+            previous = await db.get_reminder_schedule(user_id)
+            if len(parts) == 2:
+                timezone = parts[1]
+                ZoneInfo(timezone)
+            else:
+                timezone = previous[0] if previous else DEFAULT_TIMEZONE
+        except (ValueError, ZoneInfoNotFoundError):
+            await update.message.reply_text(
+                "❌ Неверный формат. Пример: 09:30 или 09:30 Europe/Samara",
+                reply_markup=cancel_keyboard()
+            )
+            return States.SETTING_REMINDER_TIME
+
+        if await db.set_reminder_schedule(user_id, update.effective_chat.id, timezone, reminder_time):
+            job_queue = get_job_queue(context.application)
+            if job_queue:
+                schedule_reminder_bucket(job_queue, timezone, reminder_time)
+                # Пользователь был последним в прежней группе - ее задание больше не нужно.
+                # В остальных процессах оно удалится при ближайшей рассылке
+                if previous and tuple(previous) != (timezone, reminder_time) \
+                        and not await db.has_reminder_subscribers(*previous):
+                    unschedule_reminder_bucket(job_queue, *previous)
+            notice = f"Напоминания будут приходить в {reminder_time} ({timezone})"
+        else:
+            notice = "❌ Не удалось сохранить время напоминаний"
+        return await settings_menu(update, context, notice)
+    except Exception as e:
+        logger.error(f"Ошибка при настройке времени напоминаний: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
+        return States.SELECTING_WORK
 
-        await update.message.reply_text(
-            "Текущий выбор рабочих дней:",
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+async def dispatch_reminders(context: CallbackContext):
+    """Ежедневная рассылка напоминаний группе пользователей с одинаковым временем"""
+    # Задания есть в каждом процессе бота, рассылает только лидер
+    if not is_leader():
+        return
+    try:
+        timezone, reminder_time = context.job.data
+        now = dt.datetime.now(ZoneInfo(timezone))
+        chat_ids = await db.get_reminder_recipients(
+            now.strftime("%d.%m.%Y"), now.weekday(), timezone, reminder_time
         )
+        if not chat_ids:
+            # Группа опустела (сменили время, заблокировали бота) - задание больше не нужно;
+            # новый подписчик создаст его заново через журнал сброса кэшей
+            if not await db.has_reminder_subscribers(timezone, reminder_time):
+                context.job.schedule_removal()
+                logger.info(f"Группа напоминаний {timezone} {reminder_time} пуста, задание удалено")
+            return
 
-        return States.SETTING_WORK_DAYS
+        sender = RateLimitedSender(context.bot, on_forbidden=db.deactivate_reminders)
+        message = {
+            "text": "⏰ Напоминание! Не забудь добавить сегодняшние работы!",
+            "reply_markup": main_keyboard()
+        }
+        sent, failed = await sender.send_all((chat_id, message) for chat_id in chat_ids)
+        logger.info(f"Напоминания: отправлено {sent}, ошибок {failed}")
     except Exception as e:
-        logger.error(f"Ошибка при настройке рабочих дней: {e}", exc_info=True)
-        await update.message.reply_text("Произошла ошибка, попробуйте позже", reply_markup=main_keyboard())
-        return States.SELECTING_WORK
+        logger.error(f"Ошибка рассылки напоминаний: {e}", exc_info=True)
 
-async def daily_reminder(context: CallbackContext):
-    """Ежедневное напоминание"""
+async def restore_backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Восстановление записей пользователя из бэкапов (только для администратора)"""
     try:
-        user_id = context.job.data
-        settings = db.get_settings(user_id)
+        if not ADMIN_ID or update.effective_user.id != ADMIN_ID:
+            return
 
-        if not settings["reminders"] or settings["vacation_mode"]:
+        if len(context.args) != 1:
+            await update.message.reply_text("Использование: /restore_backup <user_id>")
             return
 
-        today = dt.datetime.now(MOSCOW_TZ).weekday()
-        if today not in settings["work_days"]:
+        user_id = context.args[0]
+        restored = await db.restore_backup(user_id)
+        if restored is None:
+            await update.message.reply_text(f"❌ Не удалось восстановить данные пользователя {user_id}")
             return
 
-        today_str = dt.datetime.now(MOSCOW_TZ).strftime("%d.%m.%Y")
-        entries = db.get_entries(user_id, (today_str, today_str))
-        has_entries = bool(entries)
+        logger.warning(f"ADMIN: восстановлено {restored} записей пользователя {user_id}")
+        await update.message.reply_text(f"✅ Восстановлено записей: {restored}")
+    except Exception as e:
+        logger.error(f"Ошибка восстановления бэкапа: {e}", exc_info=True)
+        await update.message.reply_text("Произошла ошибка при восстановлении")
 
-        if not has_entries:
-            try:
-                await context.bot.send_message(
-                    chat_id=context.job.chat_id,
-                    text="⏰ Напоминание! Не забудь добавить сегодняшние работы!",
-                    reply_markup=main_keyboard()
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки напоминания: {e}")
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Сводка метрик производительности (только для администратора)"""
+    try:
+        if not ADMIN_ID or update.effective_user.id != ADMIN_ID:
+            return
+        await update.message.reply_text(metrics.summary()[:MESSAGE_MAX_LENGTH])
     except Exception as e:
-        logger.error(f"Ошибка напоминания: {e}", exc_info=True)
+        logger.error(f"Ошибка вывода метрик: {e}", exc_info=True)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена действия"""
     keys = [
         "selected_date", "current_works", "address", "comment",
-        "category", "shower_work", "mirror_work_base", "viewing_entries",
-        "manual_input", "pending_delete_id", "date_month_year"
+        "category", "shower_work", "mirror_work_base", "viewing_page",
+        "manual_input", "pending_delete_id", "date_month_year", "work_days_draft",
+        "inline_message_id"
     ]
     for key in keys:
         if key in context.user_data:
@@ -1137,3 +1489,64 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         reply_markup=main_keyboard()
     )
     return ConversationHandler.END
+
+_WORK_SELECTION_ROUTES = {
+    BTN_SHOWERS: _category_action("shower", States.SHOWER_WORK),
+    BTN_MIRRORS: _category_action("mirror", States.MIRROR_WORK),
+    BTN_OTHER_WORK: _category_action("other", States.OTHER_WORK),
+    BTN_REPORT: generate_excel,
+    BTN_DELETE_LAST: delete_last,
+    BTN_VIEW_ENTRIES: view_entries,
+    BTN_STATS: show_stats,
+    BTN_SETTINGS: settings_menu,
+    BTN_PAST_DATE: handle_past_date,
+}
+
+def _work_day_routes() -> dict:
+    routes = {BTN_DONE: _save_work_days}
+    for day_name, day_index in DAYS_MAP.items():
+        toggle = functools.partial(_toggle_work_day, day_index)
+        routes[f"✅ {day_name}"] = toggle
+        routes[f"❌ {day_name}"] = toggle
+    return routes
+
+# Маршруты кнопок по состояниям диалога: собираются один раз при импорте,
+# выбор действия - одно обращение к словарю. Тексты кнопок те же, что в keyboards.py
+ROUTES = {
+    # Набранный вручную текст ищется по вхождению названия кнопки, как раньше
+    States.SELECTING_WORK: RoutingTable(
+        _WORK_SELECTION_ROUTES, fallback=substring_matcher(_WORK_SELECTION_ROUTES)
+    ),
+    States.SELECTING_DATE: RoutingTable({
+        BTN_CANCEL: _cancel_date_selection,
+        BTN_TODAY: _relative_date_action(0),
+        BTN_YESTERDAY: _relative_date_action(1),
+        BTN_DAY_BEFORE_YESTERDAY: _relative_date_action(2),
+        BTN_CURRENT_MONTH: _pick_current_month,
+        BTN_PREVIOUS_MONTH: _pick_previous_month,
+        BTN_BACK: _back_to_date_selection,
+    }),
+    States.ADD_MORE_WORK: RoutingTable({
+        BTN_FINISH: _save_work_group,
+        BTN_ADD_MORE: _add_more_work,
+    }),
+    States.SELECTING_REPORT_PERIOD: RoutingTable({
+        BTN_BACK: _back_to_main_menu,
+        BTN_CUSTOM_PERIOD: _ask_custom_period,
+        **{choice: _report_period_action(choice) for choice in REPORT_PERIODS},
+    }),
+    States.VIEWING_ENTRIES: RoutingTable({
+        BTN_BACK: _leave_entries,
+        BTN_OLDER: functools.partial(show_entries_page, direction="older"),
+        BTN_NEWER: functools.partial(show_entries_page, direction="newer"),
+        BTN_DELETE_ENTRY: _ask_entry_number,
+    }),
+    States.SETTINGS: RoutingTable({
+        BTN_BACK: _back_to_main_menu,
+        BTN_TOGGLE_REMINDERS: _toggle_reminders,
+        BTN_VACATION: _toggle_vacation,
+        BTN_REMINDER_TIME: _ask_reminder_time,
+        BTN_WORK_DAYS: _edit_work_days,
+    }),
+    States.SETTING_WORK_DAYS: RoutingTable(_work_day_routes()),
+}
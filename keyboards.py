@@ -1,93 +1,289 @@
-from telegram import ReplyKeyboardMarkup
+import calendar
+import functools
+import json
+from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
 from config import DAYS_NAMES, DAYS_MAP
 
-def create_keyboard(buttons, add_back=True, row_width=2):
-    """Создание клавиатуры из списка кнопок"""
-    if not isinstance(buttons, list):
-        buttons = list(buttons)
+# Размер кэша клавиатур, собираемых через create_keyboard
+KEYBOARD_CACHE_SIZE = 256
 
-    # Создание строк клавиатуры
-    rows = []
-    for i in range(0, len(buttons), row_width):
-        rows.append(buttons[i:i+row_width])
+# Тексты кнопок: общие для клавиатур и таблиц маршрутов в handlers.py
+BTN_BACK = "Назад"
+BTN_CANCEL = "Отмена"
+BTN_SKIP = "Пропустить"
+BTN_DONE = "Готово"
+BTN_SHOWERS = "Душевые"
+BTN_MIRRORS = "Зеркала"
+BTN_OTHER_WORK = "Другая работа"
+BTN_REPORT = "Выгрузить отчет"
+BTN_DELETE_LAST = "Удалить последнюю"
+BTN_VIEW_ENTRIES = "Просмотреть работы"
+BTN_STATS = "Статистика"
+BTN_SETTINGS = "⚙️ Настройки"
+BTN_PAST_DATE = "Добавить за прошлую дату"
+BTN_MANUAL_WORK = "Ввести работу вручную"
+BTN_TODAY = "Сегодня"
+BTN_YESTERDAY = "Вчера"
+BTN_DAY_BEFORE_YESTERDAY = "Позавчера"
+BTN_CURRENT_MONTH = "Текущий месяц"
+BTN_PREVIOUS_MONTH = "Предыдущий месяц"
+BTN_CURRENT_YEAR = "Текущий год"
+BTN_ALL_TIME = "Весь период"
+BTN_CUSTOM_PERIOD = "Свой период"
+BTN_ADD_MORE = "Добавить еще работу"
+BTN_FINISH = "Завершить"
+BTN_NEWER = "⬅️ Новее"
+BTN_OLDER = "Старее ➡️"
+BTN_DELETE_ENTRY = "Удалить запись"
+BTN_TOGGLE_REMINDERS = "⏰ Напоминания Вкл/Выкл"
+BTN_REMINDER_TIME = "🕑 Время напоминаний"
+BTN_WORK_DAYS = "📅 Рабочие дни"
+BTN_VACATION = "🏖 Режим отпуска"
+BTN_CONFIRM_DELETE = "✅ Да, удалить"
+BTN_REJECT_DELETE = "❌ Нет, отменить"
+
+class _SerializedOnce:
+    """Клавиатура, сериализуемая один раз при создании.
+
+    Объекты клавиатур неизменяемы и переиспользуются между ответами, поэтому
+    обход кнопок выполняется один раз: хранится JSON, а to_dict() собирает из
+    него новый словарь (json.loads быстрее to_dict() PTB). Вызывающий код может
+    изменять результат, не затрагивая следующие сообщения.
+    """
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with self._unfrozen():
+            self._serialized = json.dumps(super().to_dict(), ensure_ascii=False)
 
-    if add_back and "Назад" not in buttons:
-        rows.append(["Назад"])
+    def to_dict(self, recursive: bool = True) -> dict:
+        if not recursive:
+            return super().to_dict(recursive=False)
+        return json.loads(self._serialized)
 
-    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=True)
+class CachedReplyKeyboardMarkup(_SerializedOnce, ReplyKeyboardMarkup):
+    __slots__ = ("_serialized",)
+
+class CachedInlineKeyboardMarkup(_SerializedOnce, InlineKeyboardMarkup):
+    __slots__ = ("_serialized",)
+
+def _rows(buttons, row_width: int) -> list:
+    return [list(buttons[i:i + row_width]) for i in range(0, len(buttons), row_width)]
+
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _build_keyboard(buttons: tuple, add_back: bool, row_width: int) -> ReplyKeyboardMarkup:
+    rows = _rows(buttons, row_width)
+    if add_back and BTN_BACK not in buttons:
+        rows.append([BTN_BACK])
+    return CachedReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=True)
+
+def create_keyboard(buttons, add_back=True, row_width=2):
+    """Создание клавиатуры из списка кнопок (одинаковые клавиатуры строятся один раз)"""
+    return _build_keyboard(tuple(buttons), add_back, row_width)
 
+def _static(build):
+    """Клавиатура без параметров: строится один раз при импорте модуля"""
+    markup = build()
+
+    @functools.wraps(build)
+    def get():
+        return markup
+    return get
+
+@_static
 def main_keyboard():
     """Главное меню"""
     buttons = [
-        "Душевые", "Зеркала", "Другая работа",
-        "Выгрузить отчет", "Удалить последнюю", "Просмотреть работы",
-        "Статистика", "⚙️ Настройки"
+        BTN_SHOWERS, BTN_MIRRORS, BTN_OTHER_WORK,
+        BTN_REPORT, BTN_DELETE_LAST, BTN_VIEW_ENTRIES,
+        BTN_STATS, BTN_SETTINGS
     ]
     return create_keyboard(buttons, add_back=False, row_width=3)
 
+WORK_BUTTONS = {
+    "shower": [
+        "Угловая распашка", "Прямая распашка", "Угловая откадка",
+        "Шторка на ванную", "Фикс на ванную", "Фикс в душ",
+        "Фикс до потолка", "Трапеция", "Полутрапеция",
+        BTN_PAST_DATE
+    ],
+    "mirror": [
+        "Обычное с подсветкой", "Большое с подсветкой",
+        "В сборной раме", "Зеркало клей",
+        "Навес",
+        BTN_PAST_DATE
+    ],
+    "other": [BTN_MANUAL_WORK, BTN_PAST_DATE]
+}
+
 def work_keyboard(work_type, group_started=False):
     """Клавиатура для выбора типа работы"""
-    buttons = {
-        "shower": [
-            "Угловая распашка", "Прямая распашка", "Угловая откадка",
-            "Шторка на ванную", "Фикс на ванную", "Фикс в душ",
-            "Фикс до потолка", "Трапеция", "Полутрапеция",
-            "Добавить за прошлую дату"
-        ],
-        "mirror": [
-            "Обычное с подсветкой", "Большое с подсветкой",
-            "В сборной раме", "Зеркало клей",
-            "Навес", 
-            "Добавить за прошлую дату"
-        ],
-        "other": ["Ввести работу вручную", "Добавить за прошлую дату"]
-    }
-    kb_buttons = buttons.get(work_type, [])
-    return create_keyboard(kb_buttons, row_width=2)
+    return create_keyboard(WORK_BUTTONS.get(work_type, []), row_width=2)
 
+@_static
 def mirror_quantity_keyboard():
     """Клавиатура для выбора количества зеркал"""
-    return create_keyboard(["1", "2", "3", "4", "5", "6", "Пропустить"], row_width=3)
+    return create_keyboard(["1", "2", "3", "4", "5", "6", BTN_SKIP], row_width=3)
 
+@_static
 def additional_services_keyboard():
     """Клавиатура дополнительных услуг"""
-    return create_keyboard(["1 полочка", "2 полочки", "3 полочки", "Гидрофобное", "Пропустить"], row_width=2)
+    return create_keyboard(["1 полочка", "2 полочки", "3 полочки", "Гидрофобное", BTN_SKIP], row_width=2)
 
+@_static
 def date_selection_keyboard():
     """Клавиатура выбора даты"""
     buttons = [
-        "Сегодня", "Вчера", "Позавчера",
-        "Текущий месяц", "Предыдущий месяц", "Отмена"
+        BTN_TODAY, BTN_YESTERDAY, BTN_DAY_BEFORE_YESTERDAY,
+        BTN_CURRENT_MONTH, BTN_PREVIOUS_MONTH, BTN_CANCEL
     ]
     return create_keyboard(buttons, add_back=False, row_width=2)
 
+@_static
+def report_period_keyboard():
+    """Клавиатура выбора периода отчета"""
+    buttons = [
+        BTN_CURRENT_MONTH, BTN_PREVIOUS_MONTH,
+        BTN_CURRENT_YEAR, BTN_CUSTOM_PERIOD,
+        BTN_ALL_TIME, BTN_BACK
+    ]
+    return create_keyboard(buttons, add_back=False, row_width=2)
+
+@_static
 def add_more_keyboard():
     """Клавиатура добавления работ"""
-    return create_keyboard(["Добавить еще работу", "Завершить"], add_back=False, row_width=1)
+    return create_keyboard([BTN_ADD_MORE, BTN_FINISH], add_back=False, row_width=1)
 
-def view_entries_keyboard():
-    """Клавиатура просмотра записей"""
-    return create_keyboard(["Удалить запись", "Назад"], add_back=False)
+def view_entries_keyboard(has_newer=False, has_older=False):
+    """Клавиатура просмотра записей с навигацией по страницам"""
+    buttons = []
+    if has_newer:
+        buttons.append(BTN_NEWER)
+    if has_older:
+        buttons.append(BTN_OLDER)
+    buttons.extend([BTN_DELETE_ENTRY, BTN_BACK])
+    return create_keyboard(buttons, add_back=False, row_width=2)
 
+@_static
 def settings_keyboard():
     """Клавиатура настроек"""
-    return create_keyboard(["⏰ Напоминания Вкл/Выкл", "📅 Рабочие дни", "🏖 Режим отпуска", "Назад"], add_back=False)
+    return create_keyboard(
+        [BTN_TOGGLE_REMINDERS, BTN_REMINDER_TIME, BTN_WORK_DAYS, BTN_VACATION, BTN_BACK],
+        add_back=False
+    )
 
+@_static
 def confirm_keyboard():
     """Клавиатура подтверждения действий"""
-    return create_keyboard(["✅ Да, удалить", "❌ Нет, отменить"], add_back=False, row_width=2)
+    return create_keyboard([BTN_CONFIRM_DELETE, BTN_REJECT_DELETE], add_back=False, row_width=2)
+
+@_static
+def cancel_keyboard():
+    """Единственная кнопка "Отмена" для ввода текста"""
+    return create_keyboard([BTN_CANCEL], add_back=False)
+
+@_static
+def skip_keyboard():
+    """Единственная кнопка "Пропустить" для необязательного ввода"""
+    return create_keyboard([BTN_SKIP], add_back=False)
+
+@functools.lru_cache(maxsize=2 ** len(DAYS_NAMES))
+def _work_days_keyboard(mask: int) -> ReplyKeyboardMarkup:
+    buttons = [
+        f"{'✅' if mask & (1 << DAYS_MAP[day_name]) else '❌'} {day_name}"
+        for day_name in DAYS_NAMES
+    ]
+    keyboard = _rows(buttons, 3)
+    keyboard.append([BTN_DONE])
+    return CachedReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 def work_days_keyboard(work_days):
-    """Клавиатура для выбора рабочих дней"""
-    keyboard = []
-    row = []
-    for day_name in DAYS_NAMES:
-        prefix = "✅ " if DAYS_MAP[day_name] in work_days else "❌ "
-        row.append(f"{prefix}{day_name}")
-        if len(row) == 3:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-    keyboard.append(["Готово"])
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    """Клавиатура для выбора рабочих дней; кэшируется по набору дней (битовая маска)"""
+    mask = 0
+    for day in work_days:
+        mask |= 1 << day
+    return _work_days_keyboard(mask)
+
+@functools.lru_cache(maxsize=4)
+def _day_grid_keyboard(days_count: int) -> ReplyKeyboardMarkup:
+    # Разбиваем на ряды по 7 кнопок
+    keyboard = _rows([str(day) for day in range(1, days_count + 1)], 7)
+    keyboard.append([BTN_BACK])
+    return CachedReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+def generate_day_keyboard(month, year):
+    """Клавиатура с числами месяца; сетка зависит только от числа дней (28-31)"""
+    return _day_grid_keyboard(calendar.monthrange(year, month)[1])
+
+# Inline-клавиатуры режима INLINE_UI: callback_data - "<экран>:<действие>"
+
+def _inline(rows) -> InlineKeyboardMarkup:
+    """rows - ряды пар (текст кнопки, callback_data)"""
+    return CachedInlineKeyboardMarkup(
+        [[InlineKeyboardButton(text, callback_data=data) for text, data in row] for row in rows]
+    )
+
+@_static
+def settings_inline_keyboard():
+    """Inline-клавиатура настроек"""
+    return _inline([
+        [(BTN_TOGGLE_REMINDERS, "set:reminders")],
+        [(BTN_REMINDER_TIME, "set:time"), (BTN_WORK_DAYS, "set:days")],
+        [(BTN_VACATION, "set:vacation")],
+        [(BTN_BACK, "set:back")],
+    ])
+
+@functools.lru_cache(maxsize=2 ** len(DAYS_NAMES))
+def _work_days_inline_keyboard(mask: int) -> InlineKeyboardMarkup:
+    buttons = [
+        (f"{'✅' if mask & (1 << DAYS_MAP[day_name]) else '❌'} {day_name}", f"wd:{DAYS_MAP[day_name]}")
+        for day_name in DAYS_NAMES
+    ]
+    rows = _rows(buttons, 3)
+    rows.append([(BTN_DONE, "wd:done")])
+    return _inline(rows)
+
+def work_days_inline_keyboard(work_days):
+    """Inline-переключатели рабочих дней"""
+    mask = 0
+    for day in work_days:
+        mask |= 1 << day
+    return _work_days_inline_keyboard(mask)
+
+@functools.lru_cache(maxsize=4)
+def _day_grid_inline_keyboard(days_count: int) -> InlineKeyboardMarkup:
+    rows = _rows([(str(day), f"day:{day}") for day in range(1, days_count + 1)], 7)
+    rows.append([(BTN_BACK, "day:back")])
+    return _inline(rows)
+
+def day_inline_keyboard(month, year):
+    """Inline-сетка чисел месяца"""
+    return _day_grid_inline_keyboard(calendar.monthrange(year, month)[1])
+
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def entries_inline_keyboard(offset: int, count: int, has_newer: bool, has_older: bool) -> InlineKeyboardMarkup:
+    """Inline-навигация по страницам записей и удаление записи по номеру на странице"""
+    rows = []
+    navigation = []
+    if has_newer:
+        navigation.append((BTN_NEWER, "pg:newer"))
+    if has_older:
+        navigation.append((BTN_OLDER, "pg:older"))
+    if navigation:
+        rows.append(navigation)
+    rows.extend(_rows([(f"🗑 {offset + i + 1}", f"pg:del:{i}") for i in range(count)], 5))
+    rows.append([(BTN_BACK, "pg:back")])
+    return _inline(rows)
+
+@_static
+def confirm_inline_keyboard():
+    """Inline-подтверждение удаления"""
+    return _inline([[(BTN_CONFIRM_DELETE, "cf:yes"), (BTN_REJECT_DELETE, "cf:no")]])
+
+def keyboard_cache_stats() -> tuple:
+    """Попадания и промахи кэшей параметризованных клавиатур"""
+    caches = (_build_keyboard, _work_days_keyboard, _day_grid_keyboard,
+              _work_days_inline_keyboard, _day_grid_inline_keyboard, entries_inline_keyboard)
+    infos = [cache.cache_info() for cache in caches]
+    return sum(info.hits for info in infos), sum(info.misses for info in infos)
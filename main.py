@@ -1,24 +1,43 @@
+import asyncio
 import logging
 import logging.config
+import json
+import queue
 import threading
 import time as time_module
 import socket
 import sys
 import gzip
 import os
+import shutil
+import signal
+import warnings
 import datetime as dt
-from config import LOG_CONFIG, States, LOG_FILE_PATH, TOKEN, ADMIN_ID
+from config import (LOG_CONFIG, States, LOG_FILE_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE,
+                    LOG_JSON, TOKEN, ADMIN_ID, DB_EXECUTOR_WORKERS, PERSISTENCE_UPDATE_INTERVAL,
+                    SNAPSHOT_DIR, SNAPSHOT_INTERVAL_HOURS, SNAPSHOT_KEEP, SNAPSHOT_PAGES_PER_STEP,
+                    METRICS_HOST, METRICS_PORT, UPDATE_CONCURRENCY, WEBHOOK_URL, BOT_WORKERS,
+                    INLINE_UI, INVALIDATION_POLL_INTERVAL)
+from snapshots import create_snapshot, rotate_snapshots
+from persistence import SQLitePersistence, import_pickle_file
+from metrics import InstrumentedRequest, instrument_handler, start_metrics_server
+from update_processor import UserLaneUpdateProcessor
+from webhook import run_webhook
+from sharding import LeaderElection, InvalidationPoller, is_leader, run_sharded, serve_inbox
 from handlers import *
 from telegram.ext import (
-    Application, CommandHandler, ConversationHandler,
-    MessageHandler, filters, PicklePersistence
+    Application, CallbackQueryHandler, CommandHandler, ConversationHandler,
+    MessageHandler, filters
 )
+from telegram.warnings import PTBUserWarning
 from telegram import Bot, Update
 from telegram.error import (Conflict, NetworkError, RetryAfter,
                            TimedOut, BadRequest, Forbidden,
                            ChatMigrated, TelegramError)
 import locale
 import atexit
+from logging.handlers import QueueHandler, QueueListener
+from collections import deque
 
 # Установка локали
 try:
@@ -26,12 +45,91 @@ try:
 except locale.Error:
     pass
 
+class DroppingQueueHandler(QueueHandler):
+    """Постановка записей в ограниченную очередь без ожидания диска; поток,
+    который пишет в лог, никогда не блокируется.
+
+    При переполнении записи ниже WARNING отбрасываются сразу, более важные
+    откладываются в небольшой резерв (overflow_size записей) и уходят в очередь
+    при следующих записях, как только в ней появится место. Не поместившиеся
+    в резерв и отброшенные записи считаются в dropped.
+    """
+    def __init__(self, log_queue, overflow_size=1000):
+        super().__init__(log_queue)
+        self.overflow = deque()
+        self.overflow_size = overflow_size
+        self.dropped = 0
+
+    def flush_overflow(self) -> bool:
+        """Перенос отложенных записей в очередь по порядку; False - место кончилось"""
+        while True:
+            try:
+                record = self.overflow.popleft()
+            except IndexError:
+                return True
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.overflow.appendleft(record)
+                return False
+
+    def enqueue(self, record):
+        # Пока резерв не разобран, новые записи встают за ним, чтобы не нарушать порядок
+        if not self.overflow or self.flush_overflow():
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+        if record.levelno >= logging.WARNING and len(self.overflow) < self.overflow_size:
+            self.overflow.append(record)
+        else:
+            self.dropped += 1
+
+class BatchingQueueListener(QueueListener):
+    """Слушатель очереди логов: буферы файлов сбрасываются, когда очередь опустела,
+    а не после каждой записи"""
+    def dequeue(self, block):
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """Запись в поток без flush на каждой строке (сбросом управляет BatchingQueueListener)"""
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+class JsonFormatter(logging.Formatter):
+    """Структурированные логи: одна JSON-строка на запись"""
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
 # Улучшенный обработчик логов
 class SafeLogHandler:
-    def __init__(self, filename, backup_count=7):
+    # Сжатие ротированного файла идет порциями, память не зависит от размера лога
+    COMPRESS_CHUNK_SIZE = 1024 * 1024
+    LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+    def __init__(self, filename, backup_count=7, max_bytes=0, queue_size=10000, json_format=False):
         self.filename = filename
         self.backup_count = backup_count
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.json_format = json_format
         self.current_file = None
+        self.handler = None
         self.current_day = dt.datetime.now().strftime("%Y-%m-%d")
         self.lock = threading.Lock()
         self.initialize_logging()
@@ -52,17 +150,31 @@ class SafeLogHandler:
                 handler.close()
                 self.logger.removeHandler(handler)
 
+        formatter = JsonFormatter() if self.json_format else logging.Formatter(self.LOG_FORMAT)
         try:
             self.current_file = open(self.filename, 'a', encoding='utf-8')
-            handler = logging.StreamHandler(self.current_file)
-            handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-            self.logger.addHandler(handler)
+            self.handler = BufferedStreamHandler(self.current_file)
+            self.handler.setFormatter(formatter)
+            self.logger.addHandler(self.handler)
         except Exception as e:
             print(f"Ошибка открытия файла логов: {e}")
             console_handler = logging.StreamHandler()
-            console_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+            console_handler.setFormatter(formatter)
             self.logger.addHandler(console_handler)
 
+        # Все обработчики корневого логгера переезжают в отдельный поток записи,
+        # в потоках бота остается только постановка записи в очередь
+        handlers = self.logger.handlers[:]
+        for handler in handlers:
+            self.logger.removeHandler(handler)
+        self.queue_handler = DroppingQueueHandler(queue.Queue(maxsize=self.queue_size))
+        self.logger.addHandler(self.queue_handler)
+        self.listener = BatchingQueueListener(self.queue_handler.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self.listener_started = True
+        atexit.register(self.stop)
+        self.reported_dropped = 0
+
         self.monitor_thread = threading.Thread(target=self.log_monitor, daemon=True)
         self.monitor_thread.start()
 
@@ -70,23 +182,61 @@ class SafeLogHandler:
         while True:
             try:
                 today = dt.datetime.now().strftime("%Y-%m-%d")
-                if today != self.current_day:
+                if today != self.current_day or self.size_exceeded():
                     with self.lock:
                         self.rotate_logs()
                         self.current_day = today
+                self.report_dropped()
                 time_module.sleep(60)
             except Exception as e:
                 print(f"Ошибка в мониторе логов: {e}")
                 time_module.sleep(300)
 
+    def stop(self):
+        """Запись оставшихся в очереди логов и остановка потока логирования"""
+        if not self.listener_started:
+            return
+        self.listener_started = False
+        # Поток записи еще работает: отложенные записи можно дождаться
+        overflow = self.queue_handler.overflow
+        while overflow:
+            self.queue_handler.queue.put(overflow.popleft())
+        self.listener.stop()
+
+    def report_dropped(self):
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported_dropped:
+            self.logger.warning(f"Очередь логов переполнена, пропущено записей: {dropped - self.reported_dropped}")
+            self.reported_dropped = dropped
+
+    def size_exceeded(self):
+        try:
+            return self.max_bytes > 0 and os.path.getsize(self.filename) >= self.max_bytes
+        except OSError:
+            return False
+
+    def rotated_name(self):
+        """Имя для ротированного файла; при ротации по размеру за день их может быть несколько"""
+        name = f"{self.filename}.{self.current_day}"
+        if os.path.exists(name) or os.path.exists(f"{name}.gz"):
+            name = f"{name}.{dt.datetime.now().strftime('%H%M%S')}"
+        return name
+
     def rotate_logs(self):
+        if not self.handler:
+            return
+
+        new_name = None
+        # Блокировка обработчика держится только на время переименования и
+        # переоткрытия файла: записи из других потоков ждут миллисекунды
+        self.handler.acquire()
         try:
+            self.handler.flush()
             if self.current_file:
                 self.current_file.close()
 
             if os.path.exists(self.filename):
-                new_name = f"{self.filename}.{self.current_day}"
-
+                new_name = self.rotated_name()
                 for _ in range(5):
                     try:
                         os.rename(self.filename, new_name)
@@ -95,41 +245,38 @@ class SafeLogHandler:
                         time_module.sleep(1)
                 else:
                     print("Не удалось переименовать файл после 5 попыток")
-                    return
-
-                self.compress_file(new_name)
+                    new_name = None
 
             self.current_file = open(self.filename, 'a', encoding='utf-8')
-
-            for handler in self.logger.handlers[:]:
-                if isinstance(handler, logging.StreamHandler) and hasattr(handler, 'stream') and handler.stream == self.current_file:
-                    self.logger.removeHandler(handler)
-
-            new_handler = logging.StreamHandler(self.current_file)
-            new_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-            self.logger.addHandler(new_handler)
-
-            self.cleanup_old_logs()
-
+            self.handler.stream = self.current_file
         except Exception as e:
             print(f"Ошибка при ротации логов: {e}")
             try:
                 self.current_file = open(self.filename, 'a', encoding='utf-8')
+                self.handler.stream = self.current_file
             except:
                 pass
+        finally:
+            self.handler.release()
+
+        # Сжатие и очистка идут уже без блокировки записи логов
+        if new_name:
+            self.compress_file(new_name)
+        self.cleanup_old_logs()
 
     def compress_file(self, filename):
+        tmp_name = f"{filename}.gz.tmp"
         try:
             if os.path.exists(filename):
-                with open(filename, 'r', encoding='utf-8') as f_in:
-                    content = f_in.read()
-
-                with gzip.open(f"{filename}.gz", 'wt', encoding='utf-8') as f_out:
-                    f_out.write(content)
+                with open(filename, 'rb') as f_in, gzip.open(tmp_name, 'wb') as f_out:
+                    shutil.copyfileobj(f_in, f_out, self.COMPRESS_CHUNK_SIZE)
 
+                os.replace(tmp_name, f"{filename}.gz")
                 os.remove(filename)
         except Exception as e:
             print(f"Ошибка при сжатии файла {filename}: {e}")
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
 
     def cleanup_old_logs(self):
         try:
@@ -145,25 +292,32 @@ class SafeLogHandler:
             print(f"Ошибка при очистке старых логов: {e}")
 
 # Инициализация логгера
-log_handler = SafeLogHandler(LOG_FILE_PATH, backup_count=7)
+log_handler = SafeLogHandler(LOG_FILE_PATH, backup_count=LOG_BACKUP_COUNT, max_bytes=LOG_MAX_BYTES,
+                             queue_size=LOG_QUEUE_SIZE, json_format=LOG_JSON)
 
 def auto_backup():
     backup_logger = logging.getLogger("auto_backup")
-    db = SQLiteDatabase()
+    db = SQLiteDatabase(DB_NAME)
 
     while True:
         try:
-            users = db.get_all_users()
+            # При нескольких процессах бэкапы делает только лидер
+            if not is_leader():
+                time_module.sleep(600)
+                continue
+
+            # Бэкапы инкрементальные: пользователи без изменений пропускаются
+            users = db.get_users_with_changes()
             if not users:
-                backup_logger.info("Нет пользователей для бэкапа")
+                backup_logger.info("Нет изменений для бэкапа")
                 time_module.sleep(3600 * 4)
                 continue
 
             backup_logger.info(f"Начато создание бэкапов для {len(users)} пользователей")
             for user_id in users:
                 try:
-                    db.create_backup(user_id)
-                    backup_logger.info(f"Создан бэкап для пользователя {user_id}")
+                    if db.create_backup(user_id):
+                        backup_logger.info(f"Создан бэкап для пользователя {user_id}")
                 except Exception as e:
                     backup_logger.error(f"Ошибка при создании бэкапа для {user_id}: {e}")
 
@@ -172,6 +326,21 @@ def auto_backup():
             backup_logger.error(f"Ошибка автоматического бэкапа: {e}")
             time_module.sleep(3600)
 
+def auto_snapshot():
+    """Периодические снимки всей базы в сжатые файлы с ротацией"""
+    snapshot_logger = logging.getLogger("auto_snapshot")
+    interval = SNAPSHOT_INTERVAL_HOURS * 3600
+
+    while True:
+        try:
+            time_module.sleep(interval)
+            if not is_leader():
+                continue
+            create_snapshot(db.db_name, SNAPSHOT_DIR, pages=SNAPSHOT_PAGES_PER_STEP)
+            rotate_snapshots(db.db_name, SNAPSHOT_DIR, keep=SNAPSHOT_KEEP)
+        except Exception as e:
+            snapshot_logger.error(f"Ошибка создания снимка БД: {e}")
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик всех ошибок"""
     logger = logging.getLogger(__name__)
@@ -265,6 +434,196 @@ async def periodic_health_check(bot: Bot, interval=3600):
                     pass
         await asyncio.sleep(interval)
 
+# Обработчики текстовых сообщений по состояниям диалога
+STATE_HANDLERS = {
+    States.SELECTING_DATE: handle_date_selection,
+    States.SELECTING_WORK: handle_work_selection,
+    States.SHOWER_WORK: handle_work,
+    States.MIRROR_WORK: handle_work,
+    States.OTHER_WORK: handle_work,
+    States.ADDITIONAL_SERVICES: handle_additional,
+    States.MIRROR_QUANTITY: handle_mirror_quantity,
+    States.ADD_ADDRESS: handle_address,
+    States.ADD_COMMENT: handle_comment,
+    States.ADD_MORE_WORK: handle_add_more,
+    States.VIEWING_ENTRIES: handle_view_entries,
+    States.DELETING_ENTRY: handle_delete_entry,
+    States.SETTINGS: handle_settings,
+    States.SETTING_WORK_DAYS: handle_work_days,
+    States.CONFIRM_DELETE_LAST: handle_confirm_delete_last,
+    States.CONFIRM_DELETE_ENTRY: handle_confirm_delete_entry,
+    States.SELECTING_REPORT_PERIOD: handle_report_period,
+    States.REPORT_CUSTOM_PERIOD: handle_report_custom_period,
+    States.SETTING_REMINDER_TIME: handle_reminder_time,
+}
+
+# Нажатия inline-кнопок (режим INLINE_UI): префикс callback_data и обработчик по состояниям
+CALLBACK_HANDLERS = {
+    States.SELECTING_DATE: ("day", handle_day_callback),
+    States.VIEWING_ENTRIES: ("pg", handle_entries_callback),
+    States.SETTINGS: ("set", handle_settings_callback),
+    States.SETTING_WORK_DAYS: ("wd", handle_work_days_callback),
+    States.CONFIRM_DELETE_LAST: ("cf", handle_confirm_delete_last_callback),
+    States.CONFIRM_DELETE_ENTRY: ("cf", handle_confirm_delete_entry_callback),
+}
+
+def build_conversation_handler(persistent: bool = True) -> ConversationHandler:
+    """Основной диалог бота; используется и при запуске, и в benchmark.py"""
+    states = {
+        state: [MessageHandler(filters.TEXT & ~filters.COMMAND, instrument_handler(callback, state.name))]
+        for state, callback in STATE_HANDLERS.items()
+    }
+    fallbacks = [CommandHandler("cancel", instrument_handler(cancel, "fallback"))]
+    if INLINE_UI:
+        for state, (prefix, callback) in CALLBACK_HANDLERS.items():
+            states[state].insert(0, CallbackQueryHandler(instrument_handler(callback, state.name), pattern=f"^{prefix}:"))
+        fallbacks.append(CallbackQueryHandler(instrument_handler(handle_stale_callback, "fallback")))
+
+    with warnings.catch_warnings():
+        # Диалог ведется по пользователю, а не по сообщению: кнопки старых
+        # сообщений отсекаются по inline_message_id в user_data
+        warnings.filterwarnings("ignore", message=".*per_message=False.*", category=PTBUserWarning)
+        return ConversationHandler(
+            entry_points=[CommandHandler("start", instrument_handler(start, "entry"))],
+            states=states,
+            fallbacks=fallbacks,
+            name="main_conversation",
+            persistent=persistent,
+        )
+
+def register_handlers(application: Application, persistent: bool = True):
+    application.add_handler(build_conversation_handler(persistent))
+    application.add_handler(CommandHandler("restore_backup", instrument_handler(restore_backup_command, "command")))
+    application.add_handler(CommandHandler("metrics", instrument_handler(metrics_command, "command")))
+
+# Группы напоминаний, созданные в других процессах: "часовой пояс время" из журнала сброса кэшей
+published_reminder_buckets = queue.SimpleQueue()
+
+async def periodic_reminder_sync(application: Application, interval=300):
+    """Досоздание заданий рассылки для групп, появившихся в других процессах.
+
+    Новые группы приходят через журнал сброса кэшей и планируются сразу
+    (задержка - период опроса журнала), полная сверка с БД раз в interval
+    страхует от пропущенных записей журнала.
+    """
+    logger = logging.getLogger(__name__)
+    last_sync = time_module.monotonic()
+    while True:
+        await asyncio.sleep(INVALIDATION_POLL_INTERVAL)
+        while True:
+            try:
+                key = published_reminder_buckets.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                timezone, reminder_time = key.split(" ", 1)
+                schedule_reminder_bucket(application.job_queue, timezone, reminder_time)
+            except Exception as e:
+                logger.error(f"Некорректная группа напоминаний {key!r}: {e}")
+
+        if time_module.monotonic() - last_sync < interval:
+            continue
+        last_sync = time_module.monotonic()
+        try:
+            await schedule_all_reminders(application.job_queue)
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации заданий рассылки: {e}")
+
+def start_background_jobs():
+    """Бэкапы и снимки БД в отдельных потоках (при нескольких процессах работают у лидера)"""
+    backup_thread = threading.Thread(target=auto_backup, daemon=True)
+    backup_thread.start()
+
+    if SNAPSHOT_INTERVAL_HOURS > 0:
+        snapshot_thread = threading.Thread(target=auto_snapshot, daemon=True)
+        snapshot_thread.start()
+
+def build_application(receive_updates: bool = True) -> Application:
+    """Приложение бота; без receive_updates обновления передаются в него извне
+    (процесс-обработчик при BOT_WORKERS > 1)"""
+    logger = logging.getLogger(__name__)
+    persistence = SQLitePersistence(db.sync, update_interval=PERSISTENCE_UPDATE_INTERVAL)
+
+    builder = Application.builder() \
+        .token(TOKEN) \
+        .persistence(persistence) \
+        .request(InstrumentedRequest(connection_pool_size=256)) \
+        .concurrent_updates(UserLaneUpdateProcessor(UPDATE_CONCURRENCY))
+    if not receive_updates:
+        builder = builder.updater(None)
+    application = builder.build()
+
+    application.add_error_handler(error_handler)
+
+    # Выносим запросы к БД из цикла событий в отдельные потоки
+    if DB_EXECUTOR_WORKERS > 0:
+        db.enable_executor(DB_EXECUTOR_WORKERS)
+
+    register_handlers(application)
+
+    # Запускаем самотестирование при старте
+    async def post_init(application: Application) -> None:
+        bot = application.bot
+        # При нескольких процессах сообщения администратору шлет только лидер
+        if is_leader():
+            success = await self_test(bot)
+            if success:
+                logger.info("Self-test passed")
+            else:
+                logger.error("Self-test failed")
+
+        # Задания рассылки восстанавливаются из БД: одно на группу (часовой пояс, время)
+        job_queue = get_job_queue(application)
+        if job_queue:
+            scheduled = await schedule_all_reminders(job_queue)
+            logger.info(f"Запланировано групп напоминаний: {scheduled}")
+            if not receive_updates:
+                asyncio.create_task(periodic_reminder_sync(application))
+        else:
+            logger.warning("Job queue недоступен: напоминания отключены")
+
+        if METRICS_PORT:
+            try:
+                await start_metrics_server(METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                logger.error(f"Не удалось запустить эндпоинт метрик: {e}")
+
+        # Запускаем периодическую проверку здоровья
+        if is_leader():
+            asyncio.create_task(periodic_health_check(bot))
+
+    application.post_init = post_init
+    return application
+
+def run_worker(index: int, workers: int, inbox, acks) -> None:
+    """Процесс-обработчик: обновления своей доли пользователей приходят от родительского процесса"""
+    logger = logging.getLogger(__name__)
+    # Останавливает родитель через очередь, чтобы обработчик успел сохранить данные диалогов
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    db.sync.invalidation_origin = owner
+    election = LeaderElection(db.sync, owner)
+    election.start()
+    poller = InvalidationPoller(db.sync, {
+        "settings": db.sync.settings_cache.invalidate,
+        "reminders": published_reminder_buckets.put,
+    })
+    poller.start()
+    start_background_jobs()
+
+    logger.info(f"Обработчик {index} из {workers} запущен")
+    try:
+        asyncio.run(serve_inbox(build_application(receive_updates=False), inbox, acks))
+    except Exception as e:
+        logger.exception(f"Критическая ошибка обработчика {index}: {e}")
+        sys.exit(1)
+    finally:
+        poller.stop()
+        election.stop()
+        log_handler.stop()
+
 def main() -> None:
     logger = logging.getLogger(__name__)
 
@@ -284,66 +643,27 @@ def main() -> None:
         lock_socket.close()
 
     try:
-        # Добавляем постоянное хранилище для состояний
-        state_file = os.path.abspath('conversation_states.pickle')
-        logger.info(f"Используем файл для состояний: {state_file}")
-        persistence = PicklePersistence(filepath=state_file)
-
-        application = Application.builder() \
-            .token(TOKEN) \
-            .persistence(persistence) \
-            .build()
-
-        application.add_error_handler(error_handler)
-
-        conv_handler = ConversationHandler(
-            entry_points=[CommandHandler("start", start)],
-            states={
-                States.SELECTING_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_date_selection)],
-                States.SELECTING_WORK: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_work_selection)],
-                States.SHOWER_WORK: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_work)],
-                States.MIRROR_WORK: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_work)],
-                States.OTHER_WORK: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_work)],
-                States.ADDITIONAL_SERVICES: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_additional)],
-                States.MIRROR_QUANTITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_mirror_quantity)],
-                States.ADD_ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_address)],
-                States.ADD_COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_comment)],
-                States.ADD_MORE_WORK: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_add_more)],
-                States.VIEWING_ENTRIES: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_view_entries)],
-                States.DELETING_ENTRY: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_delete_entry)],
-                States.SETTINGS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_settings)],
-                States.SETTING_WORK_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_work_days)],
-                States.CONFIRM_DELETE_LAST: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_confirm_delete_last)],
-                States.CONFIRM_DELETE_ENTRY: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_confirm_delete_entry)]
-            },
-            fallbacks=[CommandHandler("cancel", cancel)],
-            name="main_conversation",
-            persistent=True,
-        )
+        # Состояния диалогов хранятся в основной БД построчно; старый pickle-файл переносится один раз
+        import_pickle_file(db.sync, os.path.abspath('conversation_states.pickle'))
 
-        application.add_handler(conv_handler)
+        if BOT_WORKERS > 1:
+            logger.info(f"Бот запущен в {BOT_WORKERS} процессах")
+            run_sharded(run_worker, BOT_WORKERS, TOKEN)
+            return
 
-        # Запускаем бэкапы в отдельном потоке
-        backup_thread = threading.Thread(target=auto_backup, daemon=True)
-        backup_thread.start()
-
-        # Запускаем самотестирование при старте
-        async def post_init(application: Application) -> None:
-            bot = application.bot
-            success = await self_test(bot)
-            if success:
-                logger.info("Self-test passed")
-            else:
-                logger.error("Self-test failed")
-
-            # Запускаем периодическую проверку здоровья
-            asyncio.create_task(periodic_health_check(bot))
-
-        application.post_init = post_init
+        application = build_application()
+        start_background_jobs()
 
         logger.info("Бот запущен")
 
-        # Запускаем с очисткой обновлений
+        if WEBHOOK_URL:
+            try:
+                asyncio.run(run_webhook(application))
+                return
+            except (OSError, TelegramError) as e:
+                logger.error(f"Режим webhook недоступен ({e}), переход на long polling")
+
+        # Запускаем с очисткой обновлений (webhook при этом снимается)
         application.run_polling(
             drop_pending_updates=True,
             close_loop=False,
@@ -0,0 +1,242 @@
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, сек.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+def _labels_text(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Metrics:
+    """Реестр метрик процесса: гистограммы задержек, счетчики и значения,
+    вычисляемые при выгрузке (например, попадания в кэши).
+
+    Метрика идентифицируется именем и набором меток. Запись потокобезопасна:
+    обращения к БД измеряются в потоках пула.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.callbacks = {}
+        self.help = {}
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def register_callback(self, name: str, func, **labels):
+        """Значение, которое читается вызовом func в момент выгрузки метрик"""
+        self.callbacks[(name, tuple(sorted(labels.items())))] = func
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        """Выгрузка в текстовом формате Prometheus"""
+        with self.lock:
+            histograms = [(key, list(h.counts), h.count, h.sum) for key, h in self.histograms.items()]
+            counters = list(self.counters.items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), counts, count, total in sorted(histograms):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels_text(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels_text(labels)} {count}")
+
+        for (name, labels), value in sorted(counters):
+            header(name, "counter")
+            lines.append(f"{name}{_labels_text(labels)} {value}")
+
+        for (name, labels), func in sorted(self.callbacks.items(), key=lambda item: item[0]):
+            try:
+                value = func()
+            except Exception as e:
+                logger.error(f"Ошибка чтения метрики {name}: {e}")
+                continue
+            header(name, "gauge")
+            lines.append(f"{name}{_labels_text(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self, limit: int = 15) -> str:
+        """Краткая сводка для администратора: самые затратные по суммарному времени"""
+        with self.lock:
+            rows = [
+                (h.sum, name, labels, h.count, h.quantile(0.5), h.quantile(0.99))
+                for (name, labels), h in self.histograms.items()
+            ]
+        rows.sort(reverse=True)
+
+        lines = ["📈 Метрики (всего с, вызовов, p50/p99 мс):"]
+        for total, name, labels, count, p50, p99 in rows[:limit]:
+            label = ",".join(str(value) for _, value in labels)
+            lines.append(f"{name.replace('bot_', '')}[{label}]: {total:.2f}с, {count}, {p50 * 1000:g}/{p99 * 1000:g}")
+
+        for (name, labels), func in sorted(self.callbacks.items(), key=lambda item: item[0]):
+            try:
+                lines.append(f"{name.replace('bot_', '')}[{','.join(str(v) for _, v in labels)}]: {func():g}")
+            except Exception:
+                continue
+        return "\n".join(lines)
+
+metrics = Metrics()
+metrics.describe("bot_handler_seconds", "Время обработки обновления по обработчику и состоянию")
+metrics.describe("bot_handler_errors_total", "Необработанные исключения в обработчиках")
+metrics.describe("bot_db_seconds", "Время выполнения методов SQLiteDatabase")
+metrics.describe("bot_api_seconds", "Задержка запросов к Bot API")
+metrics.describe("bot_report_build_seconds", "Время построения Excel-отчета")
+
+def instrument_handler(callback, state: str = ""):
+    """Обертка обработчика обновлений с замером времени и подсчетом ошибок"""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            metrics.inc("bot_handler_errors_total", handler=name, state=state)
+            raise
+        finally:
+            metrics.observe("bot_handler_seconds", time.perf_counter() - start, handler=name, state=state)
+    return wrapper
+
+def instrument_methods(cls, metric: str):
+    """Замер времени всех публичных методов класса (генераторы не оборачиваются)"""
+    for name, func in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(func) or inspect.isgeneratorfunction(func):
+            continue
+
+        def make_wrapper(func, name):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    metrics.observe(metric, time.perf_counter() - start, method=name)
+            return wrapper
+
+        setattr(cls, name, make_wrapper(func, name))
+    return cls
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTP-клиент Bot API с замером задержки по методу API и коду ответа"""
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        # Последний сегмент URL - имя метода (sendMessage и т.п.), токен в метки не попадает
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        status = "error"
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            status = str(code)
+            return code, payload
+        finally:
+            metrics.observe("bot_api_seconds", time.perf_counter() - start, method=api_method, status=status)
+
+_server = None
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки запроса не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", metrics.render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host: str, port: int):
+    """Локальный HTTP-эндпоинт /metrics для Prometheus"""
+    global _server
+    server = _server = await asyncio.start_server(_serve_metrics, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду всего и ~1 сообщение в секунду в один чат
+GLOBAL_RATE = 25
+PER_CHAT_INTERVAL = 1.0
+
+class RateLimitedSender:
+    """Очередь исходящих сообщений с учетом лимитов Telegram.
+
+    Общий поток ограничен global_rate сообщениями в секунду, сообщения в один
+    чат разносятся не чаще per_chat_interval. При RetryAfter вся отправка
+    приостанавливается на указанное Telegram время, сообщение повторяется.
+    Повторяются также сетевые ошибки; отказ Telegram (Forbidden, BadRequest)
+    не повторяется, чтобы не тратить лимит на заведомо неудачные отправки.
+    """
+    def __init__(self, bot, global_rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL,
+                 workers=4, max_retries=3, on_forbidden=None):
+        self.bot = bot
+        self.interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self.on_forbidden = on_forbidden
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._chat_next_slot = {}
+
+    async def _acquire(self, chat_id):
+        """Резервирование времени отправки с учетом общего и личного лимитов"""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot, self._paused_until, self._chat_next_slot.get(chat_id, 0.0))
+            self._next_slot = slot + self.interval
+            self._chat_next_slot[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _send(self, chat_id, kwargs) -> bool:
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, **kwargs)
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                logger.warning(f"Превышен лимит запросов, пауза {retry_after} сек.")
+                async with self._lock:
+                    self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + retry_after)
+            except Forbidden as e:
+                logger.info(f"Чат {chat_id} недоступен для отправки: {e}")
+                if self.on_forbidden:
+                    await self.on_forbidden(chat_id)
+                return False
+            except BadRequest as e:
+                logger.error(f"Ошибка отправки в чат {chat_id}: {e}")
+                return False
+            except NetworkError as e:
+                # Включая TimedOut; BadRequest - тоже NetworkError, поэтому обработан выше
+                logger.error(f"Ошибка отправки в чат {chat_id} (попытка {attempt + 1}): {e}")
+            except TelegramError as e:
+                logger.error(f"Ошибка отправки в чат {chat_id}: {e}")
+                return False
+        return False
+
+    async def send_all(self, messages) -> tuple:
+        """Отправка списка (chat_id, параметры send_message). Возвращает (отправлено, ошибок)"""
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+        results = []
+
+        async def worker():
+            while True:
+                try:
+                    chat_id, kwargs = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results.append(await self._send(chat_id, kwargs))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, queue.qsize()) or 1)))
+        sent = sum(results)
+        return sent, len(results) - sent
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pickle
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = "user"
+CHAT_DATA = "chat"
+BOT_DATA = "bot"
+CALLBACK_DATA = "callback"
+CONVERSATION_PREFIX = "conversation:"
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+class SQLitePersistence(BasePersistence):
+    """Хранение данных диалогов в SQLite построчно: одна строка на пользователя,
+    чат или состояние диалога.
+
+    Application раз в update_interval передает только затронутые ключи; из них
+    в БД попадают лишь те, чьи данные действительно изменились (сравнение по
+    хэшу последней записанной версии), и все они пишутся одной транзакцией.
+    Стоимость сохранения зависит от числа активных пользователей, а при сбое
+    теряется не больше одного интервала.
+    """
+    def __init__(self, database, store_data: PersistenceInput = None, update_interval: float = 60):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.database = database
+        self._written = {}  # (вид, ключ) -> хэш записанных данных
+        self._pending = {}  # (вид, ключ) -> (данные или None для удаления, хэш)
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+
+    def _load(self, kind: str) -> dict:
+        loaded = {}
+        for key, blob in self.database.load_persisted(kind):
+            try:
+                loaded[key] = pickle.loads(blob)
+            except Exception as e:
+                logger.error(f"Не удалось прочитать данные диалога {kind}:{key}: {e}")
+                continue
+            self._written[(kind, key)] = _digest(blob)
+        return loaded
+
+    def _mark(self, kind: str, key: str, value=None):
+        """Постановка изменения в очередь; запись выполняется одной транзакцией на пакет"""
+        blob = None if value is None else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = None if blob is None else _digest(blob)
+        if (kind, key) not in self._pending and self._written.get((kind, key)) == digest:
+            return
+        self._pending[(kind, key)] = (blob, digest)
+        # Application обновляет ключи пачкой параллельных корутин: задача записи
+        # стартует после них и забирает весь пакет разом
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def _write_pending(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            upserts, deletes = [], []
+            for (kind, key), (blob, digest) in pending.items():
+                if blob is None:
+                    deletes.append((kind, key))
+                    self._written.pop((kind, key), None)
+                else:
+                    upserts.append((kind, key, blob))
+                    self._written[(kind, key)] = digest
+
+            if await asyncio.to_thread(self.database.save_persisted, upserts, deletes):
+                logger.debug(f"Данные диалогов сохранены: {len(upserts)} изменено, {len(deletes)} удалено")
+            else:
+                # Не записанное возвращаем в очередь, более новые изменения не затираем
+                for item, value in pending.items():
+                    self._pending.setdefault(item, value)
+
+    async def get_user_data(self) -> dict:
+        return {int(key): data for key, data in self._load(USER_DATA).items()}
+
+    async def get_chat_data(self) -> dict:
+        return {int(key): data for key, data in self._load(CHAT_DATA).items()}
+
+    async def get_bot_data(self) -> dict:
+        return self._load(BOT_DATA).get("", {})
+
+    async def get_callback_data(self):
+        return self._load(CALLBACK_DATA).get("")
+
+    async def get_conversations(self, name: str) -> dict:
+        return {
+            tuple(json.loads(key)): state
+            for key, state in self._load(CONVERSATION_PREFIX + name).items()
+        }
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        self._mark(CONVERSATION_PREFIX + name, json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._mark(USER_DATA, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._mark(CHAT_DATA, str(chat_id), data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._mark(BOT_DATA, "", data)
+
+    async def update_callback_data(self, data) -> None:
+        self._mark(CALLBACK_DATA, "", data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark(USER_DATA, str(user_id))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark(CHAT_DATA, str(chat_id))
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Запись оставшихся изменений при остановке бота"""
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        await self._write_pending()
+
+def import_pickle_file(database, path: str) -> bool:
+    """Однократный перенос данных из файла PicklePersistence в SQLite.
+    Файл после переноса переименовывается в <path>.imported"""
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+
+        upserts = []
+        def add(kind, key, value):
+            upserts.append((kind, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+
+        for user_id, user_data in (data.get("user_data") or {}).items():
+            add(USER_DATA, str(user_id), user_data)
+        for chat_id, chat_data in (data.get("chat_data") or {}).items():
+            add(CHAT_DATA, str(chat_id), chat_data)
+        if data.get("bot_data"):
+            add(BOT_DATA, "", data["bot_data"])
+        for name, conversations in (data.get("conversations") or {}).items():
+            for key, state in conversations.items():
+                add(CONVERSATION_PREFIX + name, json.dumps(list(key)), state)
+
+        if not database.save_persisted(upserts, []):
+            return False
+        os.replace(path, f"{path}.imported")
+        logger.info(f"Данные диалогов перенесены из {path}: {len(upserts)} строк")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка переноса данных диалогов из {path}: {e}")
+        return False
@@ -0,0 +1,151 @@
+import calendar
+import logging
+import tempfile
+import threading
+import datetime as dt
+from collections import OrderedDict
+from itertools import chain
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+from config import MONTHS_GENITIVE
+
+logger = logging.getLogger(__name__)
+
+REPORT_HEADERS = ["Дата", "Адрес", "Вид работы", "Комментарий"]
+REPORT_COLUMN_WIDTHS = {"A": 12, "B": 30, "C": 50, "D": 30}
+# Сводные листы: название, заголовки, ключ в get_report_summary, ширины столбцов
+SUMMARY_SHEETS = (
+    ("По дням", ["Дата", "Групп работ", "Работ"], "by_day", (12, 14, 10)),
+    ("По видам работ", ["Вид работы", "Количество"], "by_work", (50, 12)),
+    ("По адресам", ["Адрес", "Групп работ", "Работ"], "by_address", (40, 14, 10)),
+)
+REPORT_PERIODS = ("Текущий месяц", "Предыдущий месяц", "Текущий год", "Весь период")
+# Отчет держится в памяти до этого размера, затем сбрасывается во временный файл
+SPOOL_MAX_SIZE = 1024 * 1024
+
+def _month_range(year: int, month: int) -> tuple:
+    last_day = calendar.monthrange(year, month)[1]
+    return (f"01.{month:02d}.{year}", f"{last_day:02d}.{month:02d}.{year}")
+
+def resolve_report_period(choice: str, now: dt.datetime) -> tuple:
+    """Период отчета по кнопке: (диапазон дат или None, метка для имени файла, подпись)"""
+    if choice == "Текущий месяц":
+        month_name = MONTHS_GENITIVE[now.month]
+        return _month_range(now.year, now.month), f"{month_name}_{now.year}", f"{month_name} {now.year}"
+    if choice == "Предыдущий месяц":
+        year, month = (now.year - 1, 12) if now.month == 1 else (now.year, now.month - 1)
+        month_name = MONTHS_GENITIVE[month]
+        return _month_range(year, month), f"{month_name}_{year}", f"{month_name} {year}"
+    if choice == "Текущий год":
+        return (f"01.01.{now.year}", f"31.12.{now.year}"), f"{now.year}", f"{now.year} год"
+    if choice == "Весь период":
+        return None, "все_время", "все время"
+    raise ValueError(f"Неизвестный период отчета: {choice}")
+
+def parse_custom_period(text: str) -> tuple:
+    """Разбор периода 'ДД.ММ.ГГГГ - ДД.ММ.ГГГГ': (диапазон, метка, подпись)"""
+    parts = [part.strip() for part in text.replace("—", "-").split("-")]
+    if len(parts) != 2:
+        raise ValueError("Ожидается два значения даты")
+    start, end = (dt.datetime.strptime(part, "%d.%m.%Y") for part in parts)
+    if start > end:
+        start, end = end, start
+    start_str, end_str = start.strftime("%d.%m.%Y"), end.strftime("%d.%m.%Y")
+    return (start_str, end_str), f"{start_str}-{end_str}", f"{start_str} - {end_str}"
+
+def _append_header(ws, titles):
+    header_font = Font(bold=True)
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    header = []
+    for title in titles:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = header_font
+        cell.alignment = header_alignment
+        header.append(cell)
+    ws.append(header)
+
+def build_excel_report(database, user_id: str, date_range: tuple = None):
+    """Потоковая генерация Excel-отчета за период (None - вся история).
+
+    Строки пишутся в книгу в режиме write-only прямо из курсора БД, который уже
+    отдает записи в порядке дат, поэтому расход памяти не зависит от объема
+    истории. Возвращает файловый объект с отчетом или None, если записей нет.
+    Функция блокирующая и должна вызываться вне цикла событий.
+    """
+    entries = database.iter_entries(user_id, date_range)
+    first = next(entries, None)
+    if first is None:
+        return None
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Отчет о работах")
+
+    for column, width in REPORT_COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+
+    _append_header(ws, REPORT_HEADERS)
+
+    rows_count = 0
+    for entry in chain([first], entries):
+        ws.append([
+            entry["date"],
+            entry.get("address", ""),
+            ", ".join(entry["works"]),
+            entry.get("comment", "")
+        ])
+        rows_count += 1
+
+    # Сводные листы считаются агрегатными запросами на стороне БД
+    summary = database.get_report_summary(user_id, date_range)
+    for title, headers, key, widths in SUMMARY_SHEETS:
+        summary_ws = wb.create_sheet(title)
+        for index, width in enumerate(widths, 1):
+            summary_ws.column_dimensions[get_column_letter(index)].width = width
+        _append_header(summary_ws, headers)
+        for row in summary[key]:
+            summary_ws.append(list(row))
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    wb.save(buffer)
+    buffer.seek(0)
+    logger.info(f"Отчет для {user_id}: {rows_count} строк")
+    return buffer
+
+class ReportCache:
+    """LRU-кэш отправленных отчетов: (пользователь, период) -> версия данных и file_id Telegram.
+
+    Пока версия данных пользователя не изменилась, отчет повторно отправляется
+    по file_id без генерации и без загрузки файла.
+    """
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, period: str, version: int):
+        with self.lock:
+            cached = self.cache.get((user_id, period))
+            if cached and cached[0] == version:
+                self.cache.move_to_end((user_id, period))
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            return None
+
+    def put(self, user_id: str, period: str, version: int, file_id: str):
+        with self.lock:
+            # Запись для устаревшей версии того же периода заменяется
+            self.cache[(user_id, period)] = (version, file_id)
+            self.cache.move_to_end((user_id, period))
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def invalidate(self, user_id: str, period: str = None):
+        with self.lock:
+            keys = [key for key in self.cache if key[0] == user_id and (period is None or key[1] == period)]
+            for key in keys:
+                del self.cache[key]
@@ -0,0 +1,35 @@
+def normalize(text: str) -> str:
+    """Ключ маршрута: регистр и лишние пробелы не важны"""
+    return " ".join(text.split()).casefold()
+
+class RoutingTable:
+    """Выбор действия по тексту кнопки для одного состояния диалога.
+
+    Таблица собирается один раз при импорте, поиск действия - одно обращение
+    к словарю по нормализованному тексту. fallback(text) вызывается только
+    для текста, не совпавшего ни с одной кнопкой (например, ручной ввод).
+    """
+    def __init__(self, routes: dict, fallback=None):
+        self.routes = {}
+        for text, action in routes.items():
+            key = normalize(text)
+            if key in self.routes:
+                raise ValueError(f"Кнопка '{text}' повторяется в таблице маршрутов")
+            self.routes[key] = action
+        self.fallback = fallback
+
+    def resolve(self, text: str):
+        action = self.routes.get(normalize(text))
+        if action is None and self.fallback is not None:
+            action = self.fallback(text)
+        return action
+
+def substring_matcher(routes: dict):
+    """Запасной поиск: первая кнопка, текст которой входит в сообщение.
+    Сохраняет прежнее поведение главного меню для набранного вручную текста"""
+    items = tuple((normalize(text), action) for text, action in routes.items())
+
+    def match(text: str):
+        text = normalize(text)
+        return next((action for key, action in items if key in text), None)
+    return match
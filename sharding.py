@@ -0,0 +1,390 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from telegram import Bot, Update
+from telegram.error import Conflict, NetworkError, RetryAfter, TelegramError
+from config import LEADER_LOCK_TTL, INVALIDATION_POLL_INTERVAL, LOG_FILE_PATH, METRICS_PORT, WEBHOOK_URL
+from update_processor import UserLaneUpdateProcessor
+from webhook import WebhookServer, read_settings
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK = "scheduler"
+POLL_TIMEOUT = 30  # сек., long polling в родительском процессе
+INVALIDATION_MAX_AGE = 3600  # сек., сколько хранится журнал сброса кэшей
+
+_election = None
+
+def shard_for(key, workers: int) -> int:
+    """Номер процесса для пользователя; crc32 не зависит от PYTHONHASHSEED и одинаков во всех процессах"""
+    return zlib.crc32(str(key).encode("utf-8")) % workers
+
+def is_leader() -> bool:
+    """Выполнять ли в этом процессе общие задания (бэкапы, рассылку, обслуживание).
+    Без выборов лидера (бот в одном процессе) - всегда да"""
+    return _election is None or _election.is_leader
+
+class LeaderElection:
+    """Выбор лидера среди процессов бота через блокировку в общей БД.
+
+    Лидер продлевает блокировку каждые ttl/3 секунд. Если он завис или упал,
+    блокировку через ttl забирает другой процесс. Сам лидер считает себя
+    лидером только до конца срока последнего успешного продления, поэтому
+    двух лидеров одновременно не бывает даже при зависшей БД.
+    """
+    def __init__(self, database, owner: str, name: str = LEADER_LOCK, ttl: float = LEADER_LOCK_TTL):
+        self.database = database
+        self.owner = owner
+        self.name = name
+        self.ttl = ttl
+        self._leader = False
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader and time.monotonic() < self._valid_until
+
+    def renew(self) -> bool:
+        started = time.monotonic()
+        leader = self.database.acquire_leadership(self.name, self.owner, self.ttl)
+        if leader:
+            self._valid_until = started + self.ttl
+        if leader != self._leader:
+            logger.info(f"Процесс {self.owner} {'стал лидером' if leader else 'больше не лидер'}")
+        self._leader = leader
+        return leader
+
+    def start(self):
+        global _election
+        _election = self
+        self.renew()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.renew()
+            except Exception as e:
+                logger.error(f"Ошибка продления блокировки лидера: {e}")
+
+    def stop(self):
+        global _election
+        self._stop.set()
+        if self._leader:
+            self.database.release_leadership(self.name, self.owner)
+        self._leader = False
+        _election = None
+
+class InvalidationPoller:
+    """Применение сбросов кэшей, записанных в БД другими процессами.
+
+    handlers - кэш -> функция сброса с ключом (None - весь кэш). Свои записи
+    пропускаются: процесс сбрасывает кэш сразу при изменении. Лидер заодно
+    удаляет из журнала старые записи.
+    """
+    def __init__(self, database, handlers: dict, interval: float = INVALIDATION_POLL_INTERVAL):
+        self.database = database
+        self.handlers = handlers
+        self.interval = interval
+        self.last_id = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # Кэши нового процесса пусты: старые записи журнала применять незачем
+        self.last_id = self.database.get_last_invalidation_id()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def poll(self) -> int:
+        applied = 0
+        for invalidation_id, cache, key, origin in self.database.get_invalidations(self.last_id):
+            self.last_id = invalidation_id
+            handler = self.handlers.get(cache)
+            if handler is None or origin == self.database.invalidation_origin:
+                continue
+            handler(key)
+            applied += 1
+        return applied
+
+    def _run(self):
+        last_prune = 0.0
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+                if is_leader() and time.monotonic() - last_prune > INVALIDATION_MAX_AGE:
+                    self.database.prune_invalidations(INVALIDATION_MAX_AGE)
+                    last_prune = time.monotonic()
+            except Exception as e:
+                logger.error(f"Ошибка применения сбросов кэша: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+class WorkerPool:
+    """Процессы-обработчики с очередью обновлений и очередью подтверждений у каждого.
+
+    Обработчик подтверждает update_id после обработки, а родитель до этого
+    хранит обновление у себя. Упавший обработчик перезапускается с новыми
+    очередями: блокировку чтения старой очереди мог унести с собой убитый
+    процесс. Все неподтвержденные обновления отправляются заново, поэтому
+    они не теряются; последние из них могут обработаться повторно.
+    target(index, workers, inbox, acks) - точка входа обработчика.
+    """
+    def __init__(self, target, workers: int, context=None):
+        self.target = target
+        self.workers = workers
+        self.context = context or multiprocessing.get_context("spawn")
+        self.inboxes = [None] * workers
+        self.acks = [None] * workers
+        self.processes = [None] * workers
+        self.pending = [OrderedDict() for _ in range(workers)]
+
+    def start(self):
+        for index in range(self.workers):
+            self.spawn(index)
+
+    def spawn(self, index: int):
+        old_queues = (self.inboxes[index], self.acks[index])
+        inbox, acks = self.context.Queue(), self.context.Queue()
+        for data in self.pending[index].values():
+            inbox.put(data)
+
+        with _worker_environment(index):
+            process = self.context.Process(
+                target=self.target, args=(index, self.workers, inbox, acks), name=f"bot-worker-{index}"
+            )
+            process.start()
+        self.inboxes[index], self.acks[index], self.processes[index] = inbox, acks, process
+
+        for old in old_queues:
+            if old is not None:
+                # Читатель мертв: не ждем выгрузки буфера в канал при завершении родителя
+                old.cancel_join_thread()
+                old.close()
+        logger.info(f"Запущен обработчик {index} (pid {process.pid}), "
+                    f"повторно отправлено обновлений: {len(self.pending[index])}")
+
+    def send(self, index: int, update_id: int, data: dict):
+        self.pending[index][update_id] = data
+        # multiprocessing.Queue не ограничена, put не блокирует цикл событий
+        self.inboxes[index].put(data)
+
+    def collect_acks(self):
+        for index, acks in enumerate(self.acks):
+            while True:
+                try:
+                    update_id = acks.get_nowait()
+                except queue.Empty:
+                    break
+                self.pending[index].pop(update_id, None)
+
+    def check(self):
+        """Учет подтверждений и перезапуск завершившихся обработчиков"""
+        self.collect_acks()
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                logger.error(f"Обработчик {index} завершился с кодом {process.exitcode}, перезапуск")
+                self.spawn(index)
+
+    def stop(self, timeout: float = 60):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for index, process in enumerate(self.processes):
+            process.join(timeout=timeout)
+            if process.is_alive():
+                logger.error(f"Обработчик {index} не остановился, принудительное завершение")
+                process.terminate()
+
+class UpdateRouter:
+    """Распределение обновлений по процессам-обработчикам по хэшу пользователя.
+
+    Обновления одного пользователя всегда попадают в один процесс, поэтому его
+    диалог, user_data и кэши живут только там. Подставляется в WebhookServer
+    вместо Application: у роутера есть bot и update_queue с put().
+    """
+    def __init__(self, bot: Bot, pool: WorkerPool):
+        self.bot = bot
+        self.pool = pool
+        self.update_queue = self
+        self.routed = [0] * pool.workers
+
+    def shard(self, update: Update) -> int:
+        key = UserLaneUpdateProcessor.lane_key(update)
+        return shard_for(key[1], self.pool.workers) if key else 0
+
+    async def put(self, update: Update):
+        index = self.shard(update)
+        self.pool.send(index, update.update_id, update.to_dict())
+        self.routed[index] += 1
+
+async def serve_inbox(application, inbox, acks=None):
+    """Цикл процесса-обработчика: обновления читаются из очереди родителя до
+    сигнала остановки (None) или завершения родительского процесса.
+
+    Обработка идет через update_processor приложения (порядок по пользователю
+    сохраняется), update_id подтверждается в acks после обработки.
+    """
+    loop = asyncio.get_running_loop()
+    parent = multiprocessing.parent_process()
+    tasks = set()
+
+    async def process(update: Update):
+        try:
+            await application.process_update(update)
+        finally:
+            if acks is not None:
+                acks.put(update.update_id)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            while True:
+                try:
+                    data = await loop.run_in_executor(None, inbox.get, True, 1.0)
+                except queue.Empty:
+                    if parent is not None and not parent.is_alive():
+                        logger.error("Родительский процесс завершился, остановка обработчика")
+                        break
+                    continue
+                if data is None:
+                    break
+                try:
+                    update = Update.de_json(data, application.bot)
+                except Exception as e:
+                    logger.error(f"Некорректное обновление от родительского процесса: {e}")
+                    continue
+                task = loop.create_task(application.update_processor.process_update(update, process(update)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await application.stop()
+
+def worker_log_path(index: int) -> str:
+    root, ext = os.path.splitext(LOG_FILE_PATH)
+    return f"{root}.worker{index}{ext}"
+
+@contextmanager
+def _worker_environment(index: int):
+    """Окружение процесса-обработчика: свой файл лога и свой порт метрик.
+    Процессы запускаются через spawn и читают config заново из окружения"""
+    overrides = {
+        "BOT_LOG_PATH": worker_log_path(index),
+        "METRICS_PORT": str(METRICS_PORT + 1 + index if METRICS_PORT else 0),
+    }
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+async def _poll_updates(bot: Bot, router: UpdateRouter):
+    """Long polling в родительском процессе с распределением по обработчикам"""
+    await bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    delay = 1
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES)
+            delay = 1
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except Conflict:
+            logger.critical("Конфликт: запущено несколько экземпляров бота! Завершение работы.")
+            return
+        except (NetworkError, TelegramError) as e:
+            logger.warning(f"Ошибка получения обновлений: {e}, повтор через {delay} сек.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+            continue
+
+        for update in updates:
+            await router.put(update)
+            offset = update.update_id + 1
+
+def run_sharded(worker_target, workers: int, token: str):
+    """Запуск бота в нескольких процессах.
+
+    Родительский процесс только принимает обновления (long polling или webhook)
+    и раскладывает их по очередям обработчиков, следит за ними и перезапускает
+    упавшие (см. WorkerPool: неподтвержденные обновления отправляются заново).
+    worker_target(index, workers, inbox, acks) - точка входа обработчика.
+    """
+    pool = WorkerPool(worker_target, workers)
+
+    async def supervise(stop_event: asyncio.Event):
+        while not stop_event.is_set():
+            pool.check()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def serve():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, stop_event.set)
+            loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+        except (NotImplementedError, AttributeError):
+            # Windows: сигналов нет, остановка по Ctrl+C через KeyboardInterrupt
+            pass
+
+        async with Bot(token=token) as bot:
+            router = UpdateRouter(bot, pool)
+            server = None
+            if WEBHOOK_URL:
+                server = WebhookServer(router, read_settings())
+                try:
+                    await server.start()
+                    await server.register()
+                    ingest = loop.create_task(stop_event.wait())
+                except (OSError, TelegramError) as e:
+                    logger.error(f"Режим webhook недоступен ({e}), переход на long polling")
+                    await server.stop()
+                    server = None
+            if server is None:
+                ingest = loop.create_task(_poll_updates(bot, router))
+
+            supervisor = loop.create_task(supervise(stop_event))
+            try:
+                await asyncio.wait(
+                    [ingest, loop.create_task(stop_event.wait())], return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                stop_event.set()
+                ingest.cancel()
+                if server:
+                    await server.stop()
+                await supervisor
+                logger.info(f"Распределено обновлений по обработчикам: {router.routed}")
+
+    pool.start()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Остановка обработчиков")
+        pool.stop()
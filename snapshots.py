@@ -0,0 +1,114 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import datetime as dt
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".db.gz"
+CHUNK_SIZE = 1024 * 1024
+# Сколько раз пошаговое копирование может начаться заново из-за записи в базу
+MAX_BACKUP_RESTARTS = 3
+
+class _BackupRestarted(Exception):
+    pass
+
+def _snapshot_prefix(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0] + "-"
+
+def _backup(src, dst, pages: int, sleep: float, max_restarts: int = MAX_BACKUP_RESTARTS):
+    """Онлайн-бэкап порциями по pages страниц.
+
+    Запись в базу через другое соединение между порциями начинает копирование
+    заново (остаток страниц перестает уменьшаться). После max_restarts таких
+    повторов база копируется за один шаг: в режиме WAL чтение не блокирует
+    запись, а снимок получается согласованным на момент начала шага.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _BackupRestarted()
+        last_remaining = remaining
+
+    try:
+        src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+    except _BackupRestarted:
+        logger.warning(f"Копирование снимка начиналось заново {restarts} раз(а), копируем за один шаг")
+        src.backup(dst, pages=-1)
+
+def create_snapshot(db_path: str, directory: str, pages: int = 1024, sleep: float = 0.05) -> str:
+    """Снимок всей базы через онлайн-бэкап SQLite со сжатием. Возвращает путь к файлу.
+
+    Копирование идет порциями по pages страниц с паузами между ними, поэтому
+    не требует блокировки SQLiteDatabase.lock и не мешает записи в базу.
+    При частой записи число повторов ограничено (см. _backup).
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+    target = os.path.join(directory, f"{_snapshot_prefix(db_path)}{stamp}{SNAPSHOT_SUFFIX}")
+    tmp_path = f"{target}.tmp"
+
+    try:
+        with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as src, \
+                closing(sqlite3.connect(tmp_path)) as dst:
+            _backup(src, dst, pages, sleep)
+
+        # Сжимаем потоково, не загружая файл в память целиком
+        with open(tmp_path, "rb") as f_in, gzip.open(target, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    logger.info(f"Создан снимок БД: {target} ({os.path.getsize(target)} байт)")
+    return target
+
+def list_snapshots(db_path: str, directory: str) -> list:
+    """Снимки базы в каталоге, от старых к новым"""
+    if not os.path.isdir(directory):
+        return []
+    prefix = _snapshot_prefix(db_path)
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith(SNAPSHOT_SUFFIX)
+    )
+
+def rotate_snapshots(db_path: str, directory: str, keep: int = 7):
+    """Удаление самых старых снимков сверх keep"""
+    snapshots = list_snapshots(db_path, directory)
+    for path in snapshots[:max(len(snapshots) - keep, 0)]:
+        try:
+            os.remove(path)
+            logger.info(f"Удален старый снимок БД: {path}")
+        except OSError as e:
+            logger.error(f"Ошибка удаления снимка {path}: {e}")
+
+def restore_snapshot(snapshot_path: str, db_path: str):
+    """Восстановление базы из снимка заменой файла (бот должен быть остановлен)"""
+    tmp_path = f"{db_path}.restore"
+    with gzip.open(snapshot_path, "rb") as f_in, open(tmp_path, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+
+    os.replace(tmp_path, db_path)
+    # Журнал WAL от старой базы несовместим с восстановленным файлом
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    logger.info(f"База {db_path} восстановлена из снимка {snapshot_path}")
+
+if __name__ == "__main__":
+    # Использование: python snapshots.py <снимок.db.gz> [путь_к_базе]
+    if len(sys.argv) < 2:
+        print("Использование: python snapshots.py <снимок.db.gz> [путь_к_базе]")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    restore_snapshot(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "bot_data.db")
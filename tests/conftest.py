@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Модули бота лежат в корне репозитория; config требует токен при импорте
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+# handlers открывает БД при импорте: база и лог тестов - во временном каталоге, не в репозитории
+_tmp = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ.setdefault("BOT_DB_PATH", os.path.join(_tmp, "bot_data.db"))
+os.environ.setdefault("BOT_LOG_PATH", os.path.join(_tmp, "bot.log"))
@@ -0,0 +1,41 @@
+from database import SQLiteDatabase, to_iso_date
+
+USER_ID = "7"
+
+
+def key(entry):
+    return entry["date_iso"], entry["id"]
+
+
+def test_keyset_pages_forward_and_back_across_equal_dates(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / "pages.db"))
+    # Несколько записей на одну дату: граница страницы приходится внутрь дня
+    for date in ["01.03.2026"] * 3 + ["02.03.2026"] * 3 + ["10.02.2026"]:
+        database.add_entry(USER_ID, {"date": date, "works": ["Навес"]})
+    database.add_entry("other", {"date": "02.03.2026", "works": ["Навес"]})
+
+    expected = sorted(
+        ((to_iso_date(entry["date"]), entry["id"]) for entry in database.get_entries(USER_ID)),
+        reverse=True,
+    )
+    assert len(expected) == 7
+
+    pages = []
+    entries, has_more = database.get_entries_page(USER_ID, 2)
+    pages.append([key(entry) for entry in entries])
+    while has_more:
+        entries, has_more = database.get_entries_page(USER_ID, 2, key(entries[-1]))
+        pages.append([key(entry) for entry in entries])
+    assert [item for page in pages for item in page] == expected
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+
+    # Обратно от последней страницы: те же страницы в обратном порядке
+    back = [pages[-1]]
+    first = pages[-1][0]
+    while True:
+        entries, has_more = database.get_entries_page(USER_ID, 2, first, backward=True)
+        back.append([key(entry) for entry in entries])
+        first = key(entries[0])
+        if not has_more:
+            break
+    assert back[::-1] == pages
@@ -0,0 +1,26 @@
+from telegram import ReplyKeyboardMarkup
+
+from keyboards import create_keyboard, main_keyboard, settings_inline_keyboard
+
+def test_to_dict_matches_ptb_serialization():
+    keyboard = main_keyboard()
+    assert keyboard.to_dict() == ReplyKeyboardMarkup.to_dict(keyboard)
+
+def test_changing_to_dict_result_does_not_affect_next_call():
+    keyboard = create_keyboard(["Один", "Два"])
+    first = keyboard.to_dict()
+    first["keyboard"][0][0]["text"] = "Изменено"
+    first["resize_keyboard"] = False
+    first["extra"] = 1
+
+    second = keyboard.to_dict()
+    assert second["keyboard"][0][0]["text"] == "Один"
+    assert second["resize_keyboard"] is True
+    assert "extra" not in second
+    # Кэшированная клавиатура возвращается та же, и ее сериализация не испорчена
+    assert create_keyboard(["Один", "Два"]).to_dict() == second
+
+def test_inline_keyboard_to_dict_is_a_fresh_copy():
+    keyboard = settings_inline_keyboard()
+    keyboard.to_dict()["inline_keyboard"].clear()
+    assert keyboard.to_dict()["inline_keyboard"]
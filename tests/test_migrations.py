@@ -0,0 +1,109 @@
+import json
+import sqlite3
+from contextlib import closing
+
+from database import SQLiteDatabase
+
+# Схема исходной версии бота (до миграций, user_version = 0)
+BASELINE_SCHEMA = """
+    CREATE TABLE entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        works TEXT NOT NULL,
+        address TEXT,
+        comment TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE settings (
+        user_id TEXT PRIMARY KEY,
+        reminders BOOLEAN DEFAULT 1,
+        work_days TEXT NOT NULL,
+        vacation_mode BOOLEAN DEFAULT 0
+    );
+    CREATE TABLE backups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        backup_data TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_entries_user_date ON entries(user_id, date);
+    CREATE INDEX idx_entries_user_id ON entries(user_id);
+"""
+
+ENTRIES = [
+    ("1", "05.03.2026", ["Навес (x2)", "Гидрофобное"]),
+    ("1", "05.03.2026", ["Навес"]),
+    ("1", "28.02.2026", ["Угловая распашка", "1 полочка"]),
+    ("2", "01.03.2026", ["Трапеция"]),
+    ("1", "01.03.2026", ["Навес (x2)"]),
+]
+
+
+def make_baseline_db(path: str):
+    with closing(sqlite3.connect(path)) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO entries (user_id, date, works, address, comment) VALUES (?, ?, ?, '', '')",
+            [(user_id, date, json.dumps(works)) for user_id, date, works in ENTRIES]
+        )
+        conn.execute("INSERT INTO settings VALUES ('1', 1, '[0, 1, 2, 3, 4]', 0)")
+        conn.commit()
+
+
+def schema_version(database) -> int:
+    with database._reader() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def check_migrated(database):
+    assert schema_version(database) == len(SQLiteDatabase.MIGRATIONS)
+    entries = database.get_entries("1", ("01.03.2026", "31.03.2026"))
+    assert sorted(entry["date"] for entry in entries) == ["01.03.2026", "05.03.2026", "05.03.2026"]
+    assert sorted(work for entry in entries for work in entry["works"]) == \
+        ["Гидрофобное", "Навес", "Навес (x2)", "Навес (x2)"]
+
+    stats = database.get_monthly_stats("1", "2026-03")
+    assert stats["total_groups"] == 3
+    assert stats["works"] == {"Навес (x2)": 2, "Навес": 1, "Гидрофобное": 1}
+    assert database.get_monthly_stats("1", "2026-02")["total_groups"] == 1
+    assert database.get_settings("1")["work_days"] == [0, 1, 2, 3, 4]
+
+
+def test_baseline_database_is_migrated(tmp_path, monkeypatch):
+    path = str(tmp_path / "baseline.db")
+    make_baseline_db(path)
+    # Маленькие пакеты: перенос данных идет в несколько транзакций
+    monkeypatch.setattr(SQLiteDatabase, "MIGRATION_BATCH_SIZE", 2)
+
+    check_migrated(SQLiteDatabase(path))
+    # Повторное открытие ничего не применяет заново
+    check_migrated(SQLiteDatabase(path))
+
+
+class FailingDatabase(SQLiteDatabase):
+    """Сбой переноса работ (миграция 4) после первого пакета"""
+    fail_after = 2
+
+    def _insert_works(self, conn, entry_id: int, works: list) -> list:
+        if entry_id > self.fail_after:
+            raise sqlite3.OperationalError("disk I/O error")
+        return super()._insert_works(conn, entry_id, works)
+
+
+def test_rerun_after_failed_migration(tmp_path, monkeypatch):
+    path = str(tmp_path / "baseline.db")
+    make_baseline_db(path)
+    monkeypatch.setattr(SQLiteDatabase, "MIGRATION_BATCH_SIZE", 2)
+
+    failed = FailingDatabase(path)
+    # Версия осталась у последней завершенной миграции, первый пакет уже перенесен
+    assert schema_version(failed) == SQLiteDatabase.MIGRATIONS.index("_migrate_entry_works")
+    with failed._reader() as conn:
+        assert conn.execute("SELECT COUNT(DISTINCT entry_id) FROM entry_works").fetchone()[0] == 2
+    failed.close()
+
+    database = SQLiteDatabase(path)
+    check_migrated(database)
+    with database._reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM entry_works").fetchone()[0] == 7
@@ -0,0 +1,74 @@
+import asyncio
+
+from database import SQLiteDatabase
+from persistence import SQLitePersistence
+
+
+class RecordingDatabase(SQLiteDatabase):
+    """БД, запоминающая каждую запись данных диалогов"""
+    def __init__(self, path):
+        super().__init__(path)
+        self.saves = []
+
+    def save_persisted(self, upserts: list, deletes: list) -> bool:
+        self.saves.append(([(kind, key) for kind, key, _ in upserts], list(deletes)))
+        return super().save_persisted(upserts, deletes)
+
+
+def test_round_trip(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / "persistence.db"))
+
+    async def save():
+        persistence = SQLitePersistence(database)
+        await persistence.update_user_data(1, {"current_works": ["Навес"]})
+        await persistence.update_chat_data(-5, {"page": 2})
+        await persistence.update_bot_data({"version": 3})
+        await persistence.update_conversation("main_conversation", (1, 1), 4)
+        await persistence.flush()
+
+    async def load():
+        persistence = SQLitePersistence(database)
+        return (
+            await persistence.get_user_data(),
+            await persistence.get_chat_data(),
+            await persistence.get_bot_data(),
+            await persistence.get_conversations("main_conversation"),
+        )
+
+    asyncio.run(save())
+    user_data, chat_data, bot_data, conversations = asyncio.run(load())
+    assert user_data == {1: {"current_works": ["Навес"]}}
+    assert chat_data == {-5: {"page": 2}}
+    assert bot_data == {"version": 3}
+    assert conversations == {(1, 1): 4}
+
+
+def test_only_changed_rows_are_written(tmp_path):
+    database = RecordingDatabase(str(tmp_path / "persistence.db"))
+
+    async def run():
+        persistence = SQLitePersistence(database)
+        await persistence.update_user_data(1, {"step": 1})
+        await persistence.update_user_data(2, {"step": 1})
+        await persistence.flush()
+
+        # Application передает все затронутые ключи, но данные изменились только у второго
+        await persistence.update_user_data(1, {"step": 1})
+        await persistence.update_user_data(2, {"step": 2})
+        await persistence.flush()
+
+        # Ничего не изменилось - записи нет
+        await persistence.update_user_data(1, {"step": 1})
+        await persistence.update_user_data(2, {"step": 2})
+        await persistence.flush()
+
+        await persistence.drop_user_data(1)
+        await persistence.flush()
+
+    asyncio.run(run())
+    assert database.saves == [
+        ([("user", "1"), ("user", "2")], []),
+        ([("user", "2")], []),
+        ([], [("user", "1")]),
+    ]
+    assert dict(database.load_persisted("user")).keys() == {"2"}
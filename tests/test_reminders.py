@@ -0,0 +1,47 @@
+import asyncio
+import datetime as dt
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import handlers
+from database import AsyncSQLiteDatabase, SQLiteDatabase
+
+TIMEZONE = "Europe/Moscow"
+
+
+class StubJob:
+    def __init__(self, reminder_time: str):
+        self.data = (TIMEZONE, reminder_time)
+        self.removed = False
+
+    def schedule_removal(self):
+        self.removed = True
+
+
+def dispatch(job: StubJob):
+    asyncio.run(handlers.dispatch_reminders(SimpleNamespace(job=job, bot=None)))
+
+
+def test_empty_bucket_job_is_removed(tmp_path, monkeypatch):
+    database = SQLiteDatabase(str(tmp_path / "reminders.db"))
+    monkeypatch.setattr(handlers, "db", AsyncSQLiteDatabase(database))
+    database.set_reminder_schedule("1", 1, TIMEZONE, "09:00")
+    # Единственный подписчик группы 09:00 перешел на другое время
+    database.set_reminder_schedule("1", 1, TIMEZONE, "10:00")
+
+    job = StubJob("09:00")
+    dispatch(job)
+    assert job.removed
+
+
+def test_bucket_with_subscribers_is_kept_without_recipients(tmp_path, monkeypatch):
+    database = SQLiteDatabase(str(tmp_path / "reminders.db"))
+    monkeypatch.setattr(handlers, "db", AsyncSQLiteDatabase(database))
+    database.set_reminder_schedule("1", 1, TIMEZONE, "09:00")
+    # Записи за сегодня уже есть - напоминать некому, но подписка осталась
+    today = dt.datetime.now(ZoneInfo(TIMEZONE)).strftime("%d.%m.%Y")
+    database.add_entry("1", {"date": today, "works": ["Навес"]})
+
+    job = StubJob("09:00")
+    dispatch(job)
+    assert not job.removed
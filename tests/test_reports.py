@@ -0,0 +1,80 @@
+import asyncio
+import io
+import json
+import time
+from types import SimpleNamespace
+
+import openpyxl
+from telegram import Bot, Update
+from telegram.request import BaseRequest
+
+import handlers
+from database import AsyncSQLiteDatabase, SQLiteDatabase
+
+USER_ID = 42
+
+
+class UploadRecorder(BaseRequest):
+    """Заглушка Bot API: сохраняет загруженные документы (имя файла, содержимое)"""
+    def __init__(self):
+        self.documents = []
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Test", "username": "test_bot"}
+        else:
+            result = {"message_id": 1, "date": int(time.time()), "chat": {"id": USER_ID, "type": "private"}}
+            if api_method == "sendDocument":
+                filename, content, _ = request_data.multipart_data["document"]
+                # Файл передается потоком: читаем его, пока send_report держит его открытым
+                data = content if isinstance(content, bytes) else content.read()
+                self.documents.append((filename, data))
+                result["document"] = {"file_id": "file-1", "file_unique_id": "u-1"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def test_send_report_uploads_generated_workbook(tmp_path, monkeypatch):
+    database = SQLiteDatabase(str(tmp_path / "reports.db"))
+    database.add_entry(str(USER_ID), {
+        "date": "05.03.2026", "works": ["Навес (x2)", "Гидрофобное"], "address": "ул. Мира, 3",
+    })
+    monkeypatch.setattr(handlers, "db", AsyncSQLiteDatabase(database))
+    monkeypatch.setattr(handlers, "report_cache", type(handlers.report_cache)())
+
+    async def run():
+        api = UploadRecorder()
+        bot = Bot("1:test", request=api, get_updates_request=UploadRecorder())
+        async with bot:
+            update = Update.de_json({
+                "update_id": 1,
+                "message": {
+                    "message_id": 1, "date": int(time.time()), "text": "Вся история",
+                    "chat": {"id": USER_ID, "type": "private"},
+                    "from": {"id": USER_ID, "is_bot": False, "first_name": "Иван"},
+                },
+            }, bot)
+            state = await handlers.send_report(update, SimpleNamespace(), None, "все", "всё время")
+        return api, state
+
+    api, state = asyncio.run(run())
+    assert state == handlers.States.SELECTING_WORK
+    assert len(api.documents) == 1
+    filename, data = api.documents[0]
+    assert filename.endswith(".xlsx") and "Иван" in filename
+
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    cells = [cell for sheet in workbook for row in sheet.iter_rows(values_only=True) for cell in row]
+    assert "05.03.2026" in cells
+    assert "ул. Мира, 3" in cells
@@ -0,0 +1,70 @@
+import os
+import signal
+import time
+
+from sharding import WorkerPool
+
+
+def echo_worker(index, workers, inbox, acks):
+    """Обработчик для тестов: пересылает обновления в results и подтверждает их.
+    Обновление с marker подтверждается только после перезапуска (маркер уже создан)"""
+    while True:
+        data = inbox.get()
+        if data is None:
+            return
+        marker = data.get("marker")
+        if marker and not os.path.exists(marker):
+            open(marker, "w").close()
+            continue
+        data["results"].put((os.getpid(), data["update_id"]))
+        acks.put(data["update_id"])
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def all_acked(pool):
+    pool.collect_acks()
+    return not pool.pending[0]
+
+
+def test_killed_worker_is_restarted_and_gets_unacked_updates(tmp_path):
+    pool = WorkerPool(echo_worker, 1)
+    with pool.context.Manager() as manager:
+        results = manager.Queue()
+        pool.start()
+        try:
+            check_restart(pool, results, tmp_path)
+        finally:
+            pool.stop(timeout=30)
+        assert not pool.processes[0].is_alive()
+        assert results.empty()
+
+
+def check_restart(pool, results, tmp_path):
+    pool.send(0, 1, {"update_id": 1, "results": results})
+    first_pid, update_id = results.get(timeout=30)
+    assert update_id == 1
+    assert wait_for(lambda: all_acked(pool))
+
+    # Обновление получено, но не обработано: процесс убит, пока ждет следующее
+    marker = tmp_path / "seen"
+    pool.send(0, 2, {"update_id": 2, "results": results, "marker": str(marker)})
+    assert wait_for(marker.exists)
+    os.kill(first_pid, signal.SIGKILL)
+    pool.processes[0].join(timeout=30)
+
+    pool.check()
+    assert pool.processes[0].is_alive()
+    pool.send(0, 3, {"update_id": 3, "results": results})
+
+    received = [results.get(timeout=30), results.get(timeout=30)]
+    assert [update_id for _, update_id in received] == [2, 3]
+    assert all(pid != first_pid for pid, _ in received)
+    assert wait_for(lambda: all_acked(pool))
@@ -0,0 +1,56 @@
+import gzip
+import sqlite3
+from contextlib import closing
+
+import snapshots
+
+
+class WritingSource:
+    """Источник бэкапа, в который между порциями копирования пишет другое соединение"""
+    def __init__(self, conn, writer):
+        self.conn = conn
+        self.writer = writer
+        self.steps = 0
+
+    def backup(self, target, pages=-1, progress=None, sleep=0.25):
+        if progress is None:
+            return self.conn.backup(target, pages=pages)
+
+        def write_between_steps(status, remaining, total):
+            self.steps += 1
+            self.writer.execute("INSERT INTO t VALUES (1)")
+            progress(status, remaining, total)
+        return self.conn.backup(target, pages=pages, progress=write_between_steps, sleep=0)
+
+
+def test_backup_falls_back_to_one_step_when_writes_keep_restarting_it(tmp_path):
+    path = str(tmp_path / "bot.db")
+    with closing(sqlite3.connect(path, isolation_level=None)) as writer:
+        writer.execute("PRAGMA journal_mode = WAL")
+        writer.execute("CREATE TABLE t (x)")
+        writer.executemany("INSERT INTO t VALUES (?)", [(b"x" * 1000,)] * 2000)
+
+        with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn, \
+                closing(sqlite3.connect(str(tmp_path / "copy.db"))) as dst:
+            source = WritingSource(conn, writer)
+            snapshots._backup(source, dst, pages=100, sleep=0)
+            copied = dst.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+    # Без ограничения копирование начиналось бы заново после каждой записи
+    assert source.steps == snapshots.MAX_BACKUP_RESTARTS + 2
+    assert copied == 2000 + source.steps
+
+
+def test_create_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "bot.db")
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("CREATE TABLE t (x)")
+        conn.execute("INSERT INTO t VALUES (42)")
+        conn.commit()
+
+    snapshot = snapshots.create_snapshot(path, str(tmp_path / "snapshots"), pages=1, sleep=0)
+    restored = str(tmp_path / "restored.db")
+    with gzip.open(snapshot, "rb") as f_in, open(restored, "wb") as f_out:
+        f_out.write(f_in.read())
+    with closing(sqlite3.connect(restored)) as conn:
+        assert conn.execute("SELECT x FROM t").fetchall() == [(42,)]
@@ -0,0 +1,83 @@
+import asyncio
+import datetime as dt
+import inspect
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import UserLaneUpdateProcessor
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=dt.datetime.now(dt.timezone.utc),
+        chat=Chat(user_id, Chat.PRIVATE),
+        from_user=User(user_id, f"User{user_id}", False),
+        text=str(update_id),
+    )
+    return Update(update_id, message=message)
+
+
+def test_updates_of_one_user_run_in_order():
+    processor = UserLaneUpdateProcessor(8)
+    done = []
+
+    async def handle(update_id, delay):
+        await asyncio.sleep(delay)
+        done.append(update_id)
+
+    async def run():
+        # Первое обновление самое медленное: без полосы остальные закончились бы раньше
+        await asyncio.gather(*(
+            processor.process_update(make_update(update_id, 1), handle(update_id, delay))
+            for update_id, delay in ((1, 0.05), (2, 0.01), (3, 0))
+        ))
+
+    asyncio.run(run())
+    assert done == [1, 2, 3]
+
+
+def test_different_users_run_concurrently():
+    processor = UserLaneUpdateProcessor(8)
+    second_started = None
+
+    async def first():
+        # Завершится, только если обновление второго пользователя выполняется параллельно
+        await asyncio.wait_for(second_started.wait(), timeout=5)
+
+    async def second():
+        second_started.set()
+
+    async def run():
+        nonlocal second_started
+        second_started = asyncio.Event()
+        await asyncio.gather(
+            processor.process_update(make_update(1, 1), first()),
+            processor.process_update(make_update(2, 2), second()),
+        )
+
+    asyncio.run(run())
+
+
+def test_cancelled_lane_closes_queued_updates():
+    processor = UserLaneUpdateProcessor(8)
+    queued = None
+
+    async def blocking():
+        await asyncio.sleep(60)
+
+    async def never_started():
+        pass
+
+    async def run():
+        nonlocal queued
+        owner = asyncio.create_task(processor.process_update(make_update(1, 1), blocking()))
+        await asyncio.sleep(0)
+        queued = never_started()
+        await processor.process_update(make_update(2, 1), queued)
+        owner.cancel()
+        await asyncio.gather(owner, return_exceptions=True)
+
+    asyncio.run(run())
+    assert inspect.getcoroutinestate(queued) == inspect.CORO_CLOSED
+    assert processor._lanes == {}
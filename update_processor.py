@@ -0,0 +1,65 @@
+import logging
+from collections import deque
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class UserLaneUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных пользователей со строгим порядком
+    внутри одного пользователя.
+
+    У каждого активного пользователя своя очередь (полоса). Первое обновление
+    занимает полосу и выполняет все, что пришло за ним, в порядке поступления;
+    остальные обновления этого пользователя только встают в очередь и сразу
+    освобождают место. Поэтому один пользователь занимает не больше одного из
+    max_concurrent_updates мест, а ConversationHandler и user_data никогда не
+    обрабатываются для него одновременно.
+    """
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._lanes = {}  # ключ полосы -> очередь ожидающих корутин
+
+    @staticmethod
+    def lane_key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+        return None
+
+    async def _run(self, coroutine):
+        try:
+            await coroutine
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления: {e}", exc_info=True)
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = self.lane_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        pending = self._lanes.get(key)
+        if pending is not None:
+            # Полоса занята: обновление выполнит ее владелец после предыдущих
+            pending.append(coroutine)
+            return
+
+        pending = self._lanes[key] = deque()
+        try:
+            await self._run(coroutine)
+            while pending:
+                await self._run(pending.popleft())
+        finally:
+            del self._lanes[key]
+            # Остаток бывает только при отмене задачи (остановка бота)
+            for leftover in pending:
+                leftover.close()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
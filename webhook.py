@@ -0,0 +1,236 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+from dotenv import load_dotenv
+from telegram import Update
+from telegram.error import TelegramError
+from config import (WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+IDLE_TIMEOUT = 75
+DRAIN_TIMEOUT = 30  # сек., ожидание разбора принятых обновлений при остановке
+
+def read_settings() -> dict:
+    """Настройки webhook из окружения (значения из config - по умолчанию); перечитываются при SIGHUP"""
+    return {
+        "url": os.getenv("WEBHOOK_URL", WEBHOOK_URL),
+        "listen": os.getenv("WEBHOOK_LISTEN", WEBHOOK_LISTEN),
+        "port": int(os.getenv("WEBHOOK_PORT", str(WEBHOOK_PORT))),
+        "path": os.getenv("WEBHOOK_PATH", WEBHOOK_PATH),
+        "secret": os.getenv("WEBHOOK_SECRET", WEBHOOK_SECRET),
+        # Без обработчиков принятые обновления никто не разберет, а остановка зависнет
+        "workers": max(1, int(os.getenv("WEBHOOK_WORKERS", str(WEBHOOK_WORKERS)))),
+    }
+
+class WebhookServer:
+    """Прием обновлений от Telegram по HTTP без сторонних веб-фреймворков.
+
+    Запрос проверяется по пути и секретному токену и сразу подтверждается:
+    тело попадает в ограниченную очередь, из которой workers задач разбирают
+    JSON и передают обновления в application.update_queue. Переполнение
+    очереди отвечает 503 - Telegram повторит доставку позже.
+    """
+    def __init__(self, application, settings: dict, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        self.application = application
+        self.settings = settings
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.server = None
+        self.workers = []
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.settings["listen"], self.settings["port"])
+        self._resize_workers(self.settings["workers"])
+        logger.info(f"Webhook слушает {self.settings['listen']}:{self.settings['port']}{self.settings['path']}")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        # Принятые, но еще не разобранные обновления дообрабатываются
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Не разобрано обновлений при остановке webhook: {self.queue.qsize()}")
+        self._resize_workers(0)
+
+    async def register(self, drop_pending_updates: bool = True, settings: dict = None):
+        """Регистрация webhook в Telegram (по умолчанию - с текущими настройками)"""
+        settings = settings or self.settings
+        await self.application.bot.set_webhook(
+            url=settings["url"],
+            secret_token=settings["secret"] or None,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=drop_pending_updates
+        )
+
+    async def reload(self) -> bool:
+        """Плавная перезагрузка настроек: новый сокет открывается до закрытия старого,
+        принятые обновления не теряются. Новые настройки применяются, только если
+        удалось открыть сокет и зарегистрировать webhook; иначе остаются прежние"""
+        new_server = None
+        try:
+            load_dotenv(override=True)
+            settings = read_settings()
+            old = self.settings
+            if (settings["listen"], settings["port"]) != (old["listen"], old["port"]):
+                new_server = await asyncio.start_server(self._handle_connection, settings["listen"], settings["port"])
+            if (settings["url"], settings["secret"]) != (old["url"], old["secret"]):
+                await self.register(drop_pending_updates=False, settings=settings)
+        except Exception as e:
+            if new_server:
+                new_server.close()
+                await new_server.wait_closed()
+            logger.error(f"Ошибка перезагрузки настроек webhook, оставлены прежние: {e}", exc_info=True)
+            return False
+
+        self.settings = settings
+        if new_server:
+            old_server, self.server = self.server, new_server
+            old_server.close()
+            await old_server.wait_closed()
+        self._resize_workers(settings["workers"])
+        logger.info(f"Настройки webhook перезагружены: {settings['listen']}:{settings['port']}, "
+                    f"обработчиков {settings['workers']}")
+        return True
+
+    def _resize_workers(self, count: int):
+        count = max(count, 0)  # 0 - только при остановке
+        while len(self.workers) < count:
+            self.workers.append(asyncio.create_task(self._worker()))
+        while len(self.workers) > count:
+            self.workers.pop().cancel()
+
+    async def _worker(self):
+        while True:
+            body = await self.queue.get()
+            try:
+                update = Update.de_json(json.loads(body), self.application.bot)
+                # Очередь приложения не ограничена, put не уступает управление: порядок
+                # обновлений сохраняется при любом числе обработчиков
+                await self.application.update_queue.put(update)
+            except Exception as e:
+                logger.error(f"Некорректное обновление в webhook: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _check_request(self, method: str, path: str, headers: dict, length: int) -> str:
+        if path.split("?")[0] != self.settings["path"]:
+            return "404 Not Found"
+        if method != "POST":
+            return "405 Method Not Allowed"
+        secret = self.settings["secret"]
+        if secret and not hmac.compare_digest(headers.get("x-telegram-bot-api-secret-token", ""), secret):
+            return "403 Forbidden"
+        if length > MAX_BODY_SIZE:
+            return "413 Payload Too Large"
+        return None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Telegram держит соединения открытыми, поэтому запросы читаются в цикле
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=IDLE_TIMEOUT)
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) < 2:
+                    break
+
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=IDLE_TIMEOUT)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", "0") or 0)
+                status = self._check_request(parts[0], parts[1], headers, length)
+                if status is None:
+                    body = await asyncio.wait_for(reader.readexactly(length), timeout=IDLE_TIMEOUT)
+                    try:
+                        self.queue.put_nowait(body)
+                        self.received += 1
+                        status = "200 OK"
+                    except asyncio.QueueFull:
+                        self.rejected += 1
+                        status = "503 Service Unavailable"
+                else:
+                    self.rejected += 1
+                    if status == "413 Payload Too Large":
+                        writer.write(self._response(status, keep_alive=False))
+                        await writer.drain()
+                        break
+                    await asyncio.wait_for(reader.readexactly(length), timeout=IDLE_TIMEOUT)
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(self._response(status, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _response(status: str, keep_alive: bool) -> bytes:
+        return (
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("latin-1")
+
+async def run_webhook(application, settings: dict = None):
+    """Работа бота в режиме webhook до SIGINT/SIGTERM; SIGHUP перечитывает настройки.
+
+    Ошибки запуска (порт занят, Telegram отклонил setWebhook) пробрасываются
+    наружу, чтобы вызывающий код мог перейти на long polling.
+    """
+    settings = settings or read_settings()
+    stop_event = asyncio.Event()
+
+    async with application:
+        server = WebhookServer(application, settings)
+        await server.start()
+        try:
+            await server.register()
+        except TelegramError:
+            await server.stop()
+            raise
+
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        loop = asyncio.get_running_loop()
+        # Ссылки на задачи перезагрузки: цикл событий хранит задачи только слабыми ссылками
+        reloads = set()
+
+        def schedule_reload():
+            task = loop.create_task(server.reload())
+            reloads.add(task)
+            task.add_done_callback(reloads.discard)
+
+        try:
+            loop.add_signal_handler(signal.SIGINT, stop_event.set)
+            loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+            loop.add_signal_handler(signal.SIGHUP, schedule_reload)
+        except (NotImplementedError, AttributeError):
+            # Windows: сигналов нет, остановка по Ctrl+C через KeyboardInterrupt
+            pass
+
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("Остановка webhook")
+            await server.stop()
+            await application.stop()